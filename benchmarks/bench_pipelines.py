@@ -0,0 +1,234 @@
+"""
+End to end benchmark of the provider, lookup and maintainer pipelines, run against a local fake of the foursquare api
+and an in memory storage client.
+
+Reports the throughput, the median and 99th percentile latency, and the number of foursquare api calls made per venue
+for each pipeline.
+
+Usage: python -m benchmarks.bench_pipelines [--venues 200] [--latency 0.05] [--quota 5000] [--pipeline lookup]
+
+The responses of a run can be recorded with --transport record --archive responses.db, and later runs can replay them
+with --transport replay, in which case the fake api is not called.
+"""
+import argparse
+import threading
+import time
+
+from rhobot.components.configuration import BotConfiguration
+from rhobot.components.storage import StoragePayload
+from rhobot.namespace import WGS_84
+from rdflib.namespace import RDFS
+
+from benchmarks.harness import Scheduler, FakeBot, FakeStorage, FakeConfiguration, FakeFoursquareServer
+from foursquare_bot.components.configuration_enums import IDENTIFIER_KEY, CLIENT_SECRET_KEY, VENUE_CACHE_PATH_KEY, \
+    WORK_QUEUE_PATH_KEY, FRESHNESS_PATH_KEY, FOURSQUARE_TRANSPORT_KEY, RESPONSE_ARCHIVE_PATH_KEY, \
+    REPLAY_LATENCY_SCALE_KEY
+from foursquare_bot.components.foursquare_lookup import FoursquareLookup
+from foursquare_bot.components.foursquare_metrics import FoursquareMetrics
+from foursquare_bot.components.knowledge_provider import KnowledgeProvider
+from foursquare_bot.components.maintainer import KnowledgeMaintainer
+from foursquare_bot.components.request_scheduler import PROVIDER
+from foursquare_bot.components.response_archive import TRANSPORTS, LIVE
+
+PIPELINES = ('provider', 'lookup', 'maintainer')
+
+
+def percentile(values, fraction):
+    """
+    Nearest rank percentile of a list of values.
+    """
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def venue_id(index):
+    return '4be0b4f0652b0f475f6%05d' % index
+
+
+def create_bot(server, storage_latency, transport=LIVE, archive='benchmark_responses.db', latency_scale=1.0):
+    """
+    Create the plugins under test, wired to the fakes.
+    :return: tuple of the bot, scheduler and storage.
+    """
+    scheduler = Scheduler()
+    storage = FakeStorage(scheduler, latency=storage_latency)
+    configuration = FakeConfiguration({IDENTIFIER_KEY: 'benchmark', CLIENT_SECRET_KEY: 'benchmark',
+                                       VENUE_CACHE_PATH_KEY: ':memory:', WORK_QUEUE_PATH_KEY: ':memory:',
+                                       FRESHNESS_PATH_KEY: ':memory:', FOURSQUARE_TRANSPORT_KEY: transport,
+                                       RESPONSE_ARCHIVE_PATH_KEY: archive, REPLAY_LATENCY_SCALE_KEY: latency_scale})
+
+    bot = FakeBot(scheduler, storage, configuration)
+    plugins = [bot.register(plugin_class) for plugin_class in (FoursquareMetrics, FoursquareLookup,
+                                                               KnowledgeProvider, KnowledgeMaintainer)]
+    for plugin in plugins:
+        plugin.post_init()
+
+    return bot, scheduler, storage
+
+
+def drive(operations, concurrency, timeout):
+    """
+    Run the operations, keeping concurrency of them in flight, and record the latency of each of them.
+    :param operations: list of callables returning a promise.
+    :param concurrency: number of operations in flight at the same time.
+    :param timeout: maximum number of seconds to wait for all of the operations.
+    :return: tuple of the elapsed time, latencies and the number of failures.
+    """
+    operations = list(operations)
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    finished = threading.Event()
+    state = dict(pending=len(operations))
+
+    def start_next():
+        with lock:
+            if not operations:
+                return
+            operation = operations.pop(0)
+
+        started = time.time()
+        operation().then(lambda result: done(started), lambda error: done(started, error))
+
+    def done(started, error=None):
+        with lock:
+            latencies.append(time.time() - started)
+            if error is not None:
+                failures.append(error)
+            state['pending'] -= 1
+            if not state['pending']:
+                finished.set()
+        start_next()
+
+    start = time.time()
+    for _ in range(concurrency):
+        start_next()
+    finished.wait(timeout)
+
+    return time.time() - start, latencies, len(failures)
+
+
+def bench_provider(bot, storage, server, venues, concurrency, timeout):
+    """
+    Requests for venues that are already in storage, with the popular venues requested more often.
+    """
+    for index in range(venues):
+        storage.add_venue_node(venue_id(index), populated=True)
+
+    provider = bot['knowledge_provider']
+
+    def request(index):
+        def operation():
+            payload = StoragePayload()
+            payload.add_type(WGS_84.SpatialThing)
+            payload.add_property(RDFS.seeAlso, 'foursquare://venues/%s' % venue_id(index))
+            return provider._rdf_request_message(dict(form=payload.populate_payload()))
+        return operation
+
+    requests = [request((index * index) % venues) for index in range(venues * 5)]
+    return drive(requests, concurrency, timeout) + (venues, )
+
+
+def bench_lookup(bot, storage, server, venues, concurrency, timeout):
+    """
+    Lookups of new venue nodes, as requested by the provider when a node is created.
+    """
+    lookup = bot['foursquare_lookup']
+    nodes = [(storage.add_venue_node(venue_id(index)), venue_id(index)) for index in range(venues)]
+
+    def request(node_uri, identifier):
+        return lambda: lookup.lookup_foursquare_content(node_uri, 'foursquare://venues/%s' % identifier,
+                                                        priority=PROVIDER, create=True)
+
+    return drive([request(node_uri, identifier) for node_uri, identifier in nodes], concurrency, timeout) + (venues, )
+
+
+def bench_maintainer(bot, storage, server, venues, concurrency, timeout):
+    """
+    Population of a backlog of unpopulated venue nodes by the maintainer.
+    """
+    for index in range(venues):
+        storage.add_venue_node(venue_id(index))
+
+    maintainer = bot['knowledge_maintainer']
+    maintainer.work_to_do_delay = 0.0
+    maintainer.max_concurrent_lookups = concurrency
+
+    start = time.time()
+    bot.event(BotConfiguration.CONFIGURATION_RECEIVED_EVENT)
+
+    while len(storage.updates) < venues and time.time() - start < timeout:
+        time.sleep(0.05)
+
+    elapsed = time.time() - start
+    latencies = [storage.updates[node_uri] - storage.listed[node_uri] for node_uri in storage.updates]
+
+    return elapsed, latencies, venues - len(storage.updates), venues
+
+
+def run(pipeline, venues=200, latency=0.05, quota=5000, storage_latency=0.002, concurrency=20, timeout=120.0,
+        transport=LIVE, archive='benchmark_responses.db', latency_scale=1.0):
+    """
+    Run a single pipeline against a fresh bot and fake foursquare server.
+    :return: dictionary of the measurements.
+    """
+    server = FakeFoursquareServer(latency=latency, hourly_quota=quota)
+    server.start()
+    bot, scheduler, storage = create_bot(server, storage_latency, transport, archive, latency_scale)
+
+    try:
+        if pipeline != 'maintainer':
+            bot.event(BotConfiguration.CONFIGURATION_RECEIVED_EVENT)
+
+        benchmark = globals()['bench_%s' % pipeline]
+        elapsed, latencies, failures, venue_count = benchmark(bot, storage, server, venues, concurrency, timeout)
+    finally:
+        scheduler.stop()
+        server.stop()
+
+    return dict(pipeline=pipeline,
+                requests=len(latencies),
+                failures=failures,
+                requests_per_second=len(latencies) / elapsed if elapsed else 0.0,
+                p50=percentile(latencies, 0.5) * 1000.0,
+                p99=percentile(latencies, 0.99) * 1000.0,
+                api_calls=server.calls,
+                api_calls_per_venue=float(server.calls) / venue_count,
+                quota_errors=server.quota_errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the foursquare bot pipelines.')
+    parser.add_argument('--pipeline', choices=PIPELINES, action='append',
+                        help='pipeline to run, can be repeated (default: all)')
+    parser.add_argument('--venues', type=int, default=200, help='number of venues')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds of foursquare api latency')
+    parser.add_argument('--quota', type=int, default=5000, help='foursquare requests allowed before quota errors')
+    parser.add_argument('--storage-latency', type=float, default=0.002, help='seconds of storage latency')
+    parser.add_argument('--concurrency', type=int, default=20, help='requests in flight at the same time')
+    parser.add_argument('--timeout', type=float, default=120.0, help='maximum seconds per pipeline')
+    parser.add_argument('--transport', choices=TRANSPORTS, default=LIVE,
+                        help='call the fake api, record its responses, or replay recorded responses')
+    parser.add_argument('--archive', default='benchmark_responses.db', help='path to the response archive')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='multiplier of the recorded latency of replayed responses')
+    arguments = parser.parse_args()
+
+    print '%-12s %8s %8s %10s %10s %10s %10s %12s' % ('pipeline', 'requests', 'failed', 'req/s', 'p50 ms',
+                                                      'p99 ms', 'api calls', 'calls/venue')
+
+    for pipeline in arguments.pipeline or PIPELINES:
+        result = run(pipeline, venues=arguments.venues, latency=arguments.latency, quota=arguments.quota,
+                     storage_latency=arguments.storage_latency, concurrency=arguments.concurrency,
+                     timeout=arguments.timeout, transport=arguments.transport, archive=arguments.archive,
+                     latency_scale=arguments.latency_scale)
+
+        print '%(pipeline)-12s %(requests)8d %(failures)8d %(requests_per_second)10.1f %(p50)10.1f %(p99)10.1f ' \
+              '%(api_calls)10d %(api_calls_per_venue)12.2f' % result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Micro benchmark of the venue identifier extraction, comparing the precompiled and memoized extractor against parsing
+every url with urlparse.
+
+Usage: python -m benchmarks.bench_utilities [number of see also values]
+"""
+import sys
+import timeit
+import urlparse
+
+from foursquare_bot.components import utilities
+
+
+def parse_venue(url):
+    """
+    The original implementation of get_foursquare_venue_from_url.
+    """
+    venue = None
+    url_components = urlparse.urlparse(url)
+
+    if url_components.scheme == 'foursquare' and url_components.netloc == 'venues':
+        venue = url_components.path.split('/')[1]
+
+    return venue
+
+
+def create_urls(count):
+    """
+    Create a list of see also values, one in four of them referencing a foursquare venue, with each venue repeated a
+    few times as happens with popular venues.
+    """
+    urls = []
+    for index in xrange(count):
+        if index % 4:
+            urls.append('http://dbpedia.org/resource/Place_%s' % (index % 500))
+        else:
+            urls.append('foursquare://venues/4be0b4f0652b0f475f6%05d' % (index % 1000))
+
+    return urls
+
+
+def main(count=100000, repeat=5):
+    urls = create_urls(count)
+
+    baseline = min(timeit.repeat(lambda: [parse_venue(url) for url in urls], number=1, repeat=repeat))
+    fast_path = min(timeit.repeat(lambda: [utilities.get_foursquare_venue_from_url(url) for url in urls],
+                                  number=1, repeat=repeat))
+
+    assert [parse_venue(url) for url in urls] == [utilities.get_foursquare_venue_from_url(url) for url in urls]
+
+    print 'see also values: %s' % count
+    print 'urlparse:        %.4fs (%.2fus per url)' % (baseline, baseline / count * 1e6)
+    print 'fast path:       %.4fs (%.2fus per url)' % (fast_path, fast_path / count * 1e6)
+    print 'speed up:        %.1fx' % (baseline / fast_path)
+
+
+if __name__ == '__main__':
+    main(*[int(argument) for argument in sys.argv[1:2]])
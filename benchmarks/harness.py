@@ -0,0 +1,415 @@
+"""
+Stand-ins for the services the foursquare bot talks to, so that the bot pipelines can be measured without a server,
+storage bot or foursquare account.
+
+The plugins under test are the real plugins, wired to:
+    FakeFoursquareServer - local http server that answers the venues, multi and search endpoints with configurable
+                           latency and hourly quota.
+    Scheduler / Promise  - single threaded task scheduler with the same interface as rho_bot_scheduler.
+    FakeStorage          - in memory storage client with configurable latency.
+    FakeBot              - the xmpp object that the plugins are registered with.
+"""
+import BaseHTTPServer
+import heapq
+import itertools
+import json
+import re
+import threading
+import time
+import urlparse
+
+import foursquare
+
+from rhobot.components.storage.namespace import NEO4J
+from rhobot.namespace import SCHEMA
+from foursquare_bot.components.utilities import SEE_ALSO
+
+
+class Promise(object):
+    """
+    Minimal promise with the interface used by the bot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._value = None
+        self._handlers = []
+
+    def then(self, resolved=None, rejected=None):
+        promise = Promise()
+
+        with self._lock:
+            if self._state is None:
+                self._handlers.append((resolved, rejected, promise))
+                return promise
+
+        self._fire(resolved, rejected, promise)
+        return promise
+
+    def resolved(self, value):
+        if isinstance(value, Promise):
+            value.then(self.resolved, self.rejected)
+        else:
+            self._settle('resolved', value)
+
+    def rejected(self, reason):
+        self._settle('rejected', reason)
+
+    def _settle(self, state, value):
+        with self._lock:
+            if self._state is not None:
+                return
+            self._state = state
+            self._value = value
+            handlers, self._handlers = self._handlers, []
+
+        for resolved, rejected, promise in handlers:
+            self._fire(resolved, rejected, promise)
+
+    def _fire(self, resolved, rejected, promise):
+        handler = resolved if self._state == 'resolved' else rejected
+
+        if handler is None:
+            if self._state == 'resolved':
+                promise.resolved(self._value)
+            else:
+                promise.rejected(self._value)
+            return
+
+        try:
+            promise.resolved(handler(self._value))
+        except Exception as e:
+            promise.rejected(e)
+
+
+class Scheduler(object):
+    """
+    Executes scheduled tasks on a single thread, in the same way as rho_bot_scheduler.
+    """
+
+    def __init__(self):
+        self._tasks = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='benchmark-scheduler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def promise(self):
+        return Promise()
+
+    def schedule_task(self, callback, delay=1.0, repeat=False):
+        with self._condition:
+            heapq.heappush(self._tasks, (time.time() + delay, next(self._sequence), callback,
+                                         delay if repeat else None))
+            self._condition.notify()
+
+    def defer(self, method, *args, **kwargs):
+        promise = Promise()
+
+        def execute():
+            try:
+                promise.resolved(method(*args, **kwargs))
+            except Exception as e:
+                promise.rejected(e)
+
+        self.schedule_task(execute, delay=0.0)
+        return promise
+
+    def generate_promise_handler(self, handler, *args, **kwargs):
+        def promise_handler(result):
+            return handler(result, *args, **kwargs)
+        return promise_handler
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and (not self._tasks or self._tasks[0][0] > time.time()):
+                    self._condition.wait(self._tasks[0][0] - time.time() if self._tasks else None)
+                if not self._running:
+                    return
+                _, _, callback, repeat = heapq.heappop(self._tasks)
+
+            if repeat is not None:
+                self.schedule_task(callback, delay=repeat, repeat=True)
+
+            try:
+                callback()
+            except Exception:
+                pass
+
+
+class FakeFoursquareServer(object):
+    """
+    Local stand in for api.foursquare.com.  Every venue identifier is a valid venue, placed on a grid around a city.
+    """
+
+    def __init__(self, latency=0.05, hourly_quota=5000):
+        """
+        :param latency: seconds added to every response.
+        :param hourly_quota: number of requests answered before rate limit errors are returned.
+        """
+        self.latency = latency
+        self.hourly_quota = hourly_quota
+        self.calls = 0
+        self.venue_requests = 0
+        self.quota_errors = 0
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-foursquare')
+        self._thread.daemon = True
+
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:%s/v2' % self._server.server_address[1]
+
+    def start(self):
+        """
+        Start the server, and point the foursquare library at it.
+        :return:
+        """
+        self._previous_endpoint = foursquare.API_ENDPOINT
+        foursquare.API_ENDPOINT = self.endpoint
+        self._thread.start()
+
+    def stop(self):
+        foursquare.API_ENDPOINT = self._previous_endpoint
+        self._server.shutdown()
+
+    @staticmethod
+    def venue(venue_id):
+        offset = sum(ord(character) for character in venue_id)
+        return dict(id=venue_id, name='Venue %s' % venue_id,
+                    location=dict(lat=40.7 + (offset % 100) / 1000.0, lng=-74.0 + (offset % 37) / 1000.0,
+                                  address='%s Broadway' % offset))
+
+    def handle(self, request):
+        time.sleep(self.latency)
+
+        url = urlparse.urlparse(request.path)
+        parameters = urlparse.parse_qs(url.query)
+        path = url.path[len('/v2'):]
+
+        with self._lock:
+            self.calls += 1
+            remaining = max(self.hourly_quota - self.calls, 0)
+            exhausted = self.calls > self.hourly_quota
+
+        if exhausted:
+            self.quota_errors += 1
+            body = dict(meta=dict(code=403, errorType='rate_limit_exceeded', errorDetail='Quota exceeded'))
+            return self._respond(request, 403, body, remaining)
+
+        if path == '/multi':
+            responses = []
+            for sub_request in parameters['requests'][0].split(','):
+                responses.append(dict(meta=dict(code=200), response=self._response(sub_request.split('?')[0])))
+            body = dict(meta=dict(code=200), response=dict(responses=responses))
+        else:
+            body = dict(meta=dict(code=200), response=self._response(path, parameters))
+
+        self._respond(request, 200, body, remaining)
+
+    def _response(self, path, parameters=None):
+        if path == '/venues/search':
+            query = (parameters or {}).get('query', ['venue'])[0]
+            return dict(venues=[self.venue('%s%s' % (query, index)) for index in range(10)])
+
+        self.venue_requests += 1
+        return dict(venue=self.venue(path.split('/')[-1]))
+
+    def _respond(self, request, status, body, remaining):
+        contents = json.dumps(body)
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(contents)))
+        request.send_header('X-RateLimit-Limit', str(self.hourly_quota))
+        request.send_header('X-RateLimit-Remaining', str(remaining))
+        request.end_headers()
+        request.wfile.write(contents)
+
+
+class FakeResult(object):
+
+    def __init__(self, about, properties=None, columns=None):
+        self.about = about
+        self.flags = dict()
+        self.properties = properties or dict()
+        self.columns = columns or dict()
+
+    def get_column(self, key):
+        return self.columns.get(key, None)
+
+
+class FakeResultCollection(object):
+
+    def __init__(self, results):
+        self.results = results
+
+
+class FakeStorage(object):
+    """
+    In memory storage client.  Nodes are foursquare venue nodes, keyed by their uri.
+    """
+    page_pattern = re.compile(r'id\(n\) > (-?\d+) .* LIMIT (\d+)')
+
+    def __init__(self, scheduler, latency=0.002):
+        self._scheduler = scheduler
+        self.latency = latency
+        self.nodes = dict()
+        self.listed = dict()
+        self.updates = dict()
+        self.requests = 0
+
+    @staticmethod
+    def node_id(node_uri):
+        return int(node_uri.rsplit('/', 1)[1])
+
+    def add_venue_node(self, venue_id, populated=False):
+        node_uri = 'http://localhost/node/%s' % (len(self.nodes) + 1)
+        properties = {SEE_ALSO: ['foursquare://venues/%s' % venue_id]}
+        if populated:
+            properties[str(SCHEMA.name)] = ['Venue %s' % venue_id]
+        self.nodes[node_uri] = properties
+        return node_uri
+
+    def _respond(self, value):
+        self.requests += 1
+        promise = self._scheduler.promise()
+        self._scheduler.schedule_task(lambda: promise.resolved(value), delay=self.latency)
+        return promise
+
+    def get_node(self, payload):
+        return self._respond(FakeResult(payload.about, properties=self.nodes[payload.about]))
+
+    def update_node(self, payload):
+        self.nodes[payload.about].update(payload.properties)
+        self.updates[payload.about] = time.time()
+        return self._respond(FakeResultCollection([FakeResult(payload.about)]))
+
+    def find_nodes(self, payload):
+        see_also = payload.properties.get(SEE_ALSO, [])
+        for node_uri, properties in self.nodes.items():
+            if set(see_also) & set(properties.get(SEE_ALSO, [])):
+                return self._respond(FakeResultCollection([FakeResult(node_uri)]))
+
+        return self._respond(FakeResultCollection([]))
+
+    def execute_cypher(self, payload):
+        query = payload.properties[str(NEO4J.cypher)][0]
+
+        # Only the maintainer scan of the unpopulated nodes is answered, the other queries find nothing.
+        if 'id(n) >' not in query or 'not(has(' not in query:
+            return self._respond(FakeResultCollection([]))
+
+        # Maintainer page of unpopulated nodes after the cursor.
+        cursor, limit = [int(value) for value in self.page_pattern.search(query).groups()]
+        results = []
+        for node_uri in sorted(self.nodes, key=self.node_id):
+            node_id = self.node_id(node_uri)
+            if node_id > cursor and str(SCHEMA.name) not in self.nodes[node_uri]:
+                results.append(FakeResult(node_uri, columns={str(NEO4J.id): node_id}))
+                self.listed.setdefault(node_uri, time.time())
+                if len(results) == limit:
+                    break
+
+        return self._respond(FakeResultCollection(results))
+
+
+class FakeRdfPublish(object):
+
+    def __init__(self):
+        self.request_handlers = []
+        self.search_handlers = []
+        self.published = 0
+
+    def add_request_handler(self, handler):
+        self.request_handlers.append(handler)
+
+    def add_search_handler(self, handler):
+        self.search_handlers.append(handler)
+
+    def create_rdf(self, mtype=None, payload=None, **kwargs):
+        return dict(mtype=mtype, payload=payload)
+
+    def publish_all_results(self, result, created=False):
+        self.published += 1
+
+
+class FakeConfiguration(object):
+
+    def __init__(self, values):
+        self.values = values
+
+    def get_value(self, key, default=None):
+        return self.values.get(key, default)
+
+    def get_configuration(self):
+        return self.values
+
+    def merge_configuration(self, values):
+        self.values.update(values)
+
+
+class FakeRepresentationManager(object):
+    representation_uri = 'http://localhost/bots/foursquare'
+
+
+class FakeApi(object):
+
+    def wrap(self, name):
+        return None
+
+
+class FakeBot(object):
+    """
+    The xmpp object that the plugins are registered with.
+    """
+
+    def __init__(self, scheduler, storage, configuration):
+        self.api = FakeApi()
+        self._handlers = dict()
+        self.plugins = {'rho_bot_scheduler': scheduler,
+                        'rho_bot_storage_client': storage,
+                        'rho_bot_rdf_publish': FakeRdfPublish(),
+                        'rho_bot_configuration': configuration,
+                        'rho_bot_representation_manager': FakeRepresentationManager()}
+
+    def __getitem__(self, name):
+        return self.plugins[name]
+
+    def register(self, plugin_class):
+        plugin = plugin_class(self)
+        plugin.plugin_init()
+        self.plugins[plugin.name] = plugin
+        return plugin
+
+    def add_event_handler(self, name, handler):
+        self._handlers.setdefault(name, []).append(handler)
+
+    def del_event_handler(self, name, handler):
+        if handler in self._handlers.get(name, []):
+            self._handlers[name].remove(handler)
+
+    def event(self, name, data=None):
+        for handler in list(self._handlers.get(name, [])):
+            handler(data)
@@ -2,6 +2,8 @@ from foursquare_bot.components.knowledge_provider import knowledge_provider
 from foursquare_bot.components.foursquare_lookup import foursquare_lookup
 from foursquare_bot.components.maintainer import knowledge_maintainer
 from foursquare_bot.components.search_handler import search_handler
+from foursquare_bot.components.foursquare_metrics import foursquare_metrics
+from foursquare_bot.components.venue_refresher import venue_refresher
 
 from sleekxmpp.plugins.base import register_plugin
 
@@ -15,3 +17,5 @@ def load_components():
     register_plugin(foursquare_lookup)
     register_plugin(knowledge_maintainer)
     register_plugin(search_handler)
+    register_plugin(foursquare_metrics)
+    register_plugin(venue_refresher)
@@ -0,0 +1,96 @@
+"""
+Micro batching of requests, so that requests made within a short window of each other are executed together.
+"""
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher(object):
+    """
+    Collects keys for a short window, or until the batch is full, and then hands them to an executor in a single call.
+    The executor returns a promise that is resolved with a list of results in the same order as the keys, results that
+    are exceptions reject the promise of that key.
+    """
+
+    def __init__(self, scheduler, executor, batch_size=5, window=0.25):
+        """
+        :param scheduler: rho_bot_scheduler used to create promises and schedule the window.
+        :param executor: method(keys, priority) returning a promise for the list of results.
+        :param batch_size: maximum number of keys in a batch.
+        :param window: number of seconds to wait for a batch to fill.
+        """
+        self._scheduler = scheduler
+        self._executor = executor
+        self.batch_size = batch_size
+        self.window = window
+
+        self._pending = OrderedDict()
+        self._priority = None
+        self._flush_scheduled = False
+
+        self.batches = 0
+        self.batched_keys = 0
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def submit(self, key, priority=0):
+        """
+        Add a key to the current batch.
+        :param key: key to fetch.
+        :param priority: priority of the request, the batch is executed with the highest priority of its keys.
+        :return: promise resolved with the result for the key.
+        """
+        promise = self._scheduler.promise()
+        self._pending.setdefault(key, []).append(promise)
+        self._priority = priority if self._priority is None else min(self._priority, priority)
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._scheduler.schedule_task(self._scheduled_flush, delay=self.window)
+
+        return promise
+
+    def flush(self):
+        """
+        Execute all of the pending keys.
+        :return:
+        """
+        while self._pending:
+            keys = list(self._pending.keys())[:self.batch_size]
+            promises = [self._pending.pop(key) for key in keys]
+            priority = self._priority
+
+            self.batches += 1
+            self.batched_keys += len(keys)
+
+            handler = self._scheduler.generate_promise_handler(self._resolve, promises)
+            error_handler = self._scheduler.generate_promise_handler(self._reject, promises)
+            self._executor(keys, priority).then(handler, error_handler)
+
+        self._priority = None
+
+    def _scheduled_flush(self):
+        self._flush_scheduled = False
+        self.flush()
+
+    @staticmethod
+    def _resolve(results, promises):
+        for index, waiting in enumerate(promises):
+            result = results[index] if index < len(results) else RuntimeError('No result in batch response')
+            for promise in waiting:
+                if isinstance(result, Exception):
+                    promise.rejected(result)
+                else:
+                    promise.resolved(result)
+
+    @staticmethod
+    def _reject(error, promises):
+        for waiting in promises:
+            for promise in waiting:
+                promise.rejected(error)
@@ -0,0 +1,221 @@
+"""
+Caches used to avoid repeating requests against the foursquare api and storage.
+"""
+from collections import OrderedDict
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache(object):
+    """
+    Bounded in memory cache that evicts the least recently used entries, and optionally expires entries after a time
+    to live.
+    """
+
+    def __init__(self, max_size=1000, ttl=None, clock=time.time):
+        """
+        :param max_size: maximum number of entries to store.
+        :param ttl: number of seconds an entry is valid for, None if entries never expire.
+        :param clock: time source.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key, default=None, count=True, stale=False):
+        """
+        Fetch an entry out of the cache.  Expired entries are kept until they are evicted, so that they can be served
+        when the value can not be fetched again.
+        :param key: key of the entry.
+        :param default: value returned if the entry is missing or expired.
+        :param count: whether the hit and miss counters should be updated.
+        :param stale: return the entry even if it has expired.
+        :return: cached value.
+        """
+        with self._lock:
+            entry = self._entries.get(key, None)
+
+            if entry is not None and not stale and self.ttl is not None and self._clock() - entry[0] > self.ttl:
+                entry = None
+
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return default
+
+            # Move the entry to the most recently used end.
+            del self._entries[key]
+            self._entries[key] = entry
+            if count:
+                self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, timestamp=None):
+        """
+        Store an entry in the cache, evicting the least recently used entries if the cache is full.
+        :param key: key of the entry.
+        :param value: value to store.
+        :param timestamp: time the value was created, defaults to now.
+        :return:
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (timestamp if timestamp is not None else self._clock(), value)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Remove an entry from the cache.
+        :param key: key of the entry.
+        :return:
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+
+class VenueCache(object):
+    """
+    Two tier cache of the venue details returned by foursquare, keyed by the venue identifier.  Details are kept in an
+    in memory LRU cache, which is backed by a sqlite database so that they survive restarts.
+    """
+
+    def __init__(self, path, ttl=604800.0, memory_size=1000, clock=time.time):
+        """
+        :param path: path to the sqlite database.
+        :param ttl: number of seconds the venue details are valid for.
+        :param memory_size: number of venues kept in memory.
+        :param clock: time source.
+        """
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._memory = LRUCache(max_size=memory_size, ttl=ttl, clock=clock)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS venues '
+                                 '(venue_id TEXT PRIMARY KEY, fetched REAL NOT NULL, details TEXT NOT NULL)')
+        self._connection.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, venue_id):
+        """
+        Fetch the details of a venue.
+        :param venue_id: venue identifier.
+        :return: the venue details, or None if they are not cached or have expired.
+        """
+        details = self._memory.get(venue_id)
+
+        if details is None:
+            with self._lock:
+                row = self._connection.execute('SELECT fetched, details FROM venues WHERE venue_id = ?',
+                                               (venue_id, )).fetchone()
+
+            if row and self._clock() - row[0] <= self.ttl:
+                details = json.loads(row[1])
+                self._memory.put(venue_id, details, timestamp=row[0])
+
+        if details is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return details
+
+    def put(self, venue_id, details):
+        """
+        Store the details of a venue.
+        :param venue_id: venue identifier.
+        :param details: venue details.
+        :return:
+        """
+        fetched = self._clock()
+        self._memory.put(venue_id, details, timestamp=fetched)
+
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO venues (venue_id, fetched, details) VALUES (?, ?, ?)',
+                                     (venue_id, fetched, json.dumps(details)))
+            self._connection.commit()
+
+    def add(self, venue_id, details):
+        """
+        Store the details of a venue only if there are no valid details for the venue in the cache.
+        :param venue_id: venue identifier.
+        :param details: venue details.
+        :return:
+        """
+        fetched = self._clock()
+
+        with self._lock:
+            cursor = self._connection.execute('INSERT OR REPLACE INTO venues (venue_id, fetched, details) '
+                                              'SELECT ?, ?, ? WHERE NOT EXISTS '
+                                              '(SELECT 1 FROM venues WHERE venue_id = ? AND fetched >= ?)',
+                                              (venue_id, fetched, json.dumps(details), venue_id, fetched - self.ttl))
+            self._connection.commit()
+
+        if cursor.rowcount == 1:
+            self._memory.put(venue_id, details, timestamp=fetched)
+
+    def invalidate(self, venue_id):
+        """
+        Remove the details of a venue so that they are fetched again.
+        :param venue_id: venue identifier.
+        :return:
+        """
+        self._memory.invalidate(venue_id)
+
+        with self._lock:
+            self._connection.execute('DELETE FROM venues WHERE venue_id = ?', (venue_id, ))
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def metrics(self):
+        """
+        Current state of the cache.
+        :return: dictionary of metric name to value.
+        """
+        return dict(hits=self.hits,
+                    misses=self.misses,
+                    hit_rate=self.hit_rate,
+                    memory_hits=self._memory.hits,
+                    memory_evictions=self._memory.evictions,
+                    memory_size=len(self._memory))
@@ -0,0 +1,160 @@
+"""
+Circuit breaker that stops requests from being sent to foursquare while it is failing or too slow to be useful.
+"""
+from collections import deque
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# States of the circuit.
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(RuntimeError):
+    """
+    Raised instead of making a request while the circuit is open.
+    """
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Tracks the outcome of the most recent requests, and opens the circuit when too many of them failed or took longer
+    than the latency threshold.  While the circuit is open requests fail straight away.  Once the open duration has
+    passed the circuit is half open, and a limited number of probe requests are let through: if they succeed the
+    circuit closes, otherwise it opens again for twice as long.
+    """
+
+    def __init__(self, window_size=20, minimum_requests=5, failure_rate=0.5, latency_threshold=10.0,
+                 open_duration=30.0, max_open_duration=600.0, probes=1, clock=time.time):
+        """
+        :param window_size: number of recent requests the failure rate is calculated over.
+        :param minimum_requests: number of requests needed in the window before the circuit can open.
+        :param failure_rate: fraction of failed requests in the window that opens the circuit.
+        :param latency_threshold: number of seconds after which a successful request is counted as a failure.
+        :param open_duration: number of seconds the circuit stays open before probing.
+        :param max_open_duration: maximum number of seconds the circuit stays open after repeated failed probes.
+        :param probes: number of probe requests allowed at the same time while half open.
+        :param clock: time source.
+        """
+        self.minimum_requests = minimum_requests
+        self.failure_rate = failure_rate
+        self.latency_threshold = latency_threshold
+        self.open_duration = open_duration
+        self.max_open_duration = max_open_duration
+        self.probes = probes
+        self._clock = clock
+
+        # Outcomes are recorded from the worker threads.
+        self._lock = threading.Lock()
+
+        self._outcomes = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened = None
+        self._current_open_duration = open_duration
+        self._probes_in_flight = 0
+
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def wait_time(self):
+        """
+        Number of seconds until requests will be let through again.
+        :return: seconds, 0.0 if a request would be allowed now.
+        """
+        with self._lock:
+            state = self._current_state()
+
+            if state == OPEN:
+                return max(self._opened + self._current_open_duration - self._clock(), 0.0)
+            if state == HALF_OPEN and self._probes_in_flight >= self.probes:
+                return self._current_open_duration
+
+            return 0.0
+
+    def allow(self):
+        """
+        Determine whether a request can be made, counting it as a probe when the circuit is half open.  Every allowed
+        request must have its outcome recorded with success or failure.
+        :return: True if the request can be made.
+        """
+        with self._lock:
+            state = self._current_state()
+
+            if state == CLOSED:
+                return True
+
+            if state == HALF_OPEN and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                return True
+
+            self.rejected += 1
+            return False
+
+    def success(self, latency=0.0):
+        """
+        Record a successful request.
+        :param latency: number of seconds the request took.
+        :return:
+        """
+        if latency > self.latency_threshold:
+            logger.debug('Counting slow foursquare request as a failure: %.1f seconds' % latency)
+            return self.failure()
+
+        with self._lock:
+            if self._state == HALF_OPEN:
+                logger.info('Foursquare requests are succeeding, closing the circuit')
+                self._state = CLOSED
+                self._probes_in_flight = 0
+                self._current_open_duration = self.open_duration
+                self._outcomes.clear()
+
+            self._outcomes.append(True)
+
+    def failure(self):
+        """
+        Record a failed request.
+        :return:
+        """
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                self._current_open_duration = min(self._current_open_duration * 2, self.max_open_duration)
+                self._open()
+                return
+
+            self._outcomes.append(False)
+
+            if self._state == CLOSED and len(self._outcomes) >= self.minimum_requests:
+                failures = self._outcomes.count(False)
+                if failures >= self.failure_rate * len(self._outcomes):
+                    self._open()
+
+    def _open(self):
+        self._state = OPEN
+        self._opened = self._clock()
+        self._outcomes.clear()
+        self.trips += 1
+
+        logger.warning('Foursquare requests are failing, opening the circuit for %.0f seconds' %
+                       self._current_open_duration)
+
+    def _current_state(self):
+        """
+        State of the circuit, an open circuit becomes half open once the open duration has passed.
+        :return:
+        """
+        if self._state == OPEN and self._clock() - self._opened >= self._current_open_duration:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+
+        return self._state
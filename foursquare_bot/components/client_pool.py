@@ -0,0 +1,328 @@
+"""
+Pool of foursquare clients, one for each set of client credentials, so that the request quota of several registered
+apps can be used by the bot.
+"""
+from foursquare_bot.components.foursquare_client import ClientNotConfigured
+from foursquare_bot.components.request_scheduler import QuotaExhausted
+import foursquare
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Errors that show the credentials of a client can not be used, rather than a problem with the request.
+CREDENTIAL_ERRORS = (foursquare.InvalidAuth, foursquare.NotAuthorized)
+
+
+def load_credentials(identifier, secret, additional=None):
+    """
+    Combine the primary client details with the additional credential sets of the configuration.
+    :param identifier: primary client identifier, or None.
+    :param secret: primary client secret, or None.
+    :param additional: json list of dictionaries containing an identifier and a secret, or None.
+    :return: list of unique (identifier, secret) tuples, the primary details first.
+    """
+    credentials = []
+    if identifier and secret:
+        credentials.append((identifier, secret))
+
+    entries = []
+    if additional:
+        try:
+            entries = json.loads(additional) if isinstance(additional, basestring) else additional
+        except ValueError:
+            logger.warning('Ignoring malformed client credentials configuration')
+
+    for entry in entries or []:
+        try:
+            pair = (entry['identifier'], entry['secret'])
+        except (KeyError, TypeError):
+            logger.warning('Ignoring malformed client credentials: %s' % entry)
+            continue
+
+        if pair[0] and pair[1] and pair not in credentials:
+            credentials.append(pair)
+
+    return credentials
+
+
+def parse_credentials(lines):
+    """
+    Read credential sets entered one per line, as the identifier and the secret separated by a colon, a comma or
+    whitespace.  Blank lines and lines starting with # are skipped.
+    :param lines: list of lines, or a string.
+    :return: list of unique (identifier, secret) tuples.
+    """
+    if isinstance(lines, basestring):
+        lines = lines.splitlines()
+
+    credentials = []
+    for line in lines or []:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        fields = line.replace(':', ' ').replace(',', ' ').split()
+        if len(fields) != 2:
+            raise ValueError('Credentials must be an identifier and a secret: %s' % line)
+
+        pair = tuple(fields)
+        if pair not in credentials:
+            credentials.append(pair)
+
+    return credentials
+
+
+def dump_credentials(credentials):
+    """
+    Convert credential sets into the value stored in the configuration.
+    :param credentials: list of (identifier, secret) tuples.
+    :return: json string.
+    """
+    return json.dumps([dict(identifier=identifier, secret=secret) for identifier, secret in credentials])
+
+
+class _PooledClient(object):
+
+    def __init__(self, identifier, secret, client, limit):
+        self.identifier = identifier
+        self.secret = secret
+        self.client = client
+        self.limit = limit
+        self.remaining = None
+        self.reset = None
+        self.in_flight = 0
+        self.requests = 0
+        self.quarantined_until = 0.0
+        self.quarantine_duration = None
+
+
+class ClientPool(object):
+    """
+    Routes each request to the client with the most remaining quota, using the rate limits reported by the api less
+    the requests that are in flight.  A client that runs out of quota is skipped until its window resets, and a client
+    whose credentials are rejected is quarantined for a period that doubles while it keeps being rejected.  Requests
+    that fail for either reason are retried with another client.
+
+    The request scheduler is notified of the combined limits of the clients that can be used, so that the pacing of the
+    requests scales with the number of clients.
+    """
+
+    # Hourly limit assumed for a client until the api reports its limit.
+    default_limit = 5000
+
+    # Number of seconds a client is skipped after running out of quota when the api did not report the reset time.
+    exhausted_delay = 300.0
+
+    quarantine_duration = 900.0
+    max_quarantine_duration = 21600.0
+
+    def __init__(self, client_factory, rate_limit_listener=None, clock=time.time):
+        """
+        :param client_factory: method(identifier, secret) creating a foursquare client.
+        :param rate_limit_listener: method(limit, remaining, reset) notified of the combined limits.
+        :param clock: time source.
+        """
+        self._client_factory = client_factory
+        self._rate_limit_listener = rate_limit_listener
+        self._clock = clock
+
+        # Clients are chosen and updated from the worker threads.
+        self._lock = threading.Lock()
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clients(self):
+        """
+        All of the clients in the pool.
+        :return: list of foursquare clients.
+        """
+        return [entry.client for entry in self._entries]
+
+    def configure(self, credentials):
+        """
+        Replace the clients of the pool, keeping the clients and their state for the credentials that are unchanged.
+        :param credentials: list of (identifier, secret) tuples.
+        :return:
+        """
+        with self._lock:
+            existing = dict(((entry.identifier, entry.secret), entry) for entry in self._entries)
+            entries = []
+
+            for identifier, secret in credentials:
+                entry = existing.get((identifier, secret), None)
+                if entry is None:
+                    entry = _PooledClient(identifier, secret, self._client_factory(identifier, secret),
+                                          self.default_limit)
+                    entry.client.base_requester.rate_limit_listener = self._generate_listener(entry)
+                entries.append(entry)
+
+            self._entries = entries
+
+        logger.info('Foursquare client pool has %s clients' % len(entries))
+        self._notify_limits()
+
+    def available(self):
+        """
+        Number of clients that can currently be used.
+        :return:
+        """
+        now = self._clock()
+        with self._lock:
+            return len([entry for entry in self._entries if self._usable(entry, now)])
+
+    def status(self):
+        """
+        State of each client of the pool.
+        :return: list of dictionaries.
+        """
+        now = self._clock()
+        with self._lock:
+            return [dict(identifier=entry.identifier, limit=entry.limit, remaining=entry.remaining,
+                         requests=entry.requests, quarantined=max(entry.quarantined_until - now, 0.0),
+                         usable=self._usable(entry, now))
+                    for entry in self._entries]
+
+    def call(self, method):
+        """
+        Execute a request with the client that has the most remaining quota, retrying it with another client if the
+        quota of the client ran out or its credentials were rejected.
+        :param method: method(client) performing the request.
+        :return: result of the method.
+        """
+        tried = set()
+
+        while True:
+            entry = self._acquire(tried)
+            tried.add(id(entry))
+
+            try:
+                result = method(entry.client)
+            except (foursquare.RateLimitExceeded, ) + CREDENTIAL_ERRORS as e:
+                self._release(entry, e)
+                if len(tried) >= len(self._entries):
+                    raise
+                logger.debug('Retrying request with another client after: %s' % e)
+                continue
+            except Exception as e:
+                self._release(entry, e)
+                raise
+
+            self._release(entry)
+            return result
+
+    def _acquire(self, tried):
+        """
+        Choose the usable client with the most remaining quota.
+        :param tried: identities of the clients that have already been tried for the request.
+        :return: pooled client.
+        """
+        now = self._clock()
+
+        with self._lock:
+            if not self._entries:
+                raise ClientNotConfigured('Foursquare client is not defined')
+
+            candidates = [entry for entry in self._entries if id(entry) not in tried and self._usable(entry, now)]
+            if not candidates:
+                if all(entry.quarantined_until > now for entry in self._entries):
+                    raise ClientNotConfigured('All of the foursquare clients are quarantined')
+                raise QuotaExhausted('Foursquare request quota of all of the clients has been exhausted')
+
+            entry = max(candidates, key=self._estimated_remaining)
+            entry.in_flight += 1
+            entry.requests += 1
+
+            return entry
+
+    def _release(self, entry, error=None):
+        """
+        Record the outcome of a request.
+        :param entry: pooled client that made the request.
+        :param error: error the request failed with.
+        :return:
+        """
+        with self._lock:
+            entry.in_flight -= 1
+
+            if isinstance(error, CREDENTIAL_ERRORS):
+                duration = self.quarantine_duration if entry.quarantine_duration is None else \
+                    min(entry.quarantine_duration * 2, self.max_quarantine_duration)
+                entry.quarantine_duration = duration
+                entry.quarantined_until = self._clock() + duration
+                logger.warning('Quarantining foursquare client %s for %.0f seconds: %s' %
+                               (entry.identifier, duration, error))
+            elif error is None:
+                entry.quarantine_duration = None
+
+        if isinstance(error, CREDENTIAL_ERRORS):
+            self._notify_limits()
+
+    def _usable(self, entry, now):
+        if entry.quarantined_until > now:
+            return False
+
+        if entry.remaining == 0:
+            if entry.reset is not None and entry.reset <= now:
+                # The window has reset, so the quota is unknown until the next response.
+                entry.remaining = None
+                entry.reset = None
+            else:
+                return False
+
+        return True
+
+    @staticmethod
+    def _estimated_remaining(entry):
+        remaining = entry.limit if entry.remaining is None else entry.remaining
+        return remaining - entry.in_flight
+
+    def _generate_listener(self, entry):
+        """
+        Create the rate limit listener of the requester of a client.
+        :param entry: pooled client.
+        :return: method(limit, remaining, reset)
+        """
+        def rate_limit_listener(limit=None, remaining=None, reset=None):
+            with self._lock:
+                if limit:
+                    entry.limit = limit
+                if remaining is not None:
+                    entry.remaining = remaining
+                    if remaining == 0:
+                        entry.reset = reset if reset else self._clock() + self.exhausted_delay
+                    else:
+                        entry.reset = reset
+
+            self._notify_limits()
+
+        return rate_limit_listener
+
+    def _notify_limits(self):
+        """
+        Notify the listener of the combined limits of the clients that are not quarantined.
+        :return:
+        """
+        if not self._rate_limit_listener:
+            return
+
+        now = self._clock()
+        with self._lock:
+            entries = [entry for entry in self._entries if entry.quarantined_until <= now]
+            if not entries:
+                return
+
+            limit = sum(entry.limit for entry in entries)
+
+            remaining = None
+            reset = None
+            if all(entry.remaining is not None for entry in entries):
+                remaining = sum(entry.remaining for entry in entries)
+                if remaining == 0:
+                    reset = min(entry.reset for entry in entries)
+
+        self._rate_limit_listener(limit=limit, remaining=remaining, reset=reset)
@@ -1,5 +1,7 @@
 from foursquare_bot.components.commands.configure_client_details import configure_client_details
+from foursquare_bot.components.commands.import_venues import import_venues
 from foursquare_bot.components.commands.search_venues import search_venues
+from foursquare_bot.components.commands.show_metrics import show_metrics
 
 from sleekxmpp.plugins.base import register_plugin
 
@@ -10,4 +12,6 @@ def load_commands():
     :return: None
     """
     register_plugin(configure_client_details)
+    register_plugin(import_venues)
     register_plugin(search_venues)
+    register_plugin(show_metrics)
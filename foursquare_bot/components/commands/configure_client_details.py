@@ -1,6 +1,7 @@
 import logging
 from rhobot.components.commands.base_command import BaseCommand
-from foursquare_bot.components.configuration_enums import IDENTIFIER_KEY, CLIENT_SECRET_KEY
+from foursquare_bot.components.configuration_enums import IDENTIFIER_KEY, CLIENT_SECRET_KEY, CLIENT_CREDENTIALS_KEY
+from foursquare_bot.components.client_pool import load_credentials, parse_credentials, dump_credentials
 from foursquare_bot.components.events import OAUTH_DETAILS_UPDATED
 
 logger = logging.getLogger(__name__)
@@ -11,16 +12,18 @@ class ConfigureClientDetails(BaseCommand):
     Plugin that will configure the client details for the service to connect to the google apis.
     """
     name = 'configure_client_details'
-    dependencies = BaseCommand.default_dependencies.union({'rho_bot_configuration', })
+    dependencies = BaseCommand.default_dependencies.union({'rho_bot_configuration', 'foursquare_lookup', })
     description = 'Configure Client Details'
 
     def post_init(self):
         super(ConfigureClientDetails, self).post_init()
         self._configuration = self.xmpp['rho_bot_configuration']
+        self._foursquare_lookup = self.xmpp['foursquare_lookup']
 
     def command_start(self, request, initial_session):
         """
-        Create the form that asks for the clientId, clientSecret,
+        Create the form that asks for the clientId, clientSecret, and any additional credentials to spread the requests
+        over, along with the state of the clients that are in use.
         :param request:
         :param initial_session:
         :return:
@@ -39,6 +42,22 @@ class ConfigureClientDetails(BaseCommand):
                        required=True,
                        value=previous_secret)
 
+        additional = load_credentials(None, None, self._configuration.get_value(CLIENT_CREDENTIALS_KEY, None))
+        form.add_field(var='additional_clients', ftype='text-multi', label='Additional Clients',
+                       desc='Client Identifier and Client Secret of other apps, separated by a colon, one per line',
+                       value='\n'.join('%s:%s' % pair for pair in additional))
+
+        for status in self._foursquare_lookup.client_pool.status():
+            if status['quarantined']:
+                state = 'quarantined for %.0f seconds' % status['quarantined']
+            elif not status['usable']:
+                state = 'quota exhausted'
+            else:
+                state = '%s of %s requests remaining' % (
+                    'unknown' if status['remaining'] is None else status['remaining'], status['limit'])
+
+            form.add_field(ftype='fixed', value='%s: %s' % (status['identifier'], state))
+
         initial_session['payload'] = form
         initial_session['next'] = self._process_initial_form
         initial_session['has_next'] = False
@@ -58,12 +77,25 @@ class ConfigureClientDetails(BaseCommand):
 
         logger.debug('Secret: %s, Identifier: %s' % (secret, identifier))
 
-        self._configuration.merge_configuration({IDENTIFIER_KEY: identifier, CLIENT_SECRET_KEY: secret})
-
         session['has_next'] = False
         session['payload'] = None
         session['next'] = None
 
+        try:
+            additional = parse_credentials(payload['values'].get('additional_clients', None))
+        except ValueError as error:
+            form = self._forms.make_form(ftype='result')
+            form.add_reported(var='error', ftype='text-single')
+            form.add_item({'error': str(error)})
+            session['payload'] = form
+
+            return session
+
+        logger.debug('Additional clients: %s' % [pair[0] for pair in additional])
+
+        self._configuration.merge_configuration({IDENTIFIER_KEY: identifier, CLIENT_SECRET_KEY: secret,
+                                                 CLIENT_CREDENTIALS_KEY: dump_credentials(additional)})
+
         self.xmpp.event(OAUTH_DETAILS_UPDATED)
 
         return session
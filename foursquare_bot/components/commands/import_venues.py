@@ -0,0 +1,210 @@
+"""
+This command will seed the graph with venues, either from a list or export of foursquare venues or by sweeping an area
+with venue searches.
+"""
+
+from rhobot.components.commands.base_command import BaseCommand
+from foursquare_bot.components.configuration_enums import IMPORT_DIRECTORY_KEY
+from foursquare_bot.components.spatial_index import grid_points
+from foursquare_bot.components.utilities import get_configuration_value, parse_venue_reference
+from foursquare_bot.components.venue_importer import VenueImporter
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def read_venue_references(path):
+    """
+    Read the venue identifiers out of an export file one line at a time.
+    :param path: path to the file.
+    :return: generator of venue identifiers.
+    """
+    with open(path) as export:
+        for line in export:
+            venue = parse_venue_reference(line)
+            if venue:
+                yield venue
+
+
+def resolve_import_path(directory, name):
+    """
+    Resolve the name of an export file inside of the import directory.
+    :param directory: import directory.
+    :param name: name of the file, relative to the import directory.
+    :return: absolute path of the file, or None if the file is not inside of the import directory.
+    """
+    if not directory or not name:
+        return None
+
+    directory = os.path.join(os.path.realpath(directory), '')
+    path = os.path.realpath(os.path.join(directory, name))
+
+    if not path.startswith(directory):
+        return None
+
+    return path
+
+
+class ImportVenues(BaseCommand):
+
+    name = 'import_venues'
+    dependencies = BaseCommand.default_dependencies.union({'foursquare_lookup', 'foursquare_metrics',
+                                                           'rho_bot_storage_client', 'rho_bot_scheduler',
+                                                           'rho_bot_configuration', })
+    description = 'Import Venues'
+
+    # Number of venues imported at the same time, and the default distance between the searches of a sweep.
+    concurrency = 10
+    default_step = 1.0
+
+    # Directory that export files are read from, importing from files is disabled until it is configured.
+    import_directory = None
+
+    def post_init(self):
+        super(ImportVenues, self).post_init()
+        self._foursquare_lookup = self.xmpp['foursquare_lookup']
+        self._storage_client = self.xmpp['rho_bot_storage_client']
+        self._scheduler = self.xmpp['rho_bot_scheduler']
+        self._configuration = self.xmpp['rho_bot_configuration']
+        self._metrics = self.xmpp['foursquare_metrics'].registry
+
+        self._importer = None
+
+    def command_start(self, request, initial_session):
+        """
+        Provide the progress of the running import, or the form used to start an import.
+        :param request:
+        :param initial_session:
+        :return:
+        """
+        if self._importer and self._importer.running:
+            return self._progress(initial_session)
+
+        form = self._forms.make_form()
+
+        form.add_field(var='venues', label='Venues', ftype='text-multi',
+                       description='Venue identifiers or urls, one per line')
+        form.add_field(var='path', label='Export File', ftype='text-single',
+                       description='Name of a file in the import directory containing a venue identifier or url '
+                                   'per line')
+        form.add_field(var='bounds', label='Sweep Bounds', ftype='text-single',
+                       description='South, west, north, east of the area to search')
+        form.add_field(var='step', label='Sweep Step', ftype='text-single',
+                       description='Distance between the searches in kilometers')
+        form.add_field(var='query', label='Query', ftype='text-single', description='Query String')
+
+        initial_session['payload'] = form
+        initial_session['next'] = self.start_import
+        initial_session['has_next'] = True
+
+        return initial_session
+
+    def start_import(self, payload, session):
+        """
+        Start the import in the background and report its progress.
+        :param payload:
+        :param session:
+        :return:
+        """
+        fields = payload.get_fields()
+
+        def value(name):
+            return fields[name].get_value() if name in fields else None
+
+        references = None
+        venues = value('venues')
+        path = value('path')
+
+        if venues:
+            if not isinstance(venues, (list, tuple)):
+                venues = venues.splitlines()
+            references = [parse_venue_reference(venue) for venue in venues]
+        elif path:
+            directory = get_configuration_value(self._configuration, IMPORT_DIRECTORY_KEY, self.import_directory, str)
+            if not directory:
+                return self._error(session, 'Importing from a file requires the %s configuration value' %
+                                   IMPORT_DIRECTORY_KEY)
+
+            export_path = resolve_import_path(directory, path)
+            if not export_path or not os.path.isfile(export_path):
+                return self._error(session, 'Export file does not exist in the import directory: %s' % path)
+            references = read_venue_references(export_path)
+
+        points = None
+        radius = None
+        bounds = value('bounds')
+
+        if bounds:
+            try:
+                south, west, north, east = [float(bound) for bound in bounds.split(',')]
+                step = float(value('step') or self.default_step)
+            except ValueError:
+                return self._error(session, 'Bounds must be four numbers: south, west, north, east')
+
+            points = grid_points(south, west, north, east, step)
+
+            # Search far enough around each point to cover the corners of its cell.
+            radius = step * 1000.0 * 0.71
+
+        if references is None and points is None:
+            return self._error(session, 'Venues, an export file or sweep bounds are required')
+
+        if not (self._importer and self._importer.running):
+            self._importer = VenueImporter(self._scheduler, self._storage_client, self._foursquare_lookup,
+                                           concurrency=self.concurrency, metrics=self._metrics)
+            self._importer.import_venues(references, points, radius, value('query'))
+
+        return self._progress(session)
+
+    def poll_progress(self, payload, session):
+        """
+        Report the progress of the import again.
+        :param payload:
+        :param session:
+        :return:
+        """
+        return self._progress(session)
+
+    def _progress(self, session):
+        """
+        Report the progress of the import, the command can be continued to poll the progress while the import is
+        running.
+        :param session:
+        :return:
+        """
+        form = self._forms.make_form(ftype='result')
+
+        form.add_reported(var='metric', ftype='text-single')
+        form.add_reported(var='value', ftype='text-single')
+
+        progress = self._importer.progress()
+        for name in ('running', 'processed', 'created', 'existing', 'failed', 'searches', 'search_failures'):
+            form.add_item({'metric': name, 'value': str(progress[name])})
+        form.add_item({'metric': 'rate', 'value': '%.1f venues/s' % progress['rate']})
+
+        session['payload'] = form
+        session['next'] = self.poll_progress if progress['running'] else None
+        session['has_next'] = progress['running']
+
+        return session
+
+    def _error(self, session, message):
+        """
+        Report an error and end the command.
+        :param session:
+        :param message:
+        :return:
+        """
+        form = self._forms.make_form(ftype='result')
+
+        form.add_reported(var='error', ftype='text-single')
+        form.add_item({'error': message})
+
+        session['payload'] = form
+        session['next'] = None
+        session['has_next'] = False
+
+        return session
+
+import_venues = ImportVenues
@@ -0,0 +1,56 @@
+"""
+This command will report the counters and timers that have been collected by the foursquare metrics plugin.
+"""
+
+from rhobot.components.commands.base_command import BaseCommand
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ShowMetrics(BaseCommand):
+
+    name = 'show_metrics'
+    dependencies = BaseCommand.default_dependencies.union({'foursquare_metrics', })
+    description = 'Show Metrics'
+
+    def post_init(self):
+        super(ShowMetrics, self).post_init()
+        self._metrics = self.xmpp['foursquare_metrics'].registry
+
+    def command_start(self, request, initial_session):
+        """
+        Provide the current metrics back to the requester and end the command.
+        :param request:
+        :param initial_session:
+        :return:
+        """
+        form = self._forms.make_form(ftype='result')
+
+        form.add_reported(var='metric', ftype='text-single')
+        form.add_reported(var='value', ftype='text-single')
+
+        if not self._metrics.enabled:
+            form.add_item({'metric': 'metrics_enabled', 'value': 'false'})
+
+        snapshot = self._metrics.snapshot()
+
+        for name, value in sorted(snapshot['counters'].items()):
+            form.add_item({'metric': name, 'value': str(value)})
+
+        for name, value in sorted(snapshot['gauges'].items()):
+            form.add_item({'metric': name, 'value': str(value)})
+
+        for name, details in sorted(snapshot['timers'].items()):
+            form.add_item({'metric': name,
+                           'value': 'count: %(count)d p50: %(p50).1fms p99: %(p99).1fms max: %(max).1fms' % dict(
+                               count=details['count'], p50=details['p50'] * 1000.0, p99=details['p99'] * 1000.0,
+                               max=details['max'] * 1000.0)})
+
+        initial_session['payload'] = form
+        initial_session['next'] = None
+        initial_session['has_next'] = False
+
+        return initial_session
+
+show_metrics = ShowMetrics
@@ -4,3 +4,51 @@ List of magic strings used in this application.
 
 IDENTIFIER_KEY = 'identifier'
 CLIENT_SECRET_KEY = 'secret'
+
+# Additional foursquare client credentials, stored as a json list of identifier and secret dictionaries.
+CLIENT_CREDENTIALS_KEY = 'client_credentials'
+
+# Maintainer tuning
+MAINTAINER_PAGE_SIZE_KEY = 'maintainer_page_size'
+MAINTAINER_CONCURRENCY_KEY = 'maintainer_concurrency'
+
+# Venue details cache
+VENUE_CACHE_PATH_KEY = 'venue_cache_path'
+VENUE_CACHE_TTL_KEY = 'venue_cache_ttl'
+VENUE_CACHE_SIZE_KEY = 'venue_cache_size'
+
+# Foursquare http requests
+WORKER_POOL_SIZE_KEY = 'worker_pool_size'
+REQUEST_TIMEOUT_KEY = 'request_timeout'
+
+# Search handler
+RANKING_REFRESH_INTERVAL_KEY = 'ranking_refresh_interval'
+
+# Metrics
+METRICS_ENABLED_KEY = 'metrics_enabled'
+METRICS_DUMP_PATH_KEY = 'metrics_dump_path'
+METRICS_DUMP_INTERVAL_KEY = 'metrics_dump_interval'
+
+# Maintenance work queue
+WORK_QUEUE_PATH_KEY = 'work_queue_path'
+
+# Venue refresh
+FRESHNESS_PATH_KEY = 'freshness_path'
+REFRESH_DAILY_BUDGET_KEY = 'refresh_daily_budget'
+REFRESH_AGE_KEY = 'refresh_age'
+
+# Venue translation
+CATEGORY_MAPPING_PATH_KEY = 'category_mapping_path'
+
+# Foursquare transport
+FOURSQUARE_TRANSPORT_KEY = 'foursquare_transport'
+RESPONSE_ARCHIVE_PATH_KEY = 'response_archive_path'
+REPLAY_LATENCY_SCALE_KEY = 'replay_latency_scale'
+
+# Lookup pool
+LOOKUP_MAX_IN_FLIGHT_KEY = 'lookup_max_in_flight'
+LOOKUP_QUEUE_SIZE_KEY = 'lookup_queue_size'
+LOOKUP_OVERFLOW_KEY = 'lookup_overflow'
+
+# Venue import, export files can only be read from inside of this directory.
+IMPORT_DIRECTORY_KEY = 'import_directory'
@@ -1 +1,2 @@
 from foursquare_bot.components.events.oauth import OAUTH_DETAILS_UPDATED
+from foursquare_bot.components.events.venues import VENUE_UPDATED, VENUE_NODE_CREATED
@@ -0,0 +1,9 @@
+"""
+Events associated with the venue nodes maintained by this bot.
+"""
+
+# Fired with dict(node=node_uri, venue=venue_identifier) when the details of a venue node have been written.
+VENUE_UPDATED = 'foursquare::venue_updated'
+
+# Fired with dict(node=node_uri, venue=venue_identifier) when a venue node has been created by the knowledge provider.
+VENUE_NODE_CREATED = 'foursquare::venue_node_created'
@@ -0,0 +1,230 @@
+"""
+Foursquare client that exposes the rate limit details returned by the API, so that requests can be paced, and reuses
+its connections to the API.
+"""
+from foursquare_bot.components.metrics import MetricsRegistry
+from foursquare_bot.components.response_archive import LIVE, RECORD, REPLAY, request_key
+from foursquare_bot.components.worker_pool import RequestTimeout
+import foursquare
+import httplib2
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ClientNotConfigured(RuntimeError):
+    """
+    Raised when a request needs the foursquare client, but the client details have not been configured.
+    """
+    pass
+
+
+class ResponseNotRecorded(foursquare.FoursquareException):
+    """
+    Raised when a request is replayed, but its response is not in the archive.
+    """
+    pass
+
+
+def is_outage(error):
+    """
+    Determine whether a request failed because foursquare is unavailable, rather than because of the request itself.
+    :param error: error the request failed with.
+    :return: True for connection errors, timeouts and server errors.
+    """
+    if isinstance(error, (RequestTimeout, foursquare.ServerError)):
+        return True
+
+    # Connection errors are raised as the base exception.
+    return type(error) is foursquare.FoursquareException
+
+
+class RecordedResponse(dict):
+    """
+    Headers and status of a replayed response, standing in for the httplib2 response.
+    """
+
+    def __init__(self, status, headers):
+        super(RecordedResponse, self).__init__(headers)
+        self.status = status
+
+
+class RateLimitedRequester(foursquare.Foursquare.Requester):
+    """
+    Requester that records the X-RateLimit headers of every response and notifies a listener of them.  Each thread
+    keeps its own http connection alive between requests.
+
+    The responses can be recorded to a response archive, or replayed from it instead of calling the API, sleeping for
+    the recorded latency of the response multiplied by the latency scale.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(RateLimitedRequester, self).__init__(*args, **kwargs)
+        self.rate_limit = None
+        self.rate_remaining = None
+        self.rate_limit_listener = None
+        self.timeout = None
+        self.metrics = MetricsRegistry()
+        self.transport = LIVE
+        self.archive = None
+        self.latency_scale = 1.0
+        self._local = threading.local()
+
+    def _request(self, url, data=None):
+        """
+        Performs the request and returns the response contents.
+        :param url: url to request.
+        :param data: post data, these requests are handed to the library implementation.
+        :return: response dictionary.
+        """
+        if data:
+            return super(RateLimitedRequester, self)._request(url, data)
+
+        headers = {}
+        if self.lang:
+            headers['Accept-Language'] = self.lang
+
+        for attempt in xrange(foursquare.NUM_REQUEST_RETRIES):
+            try:
+                return self._get(url, headers)
+            except (foursquare.InvalidAuth, foursquare.ParamError, foursquare.EndpointError,
+                    foursquare.NotAuthorized, foursquare.Deprecated, foursquare.RateLimitExceeded,
+                    ResponseNotRecorded):
+                raise
+            except foursquare.FoursquareException:
+                if attempt + 1 == foursquare.NUM_REQUEST_RETRIES:
+                    raise
+            time.sleep(1)
+
+    def _get(self, url, headers):
+        """
+        Execute a single get request, recording the rate limit details of the response.
+        :param url: url to request.
+        :param headers: request headers.
+        :return: response dictionary.
+        """
+        if self.transport == REPLAY:
+            response, body = self._replay(url)
+        else:
+            response, body = self._fetch(url, headers)
+
+        self._record_rate_limit(response)
+
+        try:
+            data = foursquare._json_to_data(body)
+            if response.status != 200:
+                foursquare._check_response(data)
+        except foursquare.RateLimitExceeded:
+            self.metrics.increment('foursquare_rate_limited')
+            self._notify_rate_limit(remaining=0)
+            raise
+
+        return data['response']
+
+    def _fetch(self, url, headers):
+        """
+        Request the url from the API, recording the response when the transport is recording.
+        :param url: url to request.
+        :param headers: request headers.
+        :return: tuple of the httplib2 response and the body.
+        """
+        http = self._http()
+        started = time.time()
+        try:
+            with self.metrics.timer('foursquare_http'):
+                response, body = http.request(url, 'GET', headers=headers)
+        except (httplib2.HttpLib2Error, socket.error) as e:
+            # The connection may have been left in an unknown state, so start a new one with the next request.
+            self._local.http = None
+            raise foursquare.FoursquareException('Error connecting with foursquare API: %s' % e)
+
+        if self.transport == RECORD and self.archive:
+            self.archive.record(url, response.status, response, body, time.time() - started)
+
+        return response, body
+
+    def _replay(self, url):
+        """
+        Fetch the recorded response of the url, waiting for its scaled latency.
+        :param url: url to request.
+        :return: tuple of the recorded response and the body.
+        """
+        recorded = self.archive.replay(url) if self.archive else None
+        if recorded is None:
+            raise ResponseNotRecorded('No recorded response for: %s' % request_key(url))
+
+        status, headers, body, latency = recorded
+
+        with self.metrics.timer('foursquare_http'):
+            if self.latency_scale > 0:
+                time.sleep(latency * self.latency_scale)
+
+        return RecordedResponse(status, headers), body
+
+    def _http(self):
+        """
+        Fetch the http connection of the current thread.
+        :return: httplib2 http object.
+        """
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = httplib2.Http(**foursquare.HTTP_KWARGS)
+
+        http.timeout = self.timeout
+        return http
+
+    def _record_rate_limit(self, response):
+        """
+        Store the rate limit headers of the response.
+        :param response: httplib2 response.
+        :return:
+        """
+        limit = response.get('x-ratelimit-limit', None)
+        remaining = response.get('x-ratelimit-remaining', None)
+        reset = response.get('x-ratelimit-reset', None)
+
+        if limit is not None:
+            self.rate_limit = int(limit)
+        if remaining is not None:
+            self.rate_remaining = int(remaining)
+
+        if limit is not None or remaining is not None:
+            self._notify_rate_limit(limit=self.rate_limit, remaining=self.rate_remaining,
+                                    reset=int(reset) if reset is not None else None)
+
+    def _notify_rate_limit(self, limit=None, remaining=None, reset=None):
+        if self.rate_limit_listener:
+            self.rate_limit_listener(limit=limit, remaining=remaining, reset=reset)
+
+
+class FoursquareClient(foursquare.Foursquare):
+    """
+    Foursquare client that uses the rate limited requester for all of the endpoints.
+    """
+    Requester = RateLimitedRequester
+
+    def multi_venues(self, venue_ids):
+        """
+        Request the details of several venues through the multi endpoint.  The sub requests are built for this call
+        rather than queued on the requester, as the queue of the requester is shared by all of the threads using the
+        client.
+        :param venue_ids: list of venue identifiers.
+        :return: list of venue responses or exceptions, in the same order as the identifiers.
+        """
+        results = []
+
+        for start in xrange(0, len(venue_ids), foursquare.MAX_MULTI_REQUESTS):
+            requests = ','.join('/venues/%s' % venue_id
+                                for venue_id in venue_ids[start:start + foursquare.MAX_MULTI_REQUESTS])
+
+            for response in self.base_requester.GET('/multi', {'requests': requests})['responses']:
+                try:
+                    foursquare._check_response(response)
+                    results.append(response['response'])
+                except foursquare.FoursquareException as e:
+                    results.append(e)
+
+        return results
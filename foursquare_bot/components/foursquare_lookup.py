@@ -1,23 +1,146 @@
 from sleekxmpp.plugins.base import base_plugin
 from rhobot.components.configuration import BotConfiguration
 from rhobot.components.storage import StoragePayload
-from foursquare_bot.components.configuration_enums import CLIENT_SECRET_KEY, IDENTIFIER_KEY
-from foursquare_bot.components.utilities import get_foursquare_venue_from_url, foursquare_to_storage
-import logging
+from foursquare_bot.components.configuration_enums import CLIENT_SECRET_KEY, IDENTIFIER_KEY, VENUE_CACHE_PATH_KEY, \
+    VENUE_CACHE_TTL_KEY, VENUE_CACHE_SIZE_KEY, WORKER_POOL_SIZE_KEY, REQUEST_TIMEOUT_KEY, WORK_QUEUE_PATH_KEY, \
+    FRESHNESS_PATH_KEY, CATEGORY_MAPPING_PATH_KEY, FOURSQUARE_TRANSPORT_KEY, RESPONSE_ARCHIVE_PATH_KEY, \
+    REPLAY_LATENCY_SCALE_KEY, LOOKUP_MAX_IN_FLIGHT_KEY, LOOKUP_QUEUE_SIZE_KEY, LOOKUP_OVERFLOW_KEY, \
+    CLIENT_CREDENTIALS_KEY
+from foursquare_bot.components.utilities import get_foursquare_venue_from_url, get_foursquare_venue_from_urls, \
+    foursquare_to_storage, get_configuration_value, search_key, first_value, storage_digest, storage_differences, \
+    normalize_properties, normalize_values, SEE_ALSO
+from foursquare_bot.components.cache import LRUCache, VenueCache
+from foursquare_bot.components.single_flight import SingleFlight, PromiseFlight
+from foursquare_bot.components.foursquare_client import FoursquareClient, ClientNotConfigured, is_outage
+from foursquare_bot.components.client_pool import ClientPool, load_credentials
+from foursquare_bot.components.circuit_breaker import CircuitBreaker, CircuitOpen
+from foursquare_bot.components.request_scheduler import RequestScheduler, QuotaExhausted, INTERACTIVE, PROVIDER, \
+    MAINTENANCE
+from foursquare_bot.components.batcher import MicroBatcher
+from foursquare_bot.components.worker_pool import WorkerPool
+from foursquare_bot.components.lookup_pool import LookupPool, LookupQueueFull, OVERFLOW_POLICIES, SHED_LOWEST
+from foursquare_bot.components.write_buffer import StorageWriteBuffer, WriteBufferFull
+from foursquare_bot.components.events import VENUE_UPDATED
+from foursquare_bot.components.venue_index import VenueSearchIndex
+from foursquare_bot.components.work_queue import WorkQueue
+from foursquare_bot.components.freshness import FreshnessStore
+from foursquare_bot.components.translator import VenueTranslator, load_category_mapping
+from foursquare_bot.components.response_archive import ResponseArchive, TRANSPORTS, LIVE, REPLAY
+from rhobot.components.storage.enums import CypherFlags
+from rhobot.components.storage.namespace import NEO4J
+from rhobot.namespace import WGS_84, SCHEMA
 import foursquare
+import json
+import logging
+import time
 from rdflib.namespace import RDFS, DCTERMS
 
 logger = logging.getLogger(__name__)
 
+# Lookups that fail with these errors could not be run, so their failure does not count against the node.
+UNAVAILABLE_ERRORS = (ClientNotConfigured, CircuitOpen, QuotaExhausted, foursquare.RateLimitExceeded, LookupQueueFull,
+                      WriteBufferFull)
+
+
+class VenueNotDefined(RuntimeError):
+    """
+    Raised when a node does not reference a foursquare venue.
+    """
+    pass
+
 
 class FoursquareLookup(base_plugin):
     name = 'foursquare_lookup'
     description = 'Foursquare Lookup'
-    dependencies = {'rho_bot_storage_client', 'rho_bot_rdf_publish', 'rho_bot_representation_manager', }
+    dependencies = {'rho_bot_storage_client', 'rho_bot_rdf_publish', 'rho_bot_representation_manager',
+                    'foursquare_metrics', }
+
+    # Foursquare requests are executed on a pool of worker threads so that they don't block the bot.
+    worker_pool_size = 4
+    request_timeout = 30.0
+
+    venue_cache_path = 'foursquare_venue_cache.db'
+    venue_cache_ttl = 604800.0
+    venue_cache_size = 1000
+
+    # Created nodes are recorded in the work queue until they have been populated, so that the maintainer retries them
+    # when the lookup fails or the bot is stopped before it completes.  The retry delay doubles with each failure, and
+    # nodes are parked once they have failed the maximum number of times.
+    work_queue_path = 'foursquare_work_queue.db'
+    work_queue_retry_delay = 60.0
+    work_queue_max_attempts = 10
+
+    # Last time the details of each node were fetched, used to find the venues that need to be refreshed.
+    freshness_path = 'foursquare_freshness.db'
+
+    # Mapping of foursquare categories to ontology types, None for the mapping that is distributed with the bot.
+    category_mapping_path = None
+
+    # Foursquare responses can be recorded to an archive, or replayed from it instead of calling the API so that the
+    # bot can be load tested offline.  Replayed responses wait for their recorded latency multiplied by the scale.
+    transport = LIVE
+    response_archive_path = 'foursquare_responses.db'
+    replay_latency_scale = 1.0
+
+    # Scheduled lookups are run by a bounded pool, the lookups that do not fit in the queue are handled by the overflow
+    # policy: shed_lowest drops the lowest priority queued lookup for a higher priority one, reject_new rejects it.
+    lookup_max_in_flight = 20
+    lookup_queue_size = 1000
+    lookup_overflow = SHED_LOWEST
+
+    # Number of seconds venue lookups are collected for before they are fetched in a single multi request.
+    batch_window = 0.25
+
+    # Venue updates are buffered and written to storage in groups, updates are rejected when too many are waiting.
+    write_flush_size = 20
+    write_flush_interval = 1.0
+    write_max_pending = 200
+
+    search_cache_ttl = 300.0
+    search_cache_size = 256
+
+    # Search results are translated when they seed the venue cache, and the translations are kept for the lookups of
+    # the nodes that are created for them, such as the nodes created by an import sweep.
+    search_payload_ttl = 600.0
+    search_payload_size = 1000
+
+    # Searches are answered from the index of stored venues when it finds at least this many venues within the radius
+    # of the searched location.
+    local_search_min_results = 5
+    local_search_radius = 25.0
+    venue_index_refresh_interval = 3600.0
+    venue_index_page_size = 5000
+
+    # Keyset pagination over the node identifier, so that the stored venues are read a page at a time.
+    venue_index_query = """MATCH (n:`%s`)
+                               WHERE any(seealso IN n.`%s` WHERE seealso =~ '^foursquare:.*') and has(n.`%s`)
+                               and id(n) > %%d
+                               RETURN n as node, id(n) as node_id, n.`%s` as name, n.`%s` as lat, n.`%s` as long,
+                                   n.`%s` as seealso ORDER BY node_id LIMIT %%d""" % (str(WGS_84.SpatialThing),
+                                                                                      str(RDFS.seeAlso),
+                                                                                      str(SCHEMA.name),
+                                                                                      str(SCHEMA.name),
+                                                                                      str(WGS_84.lat),
+                                                                                      str(WGS_84.long),
+                                                                                      str(RDFS.seeAlso))
 
     def plugin_init(self):
         self.xmpp.add_event_handler(BotConfiguration.CONFIGURATION_RECEIVED_EVENT, self._configuration_updated)
-        self._foursquare_client = None
+        self._venue_cache = None
+        self._work_queue = None
+        self._freshness = None
+        self._response_archive = None
+        self._transport = self.transport
+        self._translator_path = self.category_mapping_path
+        self._translator = VenueTranslator(load_category_mapping(self._translator_path))
+        self._search_cache = LRUCache(max_size=self.search_cache_size, ttl=self.search_cache_ttl)
+        self._search_payloads = LRUCache(max_size=self.search_payload_size, ttl=self.search_payload_ttl)
+        self._search_flight = SingleFlight()
+
+        self.venue_index_query = ' '.join(self.venue_index_query.replace('\n', ' ').replace('\r', '').split())
+        self._venue_index = VenueSearchIndex()
+        self._venue_index_scheduled = False
+        self._near_centers = LRUCache(max_size=self.search_cache_size)
 
     def post_init(self):
         self._configuration = self.xmpp['rho_bot_configuration']
@@ -25,6 +148,145 @@ class FoursquareLookup(base_plugin):
         self._rdf_publish = self.xmpp['rho_bot_rdf_publish']
         self._scheduler = self.xmpp['rho_bot_scheduler']
         self._representation_manager = self.xmpp['rho_bot_representation_manager']
+        self._metrics = self.xmpp['foursquare_metrics'].registry
+        self._worker_pool = WorkerPool(self._scheduler, size=self.worker_pool_size, timeout=self.request_timeout,
+                                       metrics=self._metrics)
+        self._circuit_breaker = CircuitBreaker()
+        self._request_scheduler = RequestScheduler(self._scheduler, executor=self._submit_request,
+                                                   metrics=self._metrics)
+        self._metrics.gauge('request_queue_depth', lambda: self._request_scheduler.queue_depth)
+        self._metrics.gauge('request_tokens', lambda: self._request_scheduler.tokens)
+
+        # Requests are spread over the clients of all the configured credentials, and the request scheduler paces
+        # them using the combined quota.
+        self._client_pool = ClientPool(self._create_client, rate_limit_listener=self._request_scheduler.update_limits)
+        self._metrics.gauge('foursquare_clients_available', self._client_pool.available)
+        self._venue_batcher = MicroBatcher(self._scheduler, self._fetch_venues,
+                                           batch_size=foursquare.MAX_MULTI_REQUESTS, window=self.batch_window)
+
+        self._write_buffer = StorageWriteBuffer(self._scheduler, self._storage_client, self._rdf_publish,
+                                                flush_size=self.write_flush_size,
+                                                flush_interval=self.write_flush_interval,
+                                                max_pending=self.write_max_pending,
+                                                metrics=self._metrics)
+        self._metrics.gauge('write_buffer_pending', lambda: self._write_buffer.pending)
+
+        self._lookup_pool = LookupPool(self._scheduler, max_in_flight=self.lookup_max_in_flight,
+                                       max_queued=self.lookup_queue_size, overflow=self.lookup_overflow,
+                                       metrics=self._metrics)
+        self._metrics.gauge('lookup_queue_length', lambda: self._lookup_pool.queue_length)
+        self._metrics.gauge('lookups_in_flight', lambda: self._lookup_pool.in_flight)
+
+        # Lookups of a node or a venue that are already in progress are joined rather than repeated.
+        self._node_flight = PromiseFlight(self._scheduler)
+        self._venue_flight = PromiseFlight(self._scheduler)
+        self._metrics.gauge('coalesced_lookups', lambda: self.coalesced_lookups)
+
+    @property
+    def work_queue(self):
+        """
+        Queue of the nodes that still need to be populated, None until the configuration has been received.
+        :return:
+        """
+        return self._work_queue
+
+    @property
+    def freshness(self):
+        """
+        Last fetched times of the nodes, None until the configuration has been received.
+        :return:
+        """
+        return self._freshness
+
+    @property
+    def coalesced_lookups(self):
+        """
+        Number of lookups that were joined to a lookup that was already in progress.
+        :return:
+        """
+        return self._node_flight.coalesced + self._venue_flight.coalesced
+
+    def quota_wait(self, priority=MAINTENANCE):
+        """
+        Number of seconds until the quota allows a foursquare request of the priority.
+        :param priority: priority of the request.
+        :return: seconds, 0.0 if there is quota available.
+        """
+        return self._request_scheduler.wait_time(priority)
+
+    @property
+    def lookup_pool(self):
+        return self._lookup_pool
+
+    @property
+    def write_buffer(self):
+        return self._write_buffer
+
+    @property
+    def circuit_breaker(self):
+        return self._circuit_breaker
+
+    @property
+    def client_pool(self):
+        return self._client_pool
+
+    def circuit_wait(self):
+        """
+        Number of seconds until the circuit breaker lets foursquare requests through again.
+        :return: seconds, 0.0 if requests are allowed.
+        """
+        return self._circuit_breaker.wait_time()
+
+    def _submit_request(self, priority, method, *args):
+        """
+        Execute a request on the worker pool, unless the circuit breaker is open in which case it fails straight away.
+        :param priority: priority of the request.
+        :param method: method that performs the request.
+        :param args: arguments to the method.
+        :return: promise resolved with the result of the method.
+        """
+        if not self._circuit_breaker.allow():
+            self._metrics.increment('circuit_rejected')
+            promise = self._scheduler.promise()
+            promise.rejected(CircuitOpen('Foursquare is unavailable'))
+            return promise
+
+        return self._worker_pool.submit(priority, self._guarded_request, method, *args)
+
+    def _call_request(self, method, *args):
+        """
+        Execute an interactive request on the worker pool and wait for the result, unless the circuit breaker is open.
+        :param method: method that performs the request.
+        :param args: arguments to the method.
+        :return: result of the method.
+        """
+        if not self._circuit_breaker.allow():
+            self._metrics.increment('circuit_rejected')
+            raise CircuitOpen('Foursquare is unavailable')
+
+        return self._worker_pool.call(INTERACTIVE, self._guarded_request, method, *args)
+
+    def _guarded_request(self, method, *args):
+        """
+        Execute a request on a worker thread, and record its outcome with the circuit breaker.  Errors that foursquare
+        answered with, such as an unknown venue, show that it is available so they count as successes.
+        :param method: method that performs the request.
+        :param args: arguments to the method.
+        :return: result of the method.
+        """
+        started = time.time()
+
+        try:
+            result = method(*args)
+        except Exception as e:
+            if is_outage(e):
+                self._circuit_breaker.failure()
+            else:
+                self._circuit_breaker.success(time.time() - started)
+            raise
+
+        self._circuit_breaker.success(time.time() - started)
+        return result
 
     def _configuration_updated(self, event):
         """
@@ -32,57 +294,361 @@ class FoursquareLookup(base_plugin):
         library to use in this bot.
         :return:
         """
+        self._configure_venue_cache()
+        self._configure_work_queue()
+        self._configure_freshness()
+        self._configure_translator()
+        self._configure_transport()
+        self._configure_lookup_pool()
+
+        if not self._venue_index_scheduled:
+            self._venue_index_scheduled = True
+            self._scheduler.schedule_task(self._rebuild_venue_index, delay=self.venue_index_refresh_interval,
+                                          repeat=True)
+            self._rebuild_venue_index()
+
+        self._worker_pool.resize(get_configuration_value(self._configuration, WORKER_POOL_SIZE_KEY,
+                                                         self.worker_pool_size))
+        self._worker_pool.timeout = get_configuration_value(self._configuration, REQUEST_TIMEOUT_KEY,
+                                                            self.request_timeout, float)
+
         configuration = self._configuration.get_configuration()
 
-        client_secret = configuration.get(CLIENT_SECRET_KEY, None)
-        identifier = configuration.get(IDENTIFIER_KEY, None)
+        credentials = load_credentials(configuration.get(IDENTIFIER_KEY, None),
+                                       configuration.get(CLIENT_SECRET_KEY, None),
+                                       configuration.get(CLIENT_CREDENTIALS_KEY, None))
 
-        if client_secret is None or identifier is None:
-            self._foursquare_client = None
-        else:
-            if self._foursquare_client:
-                oauth = self._foursquare_client.oauth
+        # Replayed responses do not need the API, so the bot can be run without client details.
+        if self._transport == REPLAY and not credentials:
+            credentials = [('replay', 'replay')]
+
+        # Clients of unchanged credentials are kept, along with what is known about their quota.
+        self._client_pool.configure(credentials)
+        for client in self._client_pool.clients():
+            self._configure_requester(client.base_requester)
+
+    def _create_client(self, identifier, client_secret):
+        """
+        Create the client for a set of credentials in the client pool.
+        :param identifier: client identifier.
+        :param client_secret: client secret.
+        :return: foursquare client.
+        """
+        client = FoursquareClient(client_id=identifier, client_secret=client_secret)
+        client.base_requester.metrics = self._metrics
+
+        return client
+
+    def _configure_requester(self, requester):
+        """
+        Apply the timeout and the transport settings to the requester of the client.
+        :param requester: rate limited requester.
+        :return:
+        """
+        requester.timeout = self._worker_pool.timeout
+        requester.transport = self._transport
+        requester.archive = self._response_archive
+        requester.latency_scale = get_configuration_value(self._configuration, REPLAY_LATENCY_SCALE_KEY,
+                                                          self.replay_latency_scale, float)
+
+    def _configure_lookup_pool(self):
+        """
+        Apply the limits of the lookup pool.
+        :return:
+        """
+        self._lookup_pool.max_in_flight = get_configuration_value(self._configuration, LOOKUP_MAX_IN_FLIGHT_KEY,
+                                                                  self.lookup_max_in_flight)
+        self._lookup_pool.max_queued = get_configuration_value(self._configuration, LOOKUP_QUEUE_SIZE_KEY,
+                                                               self.lookup_queue_size)
+
+        overflow = get_configuration_value(self._configuration, LOOKUP_OVERFLOW_KEY, self.lookup_overflow, str)
+        if overflow not in OVERFLOW_POLICIES:
+            logger.warning('Unknown lookup overflow policy: %s, using: %s' % (overflow, self.lookup_overflow))
+            overflow = self.lookup_overflow
+
+        self._lookup_pool.overflow = overflow
+
+    def _configure_transport(self):
+        """
+        Select the transport of the foursquare client, opening the response archive when responses are recorded or
+        replayed.
+        :return:
+        """
+        transport = get_configuration_value(self._configuration, FOURSQUARE_TRANSPORT_KEY, self.transport, str)
+        if transport not in TRANSPORTS:
+            logger.warning('Unknown foursquare transport: %s, using: %s' % (transport, LIVE))
+            transport = LIVE
+
+        path = get_configuration_value(self._configuration, RESPONSE_ARCHIVE_PATH_KEY, self.response_archive_path,
+                                       str)
+
+        if self._response_archive and (transport == LIVE or self._response_archive.path != path):
+            self._response_archive.close()
+            self._response_archive = None
+
+        if transport != LIVE and not self._response_archive:
+            self._response_archive = ResponseArchive(path)
+            logger.info('Foursquare responses are %s: %s' % ('replayed from' if transport == REPLAY else
+                                                            'recorded to', path))
+
+        self._transport = transport
+
+    def _configure_venue_cache(self):
+        """
+        Open the venue details cache, re-opening it if the location of the database has been changed.
+        :return:
+        """
+        path = get_configuration_value(self._configuration, VENUE_CACHE_PATH_KEY, self.venue_cache_path, str)
+        ttl = get_configuration_value(self._configuration, VENUE_CACHE_TTL_KEY, self.venue_cache_ttl, float)
+        size = get_configuration_value(self._configuration, VENUE_CACHE_SIZE_KEY, self.venue_cache_size)
+
+        if self._venue_cache and self._venue_cache.path == path:
+            self._venue_cache.ttl = ttl
+            return
+
+        if self._venue_cache:
+            self._venue_cache.close()
+
+        self._venue_cache = VenueCache(path, ttl=ttl, memory_size=size)
+
+        # Gauges of the same name replace those of the previous cache.
+        for name in ('hits', 'misses', 'hit_rate', 'memory_evictions', 'memory_size'):
+            self._metrics.gauge('venue_cache_%s' % name,
+                                lambda cache=self._venue_cache, name=name: cache.metrics()[name])
+
+    def _configure_work_queue(self):
+        """
+        Open the work queue, re-opening it if the location of the database has been changed.
+        :return:
+        """
+        path = get_configuration_value(self._configuration, WORK_QUEUE_PATH_KEY, self.work_queue_path, str)
+
+        if self._work_queue and self._work_queue.path == path:
+            return
+
+        if self._work_queue:
+            self._work_queue.close()
+
+        self._work_queue = WorkQueue(path, retry_delay=self.work_queue_retry_delay,
+                                     max_attempts=self.work_queue_max_attempts)
+
+    def _configure_freshness(self):
+        """
+        Open the freshness store, re-opening it if the location of the database has been changed.
+        :return:
+        """
+        path = get_configuration_value(self._configuration, FRESHNESS_PATH_KEY, self.freshness_path, str)
+
+        if self._freshness and self._freshness.path == path:
+            return
+
+        if self._freshness:
+            self._freshness.close()
+
+        self._freshness = FreshnessStore(path)
+
+    def _configure_translator(self):
+        """
+        Reload the category mapping of the translator if the location of the mapping file has been changed.
+        :return:
+        """
+        path = self._configuration.get_value(CATEGORY_MAPPING_PATH_KEY, self.category_mapping_path)
+
+        if path != self._translator_path:
+            self._translator_path = path
+            self._translator = VenueTranslator(load_category_mapping(path))
+
+    def _rebuild_venue_index(self):
+        """
+        Rebuild the search index from the foursquare venues that are in storage.
+        :return: promise resolved with the index once all of the venues have been read.
+        """
+        return self._read_venue_index_page(VenueSearchIndex(), -1)
+
+    def _read_venue_index_page(self, index, cursor):
+        """
+        Read the page of stored venues that follows the cursor into the index.
+        :param index: index being built.
+        :param cursor: largest node identifier that has been read.
+        :return: promise
+        """
+        translation_key = dict(json.loads(CypherFlags.TRANSLATION_KEY.default))
+        translation_key[str(NEO4J.id)] = 'node_id'
+        translation_key[str(SCHEMA.name)] = 'name'
+        translation_key[str(WGS_84.lat)] = 'lat'
+        translation_key[str(WGS_84.long)] = 'long'
+        translation_key[str(RDFS.seeAlso)] = 'seealso'
+
+        payload = StoragePayload()
+        payload.add_property(key=NEO4J.cypher, value=self.venue_index_query % (cursor, self.venue_index_page_size))
+        payload.add_flag(CypherFlags.TRANSLATION_KEY, json.dumps(translation_key))
+
+        return self._metrics.time_promise('storage_execute_cypher', self._storage_client.execute_cypher(payload)).then(
+            self._scheduler.generate_promise_handler(self._store_venue_index, index, cursor))
+
+    def _store_venue_index(self, result, index, cursor):
+        """
+        Add a page of venues to the search index, and read the next page.  The index replaces the current search index
+        once the last page has been read.
+        :param result: result collection of the venue index query.
+        :param index: index being built.
+        :param cursor: largest node identifier that had been read before the page.
+        :return: index, or promise resolved with the index when there are more pages.
+        """
+        last_cursor = cursor
 
-                if oauth.client_id == identifier and oauth.client_secret == client_secret:
-                    return
+        for res in result.results:
+            node_id = first_value(res.get_column(str(NEO4J.id)), int)
+            if node_id is not None:
+                cursor = max(cursor, node_id)
 
-            self._foursquare_client = foursquare.Foursquare(client_id=identifier,
-                                                            client_secret=client_secret)
+            see_also = res.get_column(SEE_ALSO)
+            if not isinstance(see_also, (list, tuple)):
+                see_also = [see_also] if see_also else []
 
-    def lookup_foursquare_content(self, node_uri, foursquare_identifier=None):
+            venue_identifier = get_foursquare_venue_from_urls(see_also)
+
+            if venue_identifier:
+                index.add(dict(id=venue_identifier,
+                               name=first_value(res.get_column(str(SCHEMA.name))),
+                               location=dict(lat=first_value(res.get_column(str(WGS_84.lat)), float),
+                                             lng=first_value(res.get_column(str(WGS_84.long)), float))))
+
+        if len(result.results) >= self.venue_index_page_size and cursor > last_cursor:
+            return self._read_venue_index_page(index, cursor)
+
+        logger.debug('Indexed %s stored venues' % len(index))
+        self._venue_index = index
+
+        return index
+
+    def lookup_foursquare_content(self, node_uri, foursquare_identifier=None, priority=MAINTENANCE, refresh=False,
+                                  create=False):
         """
-        Looks up the foursquare details of a venue.
+        Looks up the foursquare details of a venue, and publishes the updated node.
         :param node_uri: the uri of the node to look up.
         :param foursquare_identifier: the identifier of the foursquare data.  If this is not provided, the node will be
         fetched and the first seeAlso property from the node will be used as this parameter.
+        :param priority: priority of the foursquare request in the request scheduler.
+        :param refresh: fetch the details from foursquare even if they are cached.
+        :param create: publish the node as created rather than updated.
+        :return:
+        """
+        # A lookup that joins the one in flight for the node can still have the node published as created.
+        flags = self._node_flight.context(node_uri)
+        if flags is not None and create:
+            flags['create'] = True
+
+        return self._metrics.time_promise('venue_lookup', self._node_flight.do(
+            node_uri, self._lookup_foursquare_content, node_uri, foursquare_identifier, priority, refresh, create))
+
+    def _lookup_foursquare_content(self, node_uri, foursquare_identifier, priority, refresh, create):
+        """
+        Looks up the foursquare details of a venue, this should only be called by lookup_foursquare_content.
         :return:
         """
+        flags = self._node_flight.context(node_uri)
+        flags['create'] = create
+
         def update_venue_details(venue):
             # No point in continuing this exercise if certain requirements are not resolved.
             if not venue:
-                raise RuntimeError('Venue identifier is not defined')
+                raise VenueNotDefined('Venue identifier is not defined')
 
-            if not self._foursquare_client:
-                raise RuntimeError('Foursquare client is not defined')
+            cached_details = self._venue_cache.get(venue) if self._venue_cache and not refresh else None
+            if cached_details is not None:
+                logger.debug('Using cached venue: %s' % venue)
+                return store_venue_details(dict(venue=cached_details), venue, False,
+                                           self._seeded_payload(venue, cached_details))
 
-            # Finished checking requirements, fetch the details and update.
+            if not self._client_pool:
+                raise ClientNotConfigured('Foursquare client is not defined')
+
+            # Fail straight away rather than waiting on a request while foursquare is unavailable.
+            if self._circuit_breaker.wait_time():
+                raise CircuitOpen('Foursquare is unavailable')
+
+            # Finished checking requirements, fetch the details with the next batch and update.
             logger.debug('Looking up venue: %s' % venue)
-            venue_details = self._foursquare_client.venues(venue)
+            return self._venue_flight.do(venue, self._venue_batcher.submit, venue, priority).then(
+                self._scheduler.generate_promise_handler(cache_venue_details, venue)).then(
+                self._scheduler.generate_promise_handler(store_venue_details, venue))
+
+        def cache_venue_details(venue_details, venue):
+            if self._venue_cache and 'venue' in venue_details:
+                self._venue_cache.put(venue, venue_details['venue'])
 
-            # Translate the venue details into a rdf storage payload for sending to update.
+            return venue_details
+
+        def store_venue_details(venue_details, venue, fetched=True, storage_payload=None):
+            # Translate the venue details into a rdf storage payload for sending to update, unless they were
+            # translated when a search seeded them.
+            created = flags['create']
             if 'venue' in venue_details:
-                storage_payload = StoragePayload()
-                foursquare_to_storage(venue_details['venue'], storage_payload)
+                if storage_payload is None:
+                    storage_payload = StoragePayload()
+                    foursquare_to_storage(venue_details['venue'], storage_payload, self._translator)
                 storage_payload.about = node_uri
                 storage_payload.add_reference(DCTERMS.creator, self._representation_manager.representation_uri)
 
-                return self._storage_client.update_node(storage_payload)
+                self._venue_index.add(venue_details['venue'])
+
+                digest = storage_digest(storage_payload)
+
+                # Details served from the venue cache are as old as the cache entry, so only the details that were
+                # fetched from foursquare make the node fresh.
+                if self._freshness and fetched:
+                    self._freshness.touch(node_uri, venue)
+
+                # Compare with the properties of the node if they were read, otherwise with the content that was last
+                # written to it, so that unchanged venues are not written or published and changed venues only send
+                # the properties that differ.
+                previous_digest, previous_properties = self._freshness.content(node_uri) if self._freshness and \
+                    not created else (None, None)
+                if node['properties'] is not None:
+                    previous_properties = node['properties']
+                    previous_digest = None
+
+                if previous_digest == digest:
+                    changed = []
+                elif previous_properties is not None:
+                    changed = storage_differences(storage_payload, previous_properties)
+                else:
+                    changed = None
+
+                if changed is not None and not changed and not created:
+                    logger.debug('Venue is unchanged: %s' % venue)
+                    self._metrics.increment('venue_unchanged')
+                    return None
+
+                if changed:
+                    update_payload = self._difference_payload(storage_payload, changed, previous_properties)
+                else:
+                    update_payload = storage_payload
+
+                return self._write_buffer.update_node(update_payload, created=created).then(
+                    self._scheduler.generate_promise_handler(venue_updated, venue, digest,
+                                                             normalize_properties(storage_payload)))
+
+        def venue_updated(result, venue, digest, properties):
+            if self._freshness:
+                self._freshness.record(node_uri, venue, digest, properties)
+
+            self.xmpp.event(VENUE_UPDATED, dict(node=node_uri, venue=venue))
+            return result
+
+        def handle_node(result):
+            node['properties'] = result.properties
+            return self._handle_get_node(result)
+
+        node = dict(properties=None)
 
         # Attempt to look up the venue id from the details in the node.
         if foursquare_identifier is None:
             search_payload = StoragePayload()
             search_payload.about = node_uri
-            promise = self._storage_client.get_node(search_payload).then(self._handle_get_node)
+            promise = self._metrics.time_promise('storage_get_node', self._storage_client.get_node(
+                search_payload)).then(handle_node)
         else:
             promise = self._scheduler.promise()
             venue_identifier = get_foursquare_venue_from_url(foursquare_identifier)
@@ -92,60 +658,280 @@ class FoursquareLookup(base_plugin):
 
         return promise
 
+    def _fetch_venues(self, venue_ids, priority):
+        """
+        Fetch a batch of venues when the quota allows.
+        :param venue_ids: list of venue identifiers.
+        :param priority: priority of the request.
+        :return: promise resolved with the list of venue responses.
+        """
+        return self._request_scheduler.submit(priority, self._execute_venues, venue_ids)
+
+    def _execute_venues(self, venue_ids):
+        """
+        Request the details of the venues, using the multi endpoint to fetch up to five venues in a single request.
+        :param venue_ids: list of venue identifiers.
+        :return: list of venue responses or exceptions, in the same order as the identifiers.
+        """
+        return self._client_pool.call(lambda client: self._request_venues(client, venue_ids))
+
+    @staticmethod
+    def _request_venues(client, venue_ids):
+        """
+        Request the details of the venues with a client of the pool.
+        :param client: foursquare client.
+        :param venue_ids: list of venue identifiers.
+        :return: list of venue responses or exceptions.
+        """
+        if len(venue_ids) == 1:
+            return [client.venues(venue_ids[0])]
+
+        return client.multi_venues(venue_ids)
+
+    @staticmethod
+    def _difference_payload(payload, keys, properties):
+        """
+        Copy a storage payload, only keeping the properties that have changed.  The seeAlso links that the node
+        already has are kept along with the missing foursquare link, as update replaces all of the values.
+        :param payload: storage payload.
+        :param keys: list of the property uris to keep.
+        :param properties: dictionary of property uri to the value or values of the node.
+        :return: storage payload.
+        """
+        difference = StoragePayload()
+        difference.about = payload.about
+
+        for rdf_type in payload.types:
+            difference.add_type(rdf_type)
+
+        for key in keys:
+            values = payload.properties[key]
+            if key == SEE_ALSO:
+                values = normalize_values(list(values) + normalize_values(properties.get(key, None)))
+
+            for value in values:
+                difference.add_property(key, value)
+
+        for key, values in payload.references.items():
+            for value in values:
+                difference.add_reference(key, value)
+
+        return difference
+
     def _handle_get_node(self, result):
-        venue = None
-        for see_also in result.properties.get(str(RDFS.seeAlso), []):
-            venue = get_foursquare_venue_from_url(see_also)
-            if venue:
-                break
-        return venue
+        return get_foursquare_venue_from_urls(result.properties.get(SEE_ALSO, None))
 
-    def schedule_lookup(self, node_uri, foursquare_identifier=None, create=False):
+    def schedule_lookup(self, node_uri, foursquare_identifier=None, create=False, refresh=False, queued=False,
+                        priority=None):
         """
         Schedule a lookup on the node to be executed later.
         :param node_uri: uri to look up.
-        :return:
+        :param create: the node was just created, so the lookup takes priority over maintenance and the node is
+        published as created.
+        :param refresh: ignore the cached venue details.
+        :param queued: the node was taken from the work queue.
+        :param priority: priority of the lookup and its foursquare request, defaults to the provider priority for
+        created nodes.  Interactive creates should use the interactive priority, so that they are run first.
+        :return: promise, rejected with LookupQueueFull when the lookup pool could not queue the lookup.
         """
+        if priority is None:
+            priority = PROVIDER if create else MAINTENANCE
+        promise = self._lookup_pool.submit(priority, self.lookup_foursquare_content, node_uri, foursquare_identifier,
+                                           priority, refresh, create)
 
-        promise = self._scheduler.defer(self.lookup_foursquare_content, node_uri, foursquare_identifier)
+        work_queue = self._work_queue
+        if work_queue and (create or queued):
+            # Keep the node in the work queue until the lookup succeeds, if it fails the maintainer will retry it.
+            work_queue.put(node_uri, created=create, leased=True)
+            promise.then(lambda result: work_queue.complete(node_uri),
+                         lambda error: self._release_work(work_queue, node_uri, error))
 
-        if create:
-            return promise.then(self._publish_create)
-        else:
-            return promise.then(self._publish_update)
+        return promise
 
-    def _publish_update(self, result):
+    def _release_work(self, work_queue, node_uri, error):
         """
-        Publish the update information to the channel.
-        :param result: result collection
+        Return a node whose lookup failed to the work queue.  Nodes that can never be looked up are parked, and lookups
+        that could not be run are retried without counting against the node.
+        :param work_queue: work queue the node was recorded in.
+        :param node_uri: uri of the node.
+        :param error: error the lookup was rejected with.
         :return:
         """
-        self._rdf_publish.publish_all_results(result, created=False)
+        if isinstance(error, (VenueNotDefined, foursquare.ParamError)):
+            work_queue.park(node_uri)
+        else:
+            work_queue.release(node_uri, failed=not (isinstance(error, UNAVAILABLE_ERRORS) or is_outage(error)))
 
-    def _publish_create(self, result):
+    def search_foursquare(self, near, query=None, limit=10):
         """
-        Publish the update information to the channel.
-        :param result: result collection
-        :return:
+        Search foursquare, answering from the venues that are already stored when enough of them match.
+        :param near: near a location
+        :param query: query to search for.
+        :param limit: maximum number of venues to return.
+        :return: list of id, name dictionaries.
+        """
+        key = search_key(near, query, limit)
+
+        venues = self._search_cache.get(key)
+        if venues is None:
+            local_venues = self._search_local(key[0], query, limit)
+
+            if len(local_venues) >= min(limit, self.local_search_min_results):
+                logger.debug('Answering search from %s stored venues' % len(local_venues))
+                self._metrics.increment('local_searches')
+                venues = local_venues
+            else:
+                # Identical searches that are made while this one is in flight will share the result.
+                try:
+                    remote_venues = self._search_flight.do(key, self._search_foursquare, near, query, limit)
+                except Exception as e:
+                    if not isinstance(e, CircuitOpen) and not is_outage(e):
+                        raise
+                    return self._degraded_search(key, local_venues, e)
+
+                venues = self._merge_venues(local_venues, remote_venues, limit)
+
+            self._search_cache.put(key, venues)
+
+        return venues
+
+    def _degraded_search(self, key, local_venues, error):
         """
-        self._rdf_publish.publish_all_results(result, created=True)
+        Answer a search while foursquare is unavailable, with the expired results of the same search if there are any
+        and otherwise with the venues found in the index of stored venues.  The answer is not cached, so the search
+        is made again once foursquare is available.
+        :param key: normalized search key.
+        :param local_venues: venues found in the index of stored venues.
+        :param error: error of the foursquare search.
+        :return: list of venue dictionaries.
+        """
+        self._metrics.increment('degraded_searches')
+
+        venues = self._search_cache.get(key, count=False, stale=True)
+        if venues is not None:
+            logger.warning('Foursquare is unavailable (%s), answering search with expired results' % error)
+            return venues
+
+        logger.warning('Foursquare is unavailable (%s), answering search with %s stored venues' %
+                       (error, len(local_venues)))
+        return local_venues
 
-    def search_foursquare(self, near, query=None):
+    def _search_local(self, near, query, limit):
         """
-        Search foursquare.
-        :param near: near a location
+        Search the index of the stored venues.  The index can only be used for locations that foursquare has geocoded
+        for a previous search.
+        :param near: normalized location.
         :param query: query to search for.
-        :return: list of id, name dictionaries.
+        :param limit: maximum number of venues to return.
+        :return: list of venue dictionaries.
         """
-        parameters = dict(near=near, limit=10)
+        center = self._near_centers.get(near)
+        if center is None:
+            return []
+
+        return self._venue_index.search(query, center[0], center[1], radius=self.local_search_radius, limit=limit)
+
+    @staticmethod
+    def _merge_venues(local_venues, remote_venues, limit):
+        """
+        Merge the local and remote results, removing the remote venues that were also found locally.
+        :return: list of venue dictionaries.
+        """
+        local_identifiers = set(venue['id'] for venue in local_venues)
+        venues = local_venues + [venue for venue in remote_venues if venue['id'] not in local_identifiers]
+
+        return venues[:limit]
+
+    def _search_foursquare(self, near, query, limit):
+        """
+        Execute the search against foursquare, and cache the results.
+        :return: list of venue dictionaries.
+        """
+        parameters = dict(near=near, limit=limit)
         if query:
             parameters['query'] = query
 
-        venue_results = self._foursquare_client.venues.search(parameters)
+        if not self._client_pool:
+            raise ClientNotConfigured('Foursquare client is not defined')
+
+        # Interactive searches are executed straight away, using the quota reserved for them, but on the worker pool
+        # so that the command handler will only wait for the request timeout.
+        with self._metrics.timer('foursquare_search'):
+            venue_results = self._request_scheduler.execute(self._call_request, self._client_pool.call,
+                                                            lambda client: client.venues.search(parameters))
 
         logger.debug('venue_results: %s' % venue_results['venues'])
 
-        return venue_results['venues']
+        venues = venue_results['venues']
+
+        # Remember where foursquare placed the location, so that the local index can be used for it.
+        center = venue_results.get('geocode', {}).get('feature', {}).get('geometry', {}).get('center', None)
+        if center and 'lat' in center and 'lng' in center:
+            self._near_centers.put(search_key(near)[0], (center['lat'], center['lng']))
+
+        self._seed_venue_cache(venues)
+
+        return venues
+
+    def search_area(self, latitude, longitude, radius, query=None, limit=50):
+        """
+        Search for the venues around a point as background work, paced by the request scheduler.
+        :param latitude: latitude of the point.
+        :param longitude: longitude of the point.
+        :param radius: radius of the search in meters.
+        :param query: optional query to search for.
+        :param limit: maximum number of venues.
+        :return: promise resolved with the list of venue dictionaries.
+        """
+        parameters = dict(ll='%s,%s' % (latitude, longitude), radius=int(radius), limit=limit, intent='browse')
+        if query:
+            parameters['query'] = query
+
+        if self._circuit_breaker.wait_time():
+            promise = self._scheduler.promise()
+            promise.rejected(CircuitOpen('Foursquare is unavailable'))
+            return promise
+
+        return self._request_scheduler.submit(MAINTENANCE, self._execute_search, parameters)
+
+    def _execute_search(self, parameters):
+        """
+        Execute a venue search on a worker thread.
+        :param parameters: search parameters.
+        :return: list of venue dictionaries.
+        """
+        venues = self._client_pool.call(lambda client: client.venues.search(parameters))['venues']
+        self._seed_venue_cache(venues)
+
+        return venues
+
+    def _seed_venue_cache(self, venues):
+        """
+        The search results contain the details that are stored for a venue, so seed the details cache with them.  The
+        results are translated in one pass, so that the lookups of the venues do not translate them again.
+        :param venues: list of venue dictionaries.
+        :return:
+        """
+        if self._venue_cache:
+            for venue, payload in zip(venues, self._translator.translate_all(venues, StoragePayload)):
+                self._venue_cache.add(venue['id'], venue)
+                self._search_payloads.put(venue['id'], (venue, payload))
+
+    def _seeded_payload(self, venue, details):
+        """
+        Take the translation of a venue that was seeded by a search.  A payload is only used once, as the lookup adds
+        the node to it.
+        :param venue: venue identifier.
+        :param details: cached details of the venue.
+        :return: storage payload, or None if the cached details are not the ones that were seeded.
+        """
+        seeded = self._search_payloads.get(venue, count=False)
+        if seeded is None:
+            return None
+
+        self._search_payloads.invalidate(venue)
+        seeded_details, payload = seeded
+        return payload if seeded_details == details else None
 
 
 foursquare_lookup = FoursquareLookup
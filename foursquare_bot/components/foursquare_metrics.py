@@ -0,0 +1,69 @@
+"""
+Plugin that owns the metrics registry of the bot, and periodically dumps the metrics to a file in the prometheus text
+format so that they can be collected by the node exporter text file collector.
+"""
+from sleekxmpp.plugins.base import base_plugin
+from rhobot.components.configuration import BotConfiguration
+from foursquare_bot.components.configuration_enums import METRICS_ENABLED_KEY, METRICS_DUMP_PATH_KEY, \
+    METRICS_DUMP_INTERVAL_KEY
+from foursquare_bot.components.metrics import MetricsRegistry
+from foursquare_bot.components.utilities import get_configuration_value, parse_boolean
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class FoursquareMetrics(base_plugin):
+    name = 'foursquare_metrics'
+    description = 'Foursquare Metrics'
+    dependencies = {'rho_bot_scheduler', 'rho_bot_configuration', }
+
+    dump_interval = 60.0
+
+    def plugin_init(self):
+        self.registry = MetricsRegistry()
+        self._dump_scheduled = False
+        self.xmpp.add_event_handler(BotConfiguration.CONFIGURATION_RECEIVED_EVENT, self._configuration_updated)
+
+    def post_init(self):
+        super(FoursquareMetrics, self).post_init()
+
+        self._scheduler = self.xmpp['rho_bot_scheduler']
+        self._configuration = self.xmpp['rho_bot_configuration']
+
+    def _configuration_updated(self, event):
+        """
+        Enable or disable the collection of metrics, and start dumping them if a dump file is configured.
+        :param event:
+        :return:
+        """
+        enabled = get_configuration_value(self._configuration, METRICS_ENABLED_KEY, False, parse_boolean)
+        if enabled != self.registry.enabled:
+            logger.info('Metrics %s' % ('enabled' if enabled else 'disabled'))
+            self.registry.enabled = enabled
+
+        if not self._dump_scheduled and self._configuration.get_value(METRICS_DUMP_PATH_KEY, None):
+            self._dump_scheduled = True
+            self._scheduler.schedule_task(self.dump, delay=get_configuration_value(
+                self._configuration, METRICS_DUMP_INTERVAL_KEY, self.dump_interval, float), repeat=True)
+
+    def dump(self):
+        """
+        Write the metrics to the dump file, replacing the file so that readers never see a partial dump.
+        :return:
+        """
+        path = self._configuration.get_value(METRICS_DUMP_PATH_KEY, None)
+        if not path or not self.registry.enabled:
+            return
+
+        temporary_path = '%s.tmp' % path
+        try:
+            with open(temporary_path, 'w') as dump_file:
+                dump_file.write(self.registry.render())
+            os.rename(temporary_path, path)
+        except (IOError, OSError) as e:
+            logger.error('Unable to write metrics to %s: %s' % (path, e))
+
+
+foursquare_metrics = FoursquareMetrics
@@ -0,0 +1,142 @@
+"""
+Record of when the foursquare details of each node were last fetched, of the content that was written to it, and of the
+refreshes that have been spent from the daily budget.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+
+class FreshnessStore(object):
+    """
+    Last fetched time of the venue details of each node, and a digest and copy of the properties that were last written
+    to the node, stored in a sqlite database.  The number of venues refreshed each day is stored with them, so that the
+    daily refresh budget is not reset by a restart.
+    """
+
+    def __init__(self, path, clock=time.time):
+        """
+        :param path: path to the sqlite database.
+        :param clock: time source.
+        """
+        self.path = path
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS freshness '
+                                 '(node_uri TEXT PRIMARY KEY, venue_id TEXT, fetched REAL NOT NULL, digest TEXT, '
+                                 'properties TEXT)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS budget (day INTEGER PRIMARY KEY, spent INTEGER NOT NULL)')
+
+        # Databases created before the content was recorded are missing the content columns.
+        columns = [row[1] for row in self._connection.execute('PRAGMA table_info(freshness)')]
+        for column in ('digest', 'properties'):
+            if column not in columns:
+                self._connection.execute('ALTER TABLE freshness ADD COLUMN %s TEXT' % column)
+
+        self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT count(*) FROM freshness').fetchone()[0]
+
+    def touch(self, node_uri, venue_id, fetched=None):
+        """
+        Record that the details of a node have been fetched.
+        :param node_uri: uri of the node.
+        :param venue_id: venue identifier of the node.
+        :param fetched: time the details were fetched, defaults to now.
+        :return:
+        """
+        fetched = self._clock() if fetched is None else fetched
+
+        with self._lock:
+            self._connection.execute('INSERT OR IGNORE INTO freshness (node_uri, venue_id, fetched) VALUES (?, ?, ?)',
+                                     (node_uri, venue_id, fetched))
+            self._connection.execute('UPDATE freshness SET venue_id = ?, fetched = ? WHERE node_uri = ?',
+                                     (venue_id, fetched, node_uri))
+            self._connection.commit()
+
+    def record(self, node_uri, venue_id, digest, properties):
+        """
+        Record the content that has been written to a node.  This does not make the node fresh, a node that has not been
+        touched is recorded as never fetched.
+        :param node_uri: uri of the node.
+        :param venue_id: venue identifier of the node.
+        :param digest: digest of the properties.
+        :param properties: dictionary of property uri to the list of values.
+        :return:
+        """
+        with self._lock:
+            self._connection.execute('INSERT OR IGNORE INTO freshness (node_uri, venue_id, fetched) VALUES (?, ?, ?)',
+                                     (node_uri, venue_id, 0.0))
+            self._connection.execute('UPDATE freshness SET digest = ?, properties = ? WHERE node_uri = ?',
+                                     (digest, json.dumps(properties), node_uri))
+            self._connection.commit()
+
+    def content(self, node_uri):
+        """
+        Fetch the content that was last written to a node.
+        :param node_uri: uri of the node.
+        :return: tuple of the digest and the dictionary of properties, (None, None) if nothing has been recorded.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT digest, properties FROM freshness WHERE node_uri = ?',
+                                           (node_uri, )).fetchone()
+
+        if not row or row[0] is None:
+            return None, None
+
+        return row[0], json.loads(row[1])
+
+    def fetched(self, node_uris):
+        """
+        Fetch the last fetched times of nodes.
+        :param node_uris: list of node uris.
+        :return: dictionary of node uri to the time it was last fetched, nodes that have never been fetched are missing.
+        """
+        node_uris = list(node_uris)
+        result = dict()
+
+        with self._lock:
+            # Stay below the sqlite limit on the number of parameters of a statement.
+            for start in xrange(0, len(node_uris), 500):
+                chunk = node_uris[start:start + 500]
+                rows = self._connection.execute('SELECT node_uri, fetched FROM freshness WHERE node_uri IN (%s)' %
+                                                ', '.join('?' * len(chunk)), chunk).fetchall()
+                result.update(rows)
+
+        return result
+
+    def spent(self):
+        """
+        Number of venues that have been refreshed today.
+        :return:
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT spent FROM budget WHERE day = ?', (self._day(), )).fetchone()
+
+        return row[0] if row else 0
+
+    def spend(self, count):
+        """
+        Record that venues have been refreshed today, forgetting the earlier days.
+        :param count: number of venues.
+        :return:
+        """
+        day = self._day()
+
+        with self._lock:
+            self._connection.execute('DELETE FROM budget WHERE day < ?', (day, ))
+            self._connection.execute('INSERT OR IGNORE INTO budget (day, spent) VALUES (?, ?)', (day, 0))
+            self._connection.execute('UPDATE budget SET spent = spent + ? WHERE day = ?', (count, day))
+            self._connection.commit()
+
+    def _day(self):
+        return int(self._clock() // 86400)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -7,6 +7,8 @@ from rhobot.components.storage.enums import FindFlags, FindResults
 from rhobot.components.storage.client import StoragePayload
 from rhobot.namespace import WGS_84
 from foursquare_bot.components.utilities import get_foursquare_venue
+from foursquare_bot.components.cache import LRUCache
+from foursquare_bot.components.events import VENUE_UPDATED, VENUE_NODE_CREATED
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,19 +19,34 @@ class KnowledgeProvider(base_plugin):
     description = 'Knowledge Provider'
     dependencies = {'rho_bot_storage_client',
                     'rho_bot_rdf_publish',
-                    'foursquare_lookup', }
+                    'rho_bot_scheduler',
+                    'foursquare_lookup',
+                    'foursquare_metrics', }
 
     type_requirements = {str(WGS_84.SpatialThing), }
 
+    # Number of venues whose storage results are kept in memory, and for how many seconds, as nodes can be removed or
+    # merged by other bots without this bot being told.
+    node_cache_size = 5000
+    node_cache_ttl = 300.0
+
     def plugin_init(self):
-        pass
+        self._node_cache = LRUCache(max_size=self.node_cache_size, ttl=self.node_cache_ttl)
+        self.xmpp.add_event_handler(VENUE_UPDATED, self._venue_updated)
 
     def post_init(self):
         super(KnowledgeProvider, self).post_init()
 
         self._storage_client = self.xmpp['rho_bot_storage_client']
         self._rdf_publish = self.xmpp['rho_bot_rdf_publish']
+        self._scheduler = self.xmpp['rho_bot_scheduler']
         self._foursquare_lookup = self.xmpp['foursquare_lookup']
+        self._metrics = self.xmpp['foursquare_metrics'].registry
+
+        self._metrics.gauge('node_cache_hits', lambda: self._node_cache.hits)
+        self._metrics.gauge('node_cache_misses', lambda: self._node_cache.misses)
+        self._metrics.gauge('node_cache_hit_rate', lambda: self._node_cache.hit_rate)
+        self._metrics.gauge('node_cache_size', lambda: len(self._node_cache))
 
         self._rdf_publish.add_request_handler(self._rdf_request_message)
 
@@ -47,16 +64,28 @@ class KnowledgeProvider(base_plugin):
             venue = get_foursquare_venue(payload)
 
             if venue:
+                # Venues that are already known to exist in storage can be answered without asking storage again.
+                result = self._node_cache.get(venue)
+                if result is not None:
+                    logger.debug('Node cache hit for venue: %s (hit rate: %.2f)' % (venue, self._node_cache.hit_rate))
+
+                    promise = self._scheduler.promise()
+                    promise.resolved(self._rdf_publish.create_rdf(mtype=RDFStanzaType.SEARCH_RESPONSE, payload=result))
+                    return promise
+
                 payload.add_flag(FindFlags.CREATE_IF_MISSING, True)
-                promise = self._storage_client.find_nodes(payload).then(self._handle_results)
+                promise = self._metrics.time_promise('storage_find_nodes', self._storage_client.find_nodes(payload))
+                promise = promise.then(self._scheduler.generate_promise_handler(self._handle_results, venue))
 
                 return promise
 
         return None
 
-    def _handle_results(self, result):
+    def _handle_results(self, result, venue=None):
         if len(result.results):
 
+            created = False
+
             # If the node was created, then publish it to the channel, and then send it to the foursquare
             # lookup for updating.
             for res in result.results:
@@ -64,8 +93,15 @@ class KnowledgeProvider(base_plugin):
                 # if the node was created need to mark it as being created by this bot, and notify all of listeners
                 # that this node was created.
                 if FindResults.CREATED.fetch_from(res.flags):
+                    created = True
+
                     # Lookup the details
                     self._foursquare_lookup.schedule_lookup(res.about, create=True)
+                    self.xmpp.event(VENUE_NODE_CREATED, dict(node=res.about, venue=venue))
+
+            # Only results that found existing nodes are cached, so that cached responses never report a creation.
+            if venue and not created:
+                self._node_cache.put(venue, result)
 
             rdf_data = self._rdf_publish.create_rdf(mtype=RDFStanzaType.SEARCH_RESPONSE, payload=result)
 
@@ -73,4 +109,13 @@ class KnowledgeProvider(base_plugin):
 
         return None
 
+    def _venue_updated(self, event):
+        """
+        Remove the cached storage results of a venue when its node has been updated.
+        :param event: dictionary containing the venue identifier.
+        :return:
+        """
+        self._node_cache.invalidate(event.get('venue', None))
+
+
 knowledge_provider = KnowledgeProvider
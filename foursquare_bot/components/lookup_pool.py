@@ -0,0 +1,143 @@
+"""
+Bounded pool of venue lookups, so that bursts of created nodes or maintenance work do not flood the scheduler.
+"""
+from foursquare_bot.components.metrics import MetricsRegistry
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Policies applied when a lookup is submitted to a full queue.
+REJECT_NEW = 'reject_new'
+SHED_LOWEST = 'shed_lowest'
+
+OVERFLOW_POLICIES = (REJECT_NEW, SHED_LOWEST)
+
+
+class LookupQueueFull(RuntimeError):
+    """
+    Raised when a lookup is not run because the queue of the lookup pool is full.
+    """
+    pass
+
+
+class LookupPool(object):
+    """
+    Runs at most max_in_flight lookups at a time, queueing the rest in priority order.  The queue is bounded, when it
+    is full the overflow policy either rejects the new lookup, or sheds the most recently queued lookup of the lowest
+    priority if it is of a lower priority than the new lookup.
+    """
+
+    def __init__(self, scheduler, max_in_flight=20, max_queued=1000, overflow=SHED_LOWEST, clock=time.time,
+                 metrics=None):
+        """
+        :param scheduler: rho_bot_scheduler used to create promises and start the lookups.
+        :param max_in_flight: maximum number of lookups running at the same time.
+        :param max_queued: maximum number of lookups waiting to run.
+        :param overflow: policy applied when the queue is full.
+        :param clock: time source.
+        :param metrics: metrics registry.
+        """
+        self._scheduler = scheduler
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.overflow = overflow
+        self._clock = clock
+        self._metrics = metrics or MetricsRegistry()
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+
+        self.rejected = 0
+        self.shed = 0
+
+    @property
+    def queue_length(self):
+        return len(self._queue)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def queued_by_priority(self):
+        """
+        Number of queued lookups of each priority.
+        :return: dictionary of priority to count.
+        """
+        counts = dict()
+        for entry in self._queue:
+            counts[entry[0]] = counts.get(entry[0], 0) + 1
+
+        return counts
+
+    def submit(self, priority, method, *args):
+        """
+        Run a lookup when there is room for it.
+        :param priority: priority of the lookup, lower values are run first.
+        :param method: method starting the lookup and returning a promise.
+        :param args: arguments to the method.
+        :return: promise resolved with the result of the lookup, rejected with LookupQueueFull if it was not run.
+        """
+        promise = self._scheduler.promise()
+
+        if self._in_flight < self.max_in_flight and not self._queue:
+            self._start(method, args, promise, self._clock())
+            return promise
+
+        if len(self._queue) >= self.max_queued and not self._make_room(priority):
+            self.rejected += 1
+            self._metrics.increment('lookup_rejected')
+            promise.rejected(LookupQueueFull('Lookup queue is full'))
+            return promise
+
+        heapq.heappush(self._queue, (priority, next(self._sequence), self._clock(), method, args, promise))
+        return promise
+
+    def _make_room(self, priority):
+        """
+        Apply the overflow policy to a full queue.
+        :param priority: priority of the lookup being submitted.
+        :return: True if a queued lookup was shed to make room for the new lookup.
+        """
+        if self.overflow != SHED_LOWEST:
+            return False
+
+        # The lowest priority lookup that was queued last is the one that is shed.
+        victim = max(self._queue, key=lambda entry: (entry[0], entry[1]))
+        if victim[0] <= priority:
+            return False
+
+        self._queue.remove(victim)
+        heapq.heapify(self._queue)
+
+        self.shed += 1
+        self._metrics.increment('lookup_shed')
+        victim[5].rejected(LookupQueueFull('Lookup was shed from a full queue'))
+
+        return True
+
+    def _start(self, method, args, promise, enqueued):
+        self._in_flight += 1
+        self._metrics.observe('lookup_queue_wait', self._clock() - enqueued)
+
+        self._scheduler.defer(method, *args).then(self._finished(promise, True), self._finished(promise, False))
+
+    def _finished(self, promise, resolved):
+        def handler(result):
+            self._in_flight -= 1
+            self._dispatch()
+
+            if resolved:
+                promise.resolved(result)
+            else:
+                promise.rejected(result)
+
+        return handler
+
+    def _dispatch(self):
+        while self._queue and self._in_flight < self.max_in_flight:
+            _, _, enqueued, method, args, promise = heapq.heappop(self._queue)
+            self._start(method, args, promise, enqueued)
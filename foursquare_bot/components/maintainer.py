@@ -5,13 +5,60 @@ from sleekxmpp.plugins.base import base_plugin
 from rhobot.components.configuration import BotConfiguration
 from rhobot.namespace import WGS_84, SCHEMA
 from rhobot.components.storage import StoragePayload
+from rhobot.components.storage.enums import CypherFlags
 from rhobot.components.storage.namespace import NEO4J
 from rdflib.namespace import RDFS
+from foursquare_bot.components.configuration_enums import MAINTAINER_PAGE_SIZE_KEY, MAINTAINER_CONCURRENCY_KEY
+from foursquare_bot.components.events import OAUTH_DETAILS_UPDATED, VENUE_NODE_CREATED
+from foursquare_bot.components.foursquare_client import ClientNotConfigured
+from foursquare_bot.components.circuit_breaker import CircuitOpen
+from foursquare_bot.components.write_buffer import WriteBufferFull
+from foursquare_bot.components.request_scheduler import QuotaExhausted
+from foursquare_bot.components.utilities import get_configuration_value
+import foursquare
+import json
 import logging
+import random
+import time
 
 
 logger = logging.getLogger(__name__)
 
+# Reasons that a pass over the work nodes did not complete.
+NO_WORK = 'no_work'
+CLIENT_MISSING = 'client_missing'
+QUOTA = 'quota'
+OUTAGE = 'outage'
+STORAGE_BUSY = 'storage_busy'
+FAILURE = 'failure'
+
+
+class NoWork(Exception):
+    """
+    Raised when there are no unpopulated nodes to work on.
+    """
+    pass
+
+
+def failure_cause(error):
+    """
+    Determine why a pass over the work nodes failed.
+    :param error: error that the pass was rejected with.
+    :return: one of NO_WORK, CLIENT_MISSING, QUOTA, OUTAGE, STORAGE_BUSY or FAILURE.
+    """
+    if isinstance(error, NoWork):
+        return NO_WORK
+    if isinstance(error, ClientNotConfigured):
+        return CLIENT_MISSING
+    if isinstance(error, (QuotaExhausted, foursquare.RateLimitExceeded)):
+        return QUOTA
+    if isinstance(error, CircuitOpen):
+        return OUTAGE
+    if isinstance(error, WriteBufferFull):
+        return STORAGE_BUSY
+
+    return FAILURE
+
 
 class KnowledgeMaintainer(base_plugin):
     name = 'knowledge_maintainer'
@@ -19,16 +66,40 @@ class KnowledgeMaintainer(base_plugin):
     dependencies = {'rho_bot_storage_client',
                     'rho_bot_rdf_publish',
                     'rho_bot_scheduler',
-                    'foursquare_lookup', }
+                    'rho_bot_configuration',
+                    'foursquare_lookup',
+                    'foursquare_metrics', }
 
     work_to_do_delay = 1.0
     no_work_delay = 600.0
 
+    # Delay used while storage is behind on the buffered venue writes.
+    storage_busy_delay = 5.0
+
+    # Delay used when a full page was worked and there is quota available, as there is more of the backlog waiting.
+    backlog_delay = 0.0
+
+    # Exponential backoff after failures, the delay is doubled with each consecutive failure up to the maximum, and
+    # a random jitter of up to half of the delay is removed so that retries are spread out.
+    failure_delay = 5.0
+    max_failure_delay = 600.0
+
+    # Work is taken from the work queue, the cypher scan for unpopulated nodes is only run to reconcile the queue with
+    # storage, to find the nodes that were created while the bot was not running or by other bots.
+    reconciliation_interval = 21600.0
+
+    # Number of nodes worked per pass, and how many of them may be looked up at the same time.
+    page_size = 50
+    max_concurrent_lookups = 5
+
+    # Keyset pagination over the node identifier, so that nodes that could not be populated are not scanned again
+    # until the end of the backlog has been reached.
     query = """MATCH (n:`%s`)
                    WHERE any(seealso IN n.`%s` WHERE seealso =~ '^foursquare:.*')
-                   and not(has(n.`%s`)) RETURN n as node LIMIT 1""" % (str(WGS_84.SpatialThing),
-                                                                       str(RDFS.seeAlso),
-                                                                       str(SCHEMA.name))
+                   and not(has(n.`%s`)) and id(n) > %%d
+                   RETURN n as node, id(n) as node_id ORDER BY node_id LIMIT %%d""" % (str(WGS_84.SpatialThing),
+                                                                                       str(RDFS.seeAlso),
+                                                                                       str(SCHEMA.name))
 
     def plugin_init(self):
         """
@@ -36,15 +107,36 @@ class KnowledgeMaintainer(base_plugin):
         :return:
         """
         self.xmpp.add_event_handler(BotConfiguration.CONFIGURATION_RECEIVED_EVENT, self._configuration_updated)
+        self.xmpp.add_event_handler(OAUTH_DETAILS_UPDATED, self._client_updated)
+        self.xmpp.add_event_handler(VENUE_NODE_CREATED, self._node_created)
         self.query = ' '.join(self.query.replace('\n', ' ').replace('\r', '').split())
 
+        translation_key = dict(json.loads(CypherFlags.TRANSLATION_KEY.default))
+        translation_key[str(NEO4J.id)] = 'node_id'
+        self._translation_key = json.dumps(translation_key)
+
+        self._cursor = -1
+        self._reconciled = None
+
+        # State of the work loop: only the most recently scheduled pass is started, so that a sleeping loop can be
+        # woken up by scheduling a new pass.  The cause of the sleep is kept, so that only an idle loop is woken.
+        self._started = False
+        self._running = False
+        self._generation = 0
+        self._next_run = None
+        self._sleep_cause = None
+        self._wake_requested = False
+        self._failures = 0
+
     def post_init(self):
         super(KnowledgeMaintainer, self).post_init()
 
         self._storage_client = self.xmpp['rho_bot_storage_client']
         self._rdf_publish = self.xmpp['rho_bot_rdf_publish']
         self._scheduler = self.xmpp['rho_bot_scheduler']
+        self._configuration = self.xmpp['rho_bot_configuration']
         self._foursquare_lookup = self.xmpp['foursquare_lookup']
+        self._metrics = self.xmpp['foursquare_metrics'].registry
 
     def _configuration_updated(self, event):
         """
@@ -52,24 +144,68 @@ class KnowledgeMaintainer(base_plugin):
         :param event:
         :return:
         """
-        self._scheduler.schedule_task(self._start_process, delay=self.work_to_do_delay)
+        self._started = True
+        self._reschedule(None, self.work_to_do_delay)
 
         # After the configuration has been received, remove the listener so that the process isn't started each time.
         self.xmpp.del_event_handler(BotConfiguration.CONFIGURATION_RECEIVED_EVENT, self._configuration_updated)
 
-    def _start_process(self):
+    def _client_updated(self, event):
+        """
+        The client details have been changed, so forget the previous failures and start working again.
+        :param event:
+        :return:
+        """
+        self._failures = 0
+        self._wake()
+
+    def _node_created(self, event):
+        """
+        A node was created and queued, so an idle loop should sleep no longer than until the queued node is available.
+        Loops that are sleeping because of a failure, the quota or an outage are left to sleep.
+        :param event:
+        :return:
+        """
+        if not self._started or self._running or self._sleep_cause != NO_WORK:
+            return
+
+        delay = self._idle_delay()
+        if self._next_run is None or time.time() + delay < self._next_run:
+            self._reschedule(None, delay, NO_WORK)
+
+    def _wake(self):
+        """
+        Start the next pass soon if the loop is sleeping, rather than waiting for the rest of its delay.
+        :return:
+        """
+        if not self._started:
+            return
+
+        if self._running:
+            self._wake_requested = True
+        elif self._next_run is None or self._next_run - time.time() > self.work_to_do_delay:
+            logger.debug('Waking the maintainer')
+            self._reschedule(None, self.work_to_do_delay)
+
+    def _start_process(self, generation=None):
         """
         Start the process of updating unpopulated foursquare references.
+        :param generation: generation of the scheduled pass, passes that have been replaced are ignored.
         :return:
         """
+        if generation is not None and generation != self._generation:
+            return
+
+        self._running = True
+        self._wake_requested = False
+        self._next_run = None
+        self._sleep_cause = None
+
         promise = self._scheduler.defer(self._create_session)
-        promise = promise.then(self._find_work_node)
-        promise = promise.then(self._work_node)
+        promise = promise.then(self._find_work_nodes)
+        promise = promise.then(self._work_nodes)
 
-        # If the promise has been resolved, then should check to see if there are new values to populate using the
-        # work_to_do_delay, otherwise use the no_work_delay
-        promise.then(self._scheduler.generate_promise_handler(self._reschedule, self.work_to_do_delay),
-                     self._scheduler.generate_promise_handler(self._reschedule, self.no_work_delay))
+        promise.then(self._work_finished, self._work_failed)
 
     def _create_session(self):
         """
@@ -78,55 +214,214 @@ class KnowledgeMaintainer(base_plugin):
         """
         return dict()
 
-    def _find_work_node(self, session):
+    def _find_work_nodes(self, session):
         """
-        Find node to do work over.
+        Find the next page of nodes to do work over, taking them from the work queue, or from the cypher scan when the
+        queue is empty and the reconciliation is due.
         :return:
         """
-        logger.debug('Executing query: %s' % self.query)
+        # Leave the nodes queued while foursquare is unavailable, rather than taking them only to fail them.
+        if self._foursquare_lookup.circuit_wait():
+            raise CircuitOpen('Foursquare is unavailable')
+
+        # Let storage catch up with the buffered writes before taking more work.
+        if self._foursquare_lookup.write_buffer.saturated:
+            raise WriteBufferFull('Storage writes are backed up')
+
+        page_size = get_configuration_value(self._configuration, MAINTAINER_PAGE_SIZE_KEY, self.page_size)
+        session['page_size'] = page_size
+
+        work_queue = self._foursquare_lookup.work_queue
+        if work_queue:
+            queued = work_queue.take(page_size)
+            if queued:
+                session['nodes'] = [node_uri for node_uri, _ in queued]
+                session['created'] = dict(queued)
+                return session
+
+        if not self._reconciliation_due():
+            raise NoWork('No queued nodes to work')
+
+        query = self.query % (self._cursor, page_size)
+
+        logger.debug('Executing query: %s' % query)
 
         payload = StoragePayload()
-        payload.add_property(key=NEO4J.cypher, value=self.query)
-        promise = self._storage_client.execute_cypher(payload).then(
-            self._scheduler.generate_promise_handler(self._handle_results, session))
+        payload.add_property(key=NEO4J.cypher, value=query)
+        payload.add_flag(CypherFlags.TRANSLATION_KEY, self._translation_key)
+        promise = self._metrics.time_promise('storage_execute_cypher', self._storage_client.execute_cypher(payload))
+        promise = promise.then(self._scheduler.generate_promise_handler(self._handle_results, session))
 
         return promise
 
     def _handle_results(self, result, session):
 
         if not result.results:
-            raise Exception('No results to work')
+            # Reached the end of the backlog, so start from the beginning at the next reconciliation.
+            self._cursor = -1
+            self._reconciled = time.time()
+            raise NoWork('No results to work')
 
-        node_uri = result.results[0].about
+        session['nodes'] = []
+        for res in result.results:
+            session['nodes'].append(res.about)
 
-        session['node'] = node_uri
+            node_id = res.get_column(str(NEO4J.id))
+            if node_id is not None:
+                self._cursor = max(self._cursor, int(node_id))
 
         return session
 
-    def _work_node(self, session):
+    def _work_nodes(self, session):
         """
-        Do the work on the node to populate the details.
+        Do the work on the nodes to populate the details, only allowing max_concurrent_lookups to be in flight.
         :param session: session variable containing previous step details.
-        :return: session
+        :return: promise that is resolved with the session when all of the nodes have been worked.
         """
-        node_uri = session.get('node', None)
-        if not node_uri:
-            raise Exception('No node defined')
+        nodes = list(session.get('nodes', []))
+        if not nodes:
+            raise NoWork('No nodes defined')
+
+        concurrency = get_configuration_value(self._configuration, MAINTAINER_CONCURRENCY_KEY,
+                                              self.max_concurrent_lookups)
+
+        promise = self._scheduler.promise()
+        state = dict(pending=len(nodes))
+        session['failures'] = []
+        created = session.get('created', None)
+
+        def start_next():
+            if nodes:
+                node_uri = nodes.pop(0)
+                if created is None:
+                    lookup = self._foursquare_lookup.schedule_lookup(node_uri)
+                else:
+                    lookup = self._foursquare_lookup.schedule_lookup(node_uri, create=created[node_uri], queued=True)
+                lookup.then(lookup_finished, lookup_failed)
 
-        # Schedule the look up, and then return the session variable so that further work can be done.
-        promise = self._foursquare_lookup.schedule_lookup(node_uri).then(lambda s: session)
+        def lookup_finished(result):
+            state['pending'] -= 1
+            if state['pending']:
+                start_next()
+            else:
+                promise.resolved(session)
+
+        def lookup_failed(error):
+            logger.error('Failed to populate node: %s' % error)
+            session['failures'].append(error)
+            lookup_finished(None)
+
+        for _ in range(min(max(concurrency, 1), len(nodes))):
+            start_next()
 
         return promise
 
-    def _reschedule(self, session, delay=300.0):
+    def _work_finished(self, session):
+        """
+        Determine how soon the next pass should start after a page of nodes has been worked.
+        :param session: session of the pass.
+        :return:
+        """
+        failures = session.get('failures', [])
+        if failures and len(failures) == len(session['nodes']):
+            # None of the nodes could be populated, so treat the pass as failed because of the first failure.
+            return self._work_failed(failures[0])
+
+        self._running = False
+        self._failures = 0
+
+        if len(session['nodes']) >= session['page_size'] and not failures and \
+                not self._foursquare_lookup.quota_wait():
+            delay = self.backlog_delay
+        else:
+            delay = self.work_to_do_delay
+
+        self._reschedule(session, delay)
+
+    def _work_failed(self, error):
+        """
+        Determine how long to wait before the next pass from the reason that the pass failed.
+        :param error: error that the pass was rejected with.
+        :return:
+        """
+        self._running = False
+
+        cause = failure_cause(error)
+        self._metrics.increment('maintainer_%s' % cause)
+
+        if cause == NO_WORK:
+            self._failures = 0
+            delay = self.work_to_do_delay if self._wake_requested else self._idle_delay()
+        elif cause == CLIENT_MISSING:
+            # Nothing can be done until the client details are configured, which will wake the loop.
+            delay = self.no_work_delay
+        elif cause == QUOTA:
+            delay = max(self._foursquare_lookup.quota_wait(), self.work_to_do_delay)
+        elif cause == OUTAGE:
+            # The nodes stay in the work queue until the circuit breaker lets requests through again.
+            delay = max(self._foursquare_lookup.circuit_wait(), self.work_to_do_delay)
+        elif cause == STORAGE_BUSY:
+            delay = self.storage_busy_delay
+        else:
+            self._failures += 1
+            delay = self.backoff_delay(self._failures)
+            logger.warning('Maintainer pass failed (%s consecutive): %s' % (self._failures, error))
+
+        self._reschedule(None, delay, cause)
+
+    def _reconciliation_due(self):
+        """
+        Whether the cypher scan for unpopulated nodes should be run, either because it is part way through or it has
+        not been run for the reconciliation interval.
+        :return:
+        """
+        return self._cursor != -1 or self._reconciled is None or \
+            time.time() - self._reconciled >= self.reconciliation_interval
+
+    def _idle_delay(self):
+        """
+        Delay when there is no work, which is cut short when a queued node becomes available or the reconciliation is
+        due.
+        :return: seconds
+        """
+        now = time.time()
+        delay = self.no_work_delay
+
+        if self._reconciled is not None:
+            delay = min(delay, self._reconciled + self.reconciliation_interval - now)
+
+        work_queue = self._foursquare_lookup.work_queue
+        available = work_queue.next_available() if work_queue else None
+        if available is not None:
+            delay = min(delay, available - now)
+
+        return max(delay, self.work_to_do_delay)
+
+    def backoff_delay(self, failures):
+        """
+        Delay after a number of consecutive failures.
+        :param failures: number of consecutive failures.
+        :return: seconds
         """
-        Reschedule the task after a specified delay time.
+        delay = min(self.failure_delay * (2 ** min(failures - 1, 32)), self.max_failure_delay)
+        return delay - random.uniform(0, delay / 2.0)
+
+    def _reschedule(self, session, delay=300.0, cause=None):
+        """
+        Reschedule the task after a specified delay time, replacing any pass that is already scheduled.
         :param session:
         :param delay:
+        :param cause: reason that the previous pass did not complete, None if it did.
         :return:
         """
         logger.debug('Reschedule the lookup in %s seconds' % delay)
-        self._scheduler.schedule_task(self._start_process, delay=delay)
+
+        self._generation += 1
+        self._next_run = time.time() + delay
+        self._sleep_cause = cause
+
+        generation = self._generation
+        self._scheduler.schedule_task(lambda: self._start_process(generation), delay=delay)
 
 
 knowledge_maintainer = KnowledgeMaintainer
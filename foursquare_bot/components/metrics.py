@@ -0,0 +1,216 @@
+"""
+Counters and timers of the stages of the bot, such as foursquare requests, storage requests and queue waits.
+"""
+from collections import deque
+import re
+import threading
+import time
+
+
+class _NullTimer(object):
+    """
+    Timer returned while the registry is disabled, so that timed blocks cost a method call and nothing more.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_null_timer = _NullTimer()
+
+
+class _Timer(object):
+
+    def __init__(self, registry, name):
+        self._registry = registry
+        self._name = name
+        self._started = None
+
+    def __enter__(self):
+        self._started = self._registry._clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._registry.observe(self._name, self._registry._clock() - self._started)
+        if exc_type is not None:
+            self._registry.increment('%s_errors' % self._name)
+        return False
+
+
+class _Summary(object):
+
+    def __init__(self, sample_size):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def quantile(self, fraction):
+        if not self.samples:
+            return 0.0
+
+        samples = sorted(self.samples)
+        return samples[min(int(fraction * len(samples)), len(samples) - 1)]
+
+
+class MetricsRegistry(object):
+    """
+    Collection of named counters, timers and gauges.  Timers keep the count, total and maximum of all observations, and
+    a window of the most recent observations to calculate the quantiles from.  Gauges are read from a callable when a
+    snapshot is taken.  While the registry is disabled nothing is recorded or read.
+    """
+    quantiles = (0.5, 0.9, 0.99)
+
+    def __init__(self, enabled=False, prefix='foursquare_bot', sample_size=1024, clock=time.time):
+        """
+        :param enabled: whether observations are recorded.
+        :param prefix: prefix of the metric names when they are rendered.
+        :param sample_size: number of recent observations kept for each timer.
+        :param clock: time source.
+        """
+        self.enabled = enabled
+        self.prefix = prefix
+        self._sample_size = sample_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counters = dict()
+        self._timers = dict()
+        self._gauges = dict()
+
+    def increment(self, name, value=1):
+        """
+        Increment a counter.
+        :param name: name of the counter.
+        :param value: amount to increment by.
+        :return:
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """
+        Record a duration.
+        :param name: name of the timer.
+        :param seconds: duration to record.
+        :return:
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            summary = self._timers.get(name, None)
+            if summary is None:
+                summary = self._timers[name] = _Summary(self._sample_size)
+            summary.add(seconds)
+
+    def gauge(self, name, value_function):
+        """
+        Register a gauge, replacing any gauge of the same name.
+        :param name: name of the gauge.
+        :param value_function: callable returning the current value of the gauge.
+        :return:
+        """
+        with self._lock:
+            self._gauges[name] = value_function
+
+    def timer(self, name):
+        """
+        Context manager that records the duration of the block, and counts the blocks that raised an exception as
+        name_errors.
+        :param name: name of the timer.
+        :return: context manager.
+        """
+        if not self.enabled:
+            return _null_timer
+
+        return _Timer(self, name)
+
+    def time_promise(self, name, promise):
+        """
+        Record the time until the promise is resolved or rejected.
+        :param name: name of the timer.
+        :param promise: promise to time.
+        :return: the provided promise.
+        """
+        if not self.enabled:
+            return promise
+
+        started = self._clock()
+
+        def resolved(result):
+            self.observe(name, self._clock() - started)
+
+        def rejected(error):
+            self.observe(name, self._clock() - started)
+            self.increment('%s_errors' % name)
+
+        promise.then(resolved, rejected)
+        return promise
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+
+    def snapshot(self):
+        """
+        Current values of the counters, timers and gauges.
+        :return: dictionary containing the counters dictionary, the timers dictionary of name to a dictionary of
+        count, total, max and quantiles, and the gauges dictionary.
+        """
+        with self._lock:
+            gauge_functions = dict(self._gauges) if self.enabled else {}
+            counters = dict(self._counters)
+            timers = dict()
+            for name, summary in self._timers.items():
+                details = dict(count=summary.count, total=summary.total, max=summary.max)
+                for fraction in self.quantiles:
+                    details['p%d' % (fraction * 100)] = summary.quantile(fraction)
+                timers[name] = details
+
+        # Gauges are read outside of the lock, as they may take the locks of the components they measure.
+        gauges = dict((name, value_function()) for name, value_function in gauge_functions.items())
+
+        return dict(counters=counters, timers=timers, gauges=gauges)
+
+    def render(self):
+        """
+        Render the metrics in the prometheus text exposition format.
+        :return: string
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = self._metric_name('%s_total' % name)
+            lines.append('# TYPE %s counter' % metric)
+            lines.append('%s %s' % (metric, value))
+
+        for name, value in sorted(snapshot['gauges'].items()):
+            metric = self._metric_name(name)
+            lines.append('# TYPE %s gauge' % metric)
+            lines.append('%s %s' % (metric, value))
+
+        for name, details in sorted(snapshot['timers'].items()):
+            metric = self._metric_name('%s_seconds' % name)
+            lines.append('# TYPE %s summary' % metric)
+            for fraction in self.quantiles:
+                lines.append('%s{quantile="%s"} %.6f' % (metric, fraction, details['p%d' % (fraction * 100)]))
+            lines.append('%s_sum %.6f' % (metric, details['total']))
+            lines.append('%s_count %d' % (metric, details['count']))
+
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def _metric_name(self, name):
+        return re.sub(r'[^a-zA-Z0-9_]', '_', '%s_%s' % (self.prefix, name) if self.prefix else name)
@@ -0,0 +1,191 @@
+"""
+Token bucket scheduler that paces the requests made against the foursquare api so that the hourly quota is not
+exceeded, and interactive requests are served before background work.
+"""
+from foursquare_bot.components.metrics import MetricsRegistry
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Request priorities, lower values are dispatched first.
+INTERACTIVE = 0
+PROVIDER = 1
+MAINTENANCE = 2
+
+
+class QuotaExhausted(RuntimeError):
+    """
+    Raised when an interactive request can not be served because there is no quota left.
+    """
+    pass
+
+
+class RequestScheduler(object):
+    """
+    Paces foursquare requests using a token bucket that is refilled at the hourly limit of the api.  Background
+    requests are queued in priority order and are not allowed to spend the tokens that are reserved for interactive
+    requests.
+    """
+
+    def __init__(self, scheduler, hourly_limit=5000, burst=50, interactive_reserve=10, clock=time.time,
+                 executor=None, metrics=None):
+        """
+        :param scheduler: rho_bot_scheduler used to create promises and schedule the dispatching of requests.
+        :param hourly_limit: number of requests allowed an hour until the api reports a value.
+        :param burst: maximum number of tokens that can be accumulated.
+        :param interactive_reserve: number of tokens that background requests will leave for interactive requests.
+        :param clock: time source.
+        :param executor: method(priority, method, *args) returning a promise that executes a request, defaults to
+        deferring the request on the scheduler.
+        :param metrics: metrics registry.
+        """
+        self._scheduler = scheduler
+        self._clock = clock
+        self._executor = executor or self._defer
+        self._metrics = metrics or MetricsRegistry()
+
+        # Limits are updated from the threads making the requests.
+        self._lock = threading.RLock()
+
+        self._rate = hourly_limit / 3600.0
+        self._capacity = float(burst)
+        self._reserve = interactive_reserve
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._dispatch_scheduled = False
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def submit(self, priority, method, *args):
+        """
+        Queue a request to be executed when there is quota available for it.
+        :param priority: priority of the request.
+        :param method: method that performs the request.
+        :param args: arguments to the method.
+        :return: promise resolved with the result of the method.
+        """
+        promise = self._scheduler.promise()
+        heapq.heappush(self._queue, (priority, next(self._sequence), self._clock(), method, args, promise))
+        self._dispatch()
+
+        return promise
+
+    def execute(self, method, *args):
+        """
+        Execute an interactive request immediately, jumping over the queued requests.
+        :param method: method that performs the request.
+        :param args: arguments to the method.
+        :return: result of the method.
+        """
+        if not self._take_token(INTERACTIVE):
+            self._metrics.increment('quota_exhausted')
+            raise QuotaExhausted('Foursquare request quota has been exhausted')
+
+        self._metrics.increment('requests_dispatched')
+        return method(*args)
+
+    def wait_time(self, priority=MAINTENANCE):
+        """
+        Number of seconds until a request of the priority could be dispatched, ignoring the requests that are queued.
+        :param priority: priority of the request.
+        :return: seconds, 0.0 if a request could be dispatched now.
+        """
+        with self._lock:
+            self._refill()
+
+            required = self._required_tokens(priority)
+            if self._tokens >= required:
+                return 0.0
+
+            return max(self._blocked_until - self._clock(), (required - self._tokens) / self._rate, 0.0)
+
+    def update_limits(self, limit=None, remaining=None, reset=None):
+        """
+        Update the bucket from the rate limit details reported by the api.
+        :param limit: hourly request limit.
+        :param remaining: number of requests remaining in the current window.
+        :param reset: epoch time that the window will be reset.
+        :return:
+        """
+        with self._lock:
+            self._refill()
+
+            if limit:
+                self._rate = limit / 3600.0
+
+            if remaining is not None:
+                self._tokens = min(self._tokens, float(remaining))
+
+                if remaining == 0:
+                    now = self._clock()
+                    self._blocked_until = reset if reset and reset > now else now + 1.0 / self._rate
+                    logger.warning('Foursquare quota exhausted, pausing requests for %.0f seconds' %
+                                   (self._blocked_until - now))
+
+    def _refill(self):
+        now = self._clock()
+        if now < self._blocked_until:
+            return
+
+        elapsed = now - max(self._updated, self._blocked_until)
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+        self._updated = now
+
+    def _required_tokens(self, priority):
+        return 1.0 if priority == INTERACTIVE else 1.0 + self._reserve
+
+    def _take_token(self, priority):
+        with self._lock:
+            self._refill()
+
+            if self._tokens < self._required_tokens(priority):
+                return False
+
+            self._tokens -= 1.0
+            return True
+
+    def _dispatch(self):
+        """
+        Execute as many of the queued requests as the bucket allows, and schedule another dispatch when the bucket
+        will have refilled enough for the next request.
+        :return:
+        """
+        while self._queue:
+            priority, _, enqueued, method, args, promise = self._queue[0]
+
+            if not self._take_token(priority):
+                if not self._dispatch_scheduled:
+                    self._dispatch_scheduled = True
+                    self._scheduler.schedule_task(self._scheduled_dispatch, delay=max(self.wait_time(priority), 0.1))
+                break
+
+            heapq.heappop(self._queue)
+
+            waited = self._clock() - enqueued
+            self._metrics.increment('requests_dispatched')
+            self._metrics.observe('request_queue_wait', waited)
+
+            self._executor(priority, method, *args).then(promise.resolved, promise.rejected)
+
+    def _defer(self, priority, method, *args):
+        return self._scheduler.defer(method, *args)
+
+    def _scheduled_dispatch(self):
+        self._dispatch_scheduled = False
+        self._dispatch()
@@ -0,0 +1,160 @@
+"""
+Archive of recorded foursquare responses, used to run the bot against the responses of an earlier run without calling
+the foursquare API.
+"""
+import json
+import sqlite3
+import threading
+import urllib
+import urlparse
+import zlib
+
+# Transports of the foursquare client.
+LIVE = 'live'
+RECORD = 'record'
+REPLAY = 'replay'
+
+TRANSPORTS = (LIVE, RECORD, REPLAY)
+
+# Parameters that identify the client rather than the request, so they are not part of the key of a response.
+CLIENT_PARAMETERS = frozenset(['client_id', 'client_secret', 'oauth_token', 'v', 'm'])
+
+# Only the rate limit headers are needed to replay a response, the reset time is left out as it will have passed.
+RECORDED_HEADERS = ('x-ratelimit-limit', 'x-ratelimit-remaining')
+
+
+def request_key(url):
+    """
+    Normalize a request url into the key of its response, without the api endpoint and the client parameters and with
+    the parameters sorted, so that the responses can be replayed by another client.
+    :param url: request url, or a path and query of a multi sub request.
+    :return: key string.
+    """
+    components = urlparse.urlparse(url)
+
+    path = components.path
+    if '/v2/' in path:
+        path = path[path.index('/v2/') + 3:]
+
+    # The query of a multi sub request is quoted as a whole.
+    query = components.query
+    if '=' not in query:
+        query = urllib.unquote_plus(query)
+
+    parameters = sorted((key, value) for key, value in urlparse.parse_qsl(query) if key not in CLIENT_PARAMETERS)
+
+    return '%s?%s' % (path, urllib.urlencode(parameters)) if parameters else path
+
+
+def multi_requests(url):
+    """
+    List the sub requests of a multi request.
+    :param url: request url.
+    :return: list of sub request paths, None if the url is not a multi request.
+    """
+    components = urlparse.urlparse(url)
+    if not components.path.endswith('/multi'):
+        return None
+
+    requests = urlparse.parse_qs(components.query).get('requests', None)
+    return requests[0].split(',') if requests else []
+
+
+class ResponseArchive(object):
+    """
+    Recorded responses stored in a sqlite database, with the bodies compressed.  The responses of multi requests are
+    also stored for each of their sub requests, so that they can be replayed when the venues are batched differently
+    than they were when they were recorded.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: path to the sqlite database.
+        """
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS responses '
+                                 '(key TEXT PRIMARY KEY, status INTEGER NOT NULL, headers TEXT NOT NULL, '
+                                 'body BLOB NOT NULL, latency REAL NOT NULL)')
+        self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT count(*) FROM responses').fetchone()[0]
+
+    def record(self, url, status, headers, body, latency):
+        """
+        Store the response of a request.
+        :param url: request url.
+        :param status: http status of the response.
+        :param headers: dictionary of the response headers.
+        :param body: response body.
+        :param latency: number of seconds the request took.
+        :return:
+        """
+        # Rate limit errors depend on the quota of the recording client rather than the request, so they are not kept.
+        if status == 403 and 'rate_limit_exceeded' in body:
+            return
+
+        headers = dict((name, headers[name]) for name in RECORDED_HEADERS if name in headers)
+        rows = [(request_key(url), status, headers, body)]
+
+        sub_requests = multi_requests(url)
+        if sub_requests and status == 200:
+            try:
+                responses = json.loads(body)['response']['responses']
+            except (ValueError, KeyError, TypeError):
+                responses = []
+
+            for sub_request, response in zip(sub_requests, responses):
+                rows.append((request_key(sub_request), response.get('meta', {}).get('code', 200), headers,
+                             json.dumps(response)))
+
+        with self._lock:
+            self._connection.executemany('INSERT OR REPLACE INTO responses (key, status, headers, body, latency) '
+                                         'VALUES (?, ?, ?, ?, ?)',
+                                         [(key, row_status, json.dumps(row_headers),
+                                           sqlite3.Binary(zlib.compress(row_body)), latency)
+                                          for key, row_status, row_headers, row_body in rows])
+            self._connection.commit()
+
+    def replay(self, url):
+        """
+        Fetch the recorded response of a request.  Multi requests that were not recorded are assembled from the
+        recorded responses of their sub requests.
+        :param url: request url.
+        :return: tuple of the status, headers, body and latency, None if the response was not recorded.
+        """
+        response = self._fetch(request_key(url))
+        if response is not None:
+            return response
+
+        sub_requests = multi_requests(url)
+        if not sub_requests:
+            return None
+
+        responses = [self._fetch(request_key(sub_request)) for sub_request in sub_requests]
+        if None in responses:
+            return None
+
+        body = json.dumps(dict(meta=dict(code=200),
+                               response=dict(responses=[json.loads(body) for _, _, body, _ in responses])))
+
+        return 200, responses[-1][1], body, max(latency for _, _, _, latency in responses)
+
+    def _fetch(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT status, headers, body, latency FROM responses WHERE key = ?',
+                                           (key, )).fetchone()
+
+        if row is None:
+            return None
+
+        status, headers, body, latency = row
+        return status, json.loads(headers), zlib.decompress(body), latency
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -3,31 +3,54 @@ Service that will find the most commonly used locations in events (ideally these
 defined by foursquare data and return them back.
 """
 
+import copy
 import logging
 import json
+import time
 
 from rhobot.components.storage.enums import CypherFlags
 
 from sleekxmpp.plugins.base import base_plugin
+from rhobot.components.configuration import BotConfiguration
 from rhobot.namespace import WGS_84, SCHEMA, GRAPH
 from rdflib.namespace import RDFS
 from rhobot.components.stanzas.rdf_stanza import RDFStanzaType
 from rhobot.components.storage import StoragePayload
 from rhobot.components.storage.namespace import NEO4J
+from foursquare_bot.components.configuration_enums import RANKING_REFRESH_INTERVAL_KEY
+from foursquare_bot.components.events import VENUE_UPDATED
+from foursquare_bot.components.single_flight import PromiseFlight
+from foursquare_bot.components.spatial_index import GridIndex
+from foursquare_bot.components.utilities import get_configuration_value, first_value
 
 logger = logging.getLogger(__name__)
 
 
 class SearchHandler(base_plugin):
     """
-    Search the database for the content
+    Search the database for the content.  The ranking of the most popular venues is materialized and refreshed in the
+    background, so that search requests are answered from memory.
     """
     name = 'search_handler'
     description = 'Knowledge Provider'
-    dependencies = {'rho_bot_storage_client', 'rho_bot_rdf_publish', 'search_venues', }
+    dependencies = {'rho_bot_storage_client', 'rho_bot_rdf_publish', 'rho_bot_scheduler', 'rho_bot_configuration',
+                    'search_venues', 'foursquare_metrics', }
 
     type_requirements = {str(WGS_84.SpatialThing), }
 
+    # Number of seconds between refreshes of the ranking.  Venue updates trigger a refresh after a short delay, but
+    # bursts of updates are coalesced into at most one refresh for each update refresh interval.
+    refresh_interval = 900.0
+    update_refresh_delay = 30.0
+    update_refresh_interval = 300.0
+
+    # Requests that contain a location are answered with the most referenced venues within this many kilometers.
+    search_radius = 25.0
+    result_limit = 10
+
+    # Number of venues read for each page of the location index.
+    location_page_size = 5000
+
     query = """MATCH (n:`%s`)<-[r:`http://purl.org/NET/c4dm/event.owl#place`]-(m)
                    WHERE
                       any(seeAlso in n.`%s` where seeAlso =~ '^foursquare:.*')
@@ -36,21 +59,97 @@ class SearchHandler(base_plugin):
                                                      str(RDFS.seeAlso),
                                                      str(SCHEMA.name))
 
+    # The location index holds all of the referenced venues, so that every location can be answered.  It is read a
+    # page at a time with keyset pagination over the node identifier, so that no single query returns all of them.
+    location_query = """MATCH (n:`%s`)<-[r:`http://purl.org/NET/c4dm/event.owl#place`]-(m)
+                            WHERE
+                               any(seeAlso in n.`%s` where seeAlso =~ '^foursquare:.*')
+                               and has(n.`%s`) and has(n.`%s`) and id(n) > %%d
+                            RETURN n AS node, id(n) AS node_id, count(r) AS rels, n.`%s` AS name, n.`%s` AS lat,
+                               n.`%s` AS long
+                            ORDER BY node_id LIMIT %%d""" % (str(WGS_84.SpatialThing),
+                                                             str(RDFS.seeAlso),
+                                                             str(WGS_84.lat),
+                                                             str(WGS_84.long),
+                                                             str(SCHEMA.name),
+                                                             str(WGS_84.lat),
+                                                             str(WGS_84.long))
+
     def plugin_init(self):
         self.query = ' '.join(self.query.replace('\n', ' ').replace('\r', '').split())
+        self.location_query = ' '.join(self.location_query.replace('\n', ' ').replace('\r', '').split())
+
+        self._ranking = None
+        self._location_index = None
+        self._location_results = None
+        self._location_building = False
+        self._ranking_time = None
+        self._update_refresh_scheduled = False
+
+        self.xmpp.add_event_handler(BotConfiguration.CONFIGURATION_RECEIVED_EVENT, self._configuration_updated)
+        self.xmpp.add_event_handler(VENUE_UPDATED, self._venue_updated)
 
     def post_init(self):
         super(SearchHandler, self).post_init()
 
         self._storage_client = self.xmpp['rho_bot_storage_client']
         self._rdf_publish = self.xmpp['rho_bot_rdf_publish']
+        self._scheduler = self.xmpp['rho_bot_scheduler']
+        self._configuration = self.xmpp['rho_bot_configuration']
         self._search_venues = self.xmpp['search_venues']
+        self._metrics = self.xmpp['foursquare_metrics'].registry
+
+        self._refresh_flight = PromiseFlight(self._scheduler)
 
         self._rdf_publish.add_search_handler(self._rdf_request_message)
 
+    def _configuration_updated(self, event):
+        """
+        Start refreshing the ranking periodically.
+        :param event:
+        :return:
+        """
+        self.refresh_interval = get_configuration_value(self._configuration, RANKING_REFRESH_INTERVAL_KEY,
+                                                        self.refresh_interval, float)
+        self._scheduler.schedule_task(self._refresh_ranking, delay=self.refresh_interval, repeat=True)
+        self._refresh_ranking()
+
+        # Only a single periodic refresh should be running.
+        self.xmpp.del_event_handler(BotConfiguration.CONFIGURATION_RECEIVED_EVENT, self._configuration_updated)
+
+    def _venue_updated(self, event):
+        """
+        Venue details have changed, so refresh the ranking to pick up the changes, no sooner than the update refresh
+        interval after the previous refresh.
+        :param event:
+        :return:
+        """
+        if not self._update_refresh_scheduled:
+            self._update_refresh_scheduled = True
+
+            age = self.ranking_age
+            delay = self.update_refresh_delay if age is None else \
+                max(self.update_refresh_delay, self.update_refresh_interval - age)
+            self._scheduler.schedule_task(self._scheduled_refresh, delay=delay)
+
+    def _scheduled_refresh(self):
+        self._update_refresh_scheduled = False
+        self._refresh_ranking()
+
+    @property
+    def ranking_age(self):
+        """
+        Number of seconds since the ranking was refreshed, None if it has not been calculated yet.
+        :return:
+        """
+        if self._ranking_time is None:
+            return None
+
+        return time.time() - self._ranking_time
+
     def _rdf_request_message(self, rdf_payload):
         """
-        Find node to do work over.
+        Respond with the materialized ranking, calculating it if it doesn't exist yet.
         :return:
         """
         form = rdf_payload.get('form', None)
@@ -59,6 +158,37 @@ class SearchHandler(base_plugin):
         if not self._process_payload(payload):
             return None
 
+        latitude = first_value(payload.properties.get(str(WGS_84.lat), None), float)
+        longitude = first_value(payload.properties.get(str(WGS_84.long), None), float)
+
+        if latitude is not None and longitude is not None and self._location_index is not None:
+            logger.debug('Responding with venues near: %s, %s' % (latitude, longitude))
+
+            promise = self._scheduler.promise()
+            promise.resolved(self._process_results(self._nearby_ranking(latitude, longitude)))
+            return promise
+
+        if self._ranking is not None:
+            age = self.ranking_age
+            if age > 2 * self.refresh_interval:
+                logger.warning('Responding with stale ranking that is %.0f seconds old' % age)
+            else:
+                logger.debug('Responding with ranking that is %.0f seconds old' % age)
+
+            promise = self._scheduler.promise()
+            promise.resolved(self._process_results(self._ranking))
+            return promise
+
+        return self._refresh_ranking().then(self._process_results)
+
+    def _refresh_ranking(self):
+        """
+        Recalculate the ranking of the venues.
+        :return: promise resolved with the ranking.
+        """
+        return self._refresh_flight.do('ranking', self._execute_query)
+
+    def _execute_query(self):
         translation_key = dict(json.loads(CypherFlags.TRANSLATION_KEY.default))
         translation_key[str(SCHEMA.name)] = 'name'
         translation_key[str(GRAPH.degree)] = 'rels'
@@ -69,22 +199,121 @@ class SearchHandler(base_plugin):
         payload.add_property(key=NEO4J.cypher, value=self.query)
         payload.add_flag(CypherFlags.TRANSLATION_KEY, json.dumps(translation_key))
 
-        promise = self._storage_client.execute_cypher(payload).then(self._process_results)
+        promise = self._metrics.time_promise('storage_execute_cypher', self._storage_client.execute_cypher(payload))
+        promise = promise.then(self._store_ranking)
+        promise.then(lambda ranking: self._refresh_location_index())
 
         return promise
 
-    def _process_results(self, result):
+    def _store_ranking(self, result):
         """
-        Handle all of the results provided by the cypher query.
+        Store the ranking for the requests that follow.
         :param result:
-        :return:
+        :return: result
         """
+        self._ranking = result
+        self._ranking_time = time.time()
+
         if logger.isEnabledFor(logging.DEBUG):
             logger.debug('Found: %s results' % len(result.results))
 
             for res in result.results:
                 logger.debug('  %s (%s)' % (res.get_column(str(SCHEMA.name)), res.get_column(str(GRAPH.degree))))
 
+        return result
+
+    def _refresh_location_index(self):
+        """
+        Rebuild the spatial index of the venues, unless it is already being rebuilt.  The previous index answers the
+        requests until the new one is complete.
+        :return:
+        """
+        if self._location_building:
+            return
+
+        def finished(index):
+            self._location_building = False
+            return index
+
+        def failed(error):
+            self._location_building = False
+            logger.error('Unable to build the location index: %s' % error)
+
+        self._location_building = True
+        self._read_location_page(GridIndex(), -1).then(finished, failed)
+
+    def _read_location_page(self, index, cursor):
+        """
+        Read the page of venues that follows the cursor into the index.
+        :param index: index being built.
+        :param cursor: largest node identifier that has been read.
+        :return: promise resolved with the index once all of the pages have been read.
+        """
+        location_key = dict(json.loads(CypherFlags.TRANSLATION_KEY.default))
+        location_key[str(SCHEMA.name)] = 'name'
+        location_key[str(GRAPH.degree)] = 'rels'
+        location_key[str(NEO4J.id)] = 'node_id'
+        location_key[str(WGS_84.lat)] = 'lat'
+        location_key[str(WGS_84.long)] = 'long'
+
+        payload = StoragePayload()
+        payload.add_property(key=NEO4J.cypher, value=self.location_query % (cursor, self.location_page_size))
+        payload.add_flag(CypherFlags.TRANSLATION_KEY, json.dumps(location_key))
+
+        promise = self._metrics.time_promise('storage_execute_cypher', self._storage_client.execute_cypher(payload))
+        return promise.then(self._scheduler.generate_promise_handler(self._store_location_page, index, cursor))
+
+    def _store_location_page(self, result, index, cursor):
+        """
+        Add a page of the results of the location query to the index, and read the next page.  The index replaces the
+        current index once the last page has been read.
+        :param result:
+        :param index: index being built.
+        :param cursor: largest node identifier that had been read before the page.
+        :return: index, or promise resolved with the index when there are more pages.
+        """
+        last_cursor = cursor
+
+        for res in result.results:
+            latitude = first_value(res.get_column(str(WGS_84.lat)), float)
+            longitude = first_value(res.get_column(str(WGS_84.long)), float)
+            references = first_value(res.get_column(str(GRAPH.degree)), int) or 0
+
+            if latitude is not None and longitude is not None:
+                index.add(latitude, longitude, references, res)
+
+            node_id = first_value(res.get_column(str(NEO4J.id)), int)
+            if node_id is not None:
+                cursor = max(cursor, node_id)
+
+        if len(result.results) >= self.location_page_size and cursor > last_cursor:
+            return self._read_location_page(index, cursor)
+
+        logger.debug('Indexed the locations of %s venues' % len(index))
+
+        self._location_index = index
+        self._location_results = result
+
+        return index
+
+    def _nearby_ranking(self, latitude, longitude):
+        """
+        Create a result collection containing the most referenced venues near the location.
+        :param latitude:
+        :param longitude:
+        :return: result collection
+        """
+        result = copy.copy(self._location_results)
+        result.results = self._location_index.within(latitude, longitude, self.search_radius, self.result_limit)
+
+        return result
+
+    def _process_results(self, result):
+        """
+        Handle all of the results provided by the cypher query.
+        :param result:
+        :return:
+        """
         rdf_data = self._rdf_publish.create_rdf(mtype=RDFStanzaType.SEARCH_RESPONSE, payload=result,
                                                 source_name="Search Foursquare",
                                                 source_command=self._search_venues.get_command_uri())
@@ -0,0 +1,133 @@
+"""
+Coalesce concurrent calls for the same key so that only one of them does the work.
+"""
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Executes a method once for all of the callers that request the same key while the first call is in flight.  The
+    callers that joined an existing call receive the same result, or have the same exception raised.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = dict()
+
+        self.coalesced = 0
+
+    def do(self, key, method, *args):
+        """
+        Execute the method, or wait for the call that is already being made for the key.
+        :param key: key of the call.
+        :param method: method to execute.
+        :param args: arguments of the method.
+        :return: result of the method.
+        """
+        with self._lock:
+            call = self._calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = method(*args)
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+
+        return call.result
+
+    @property
+    def in_flight(self):
+        return len(self._calls)
+
+
+class PromiseFlight(object):
+    """
+    Promise based version of the single flight, for work that is executed on the scheduler.  Callers that request a key
+    that is already in flight are given a promise that is resolved with the result of the first call.
+    """
+
+    def __init__(self, scheduler):
+        """
+        :param scheduler: rho_bot_scheduler used to create promises.
+        """
+        self._scheduler = scheduler
+        self._waiting = dict()
+        self._contexts = dict()
+
+        self.coalesced = 0
+
+    def __contains__(self, key):
+        return key in self._waiting
+
+    @property
+    def in_flight(self):
+        return len(self._waiting)
+
+    def context(self, key):
+        """
+        Dictionary shared by the callers of the call that is in flight for the key, so that the callers that join the
+        call can pass details on to it.
+        :param key: key of the call.
+        :return: dictionary, or None if there is no call in flight for the key.
+        """
+        return self._contexts.get(key, None)
+
+    def do(self, key, method, *args):
+        """
+        Execute the method, or join the call that is already being made for the key.
+        :param key: key of the call.
+        :param method: method returning a promise.
+        :param args: arguments of the method.
+        :return: promise resolved with the result of the method.
+        """
+        promise = self._scheduler.promise()
+
+        if key in self._waiting:
+            self.coalesced += 1
+            self._waiting[key].append(promise)
+            return promise
+
+        self._waiting[key] = [promise]
+        self._contexts[key] = dict()
+
+        try:
+            source = method(*args)
+        except Exception as e:
+            self._rejected(e, key)
+        else:
+            source.then(self._scheduler.generate_promise_handler(self._resolved, key),
+                        self._scheduler.generate_promise_handler(self._rejected, key))
+
+        return promise
+
+    def _resolved(self, result, key):
+        self._contexts.pop(key, None)
+        for promise in self._waiting.pop(key, []):
+            promise.resolved(result)
+
+    def _rejected(self, error, key):
+        self._contexts.pop(key, None)
+        for promise in self._waiting.pop(key, []):
+            promise.rejected(error)
@@ -0,0 +1,118 @@
+"""
+Grid based spatial index used to find the venues that are near a location.
+"""
+import heapq
+import math
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """
+    Great circle distance between two points.
+    :return: distance in kilometers.
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def grid_points(south, west, north, east, step_km):
+    """
+    Centers of a grid of cells covering a bounding box, in rows from south to north.
+    :param south: southern latitude of the box.
+    :param west: western longitude of the box.
+    :param north: northern latitude of the box.
+    :param east: eastern longitude of the box.
+    :param step_km: distance between the points in kilometers.
+    :return: generator of (latitude, longitude) tuples.
+    """
+    lat_step = step_km / KM_PER_DEGREE
+    latitude = south + lat_step / 2.0
+
+    while latitude < north:
+        lng_step = step_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        longitude = west + lng_step / 2.0
+
+        while longitude < east:
+            yield latitude, longitude
+            longitude += lng_step
+
+        latitude += lat_step
+
+
+class GridIndex(object):
+    """
+    Buckets items into cells of a fixed number of degrees, so that a radius search only has to look at the items in the
+    cells that overlap the radius.
+    """
+
+    def __init__(self, cell_size=0.1):
+        """
+        :param cell_size: size of a cell in degrees.
+        """
+        self.cell_size = cell_size
+        self._cells = dict()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_size)), int(math.floor(lng / self.cell_size))
+
+    def add(self, lat, lng, score, item):
+        """
+        Add an item to the index.
+        :param lat: latitude of the item.
+        :param lng: longitude of the item.
+        :param score: score used to rank the item.
+        :param item: item to store.
+        :return:
+        """
+        self._cells.setdefault(self._cell(lat, lng), []).append((score, lat, lng, item))
+        self._count += 1
+
+    def remove(self, lat, lng, item):
+        """
+        Remove an item from the index.
+        :param lat: latitude the item was added at.
+        :param lng: longitude the item was added at.
+        :param item: item to remove.
+        :return:
+        """
+        cell = self._cell(lat, lng)
+        entries = self._cells.get(cell, [])
+
+        remaining = [entry for entry in entries if entry[3] != item]
+        self._count -= len(entries) - len(remaining)
+
+        if remaining:
+            self._cells[cell] = remaining
+        else:
+            self._cells.pop(cell, None)
+
+    def within(self, lat, lng, radius, limit=10):
+        """
+        Find the highest scoring items within a radius of a location.
+        :param lat: latitude of the location.
+        :param lng: longitude of the location.
+        :param radius: radius in kilometers.
+        :param limit: maximum number of items to return.
+        :return: list of items, ordered by descending score.
+        """
+        lat_delta = radius / KM_PER_DEGREE
+        lng_delta = radius / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+
+        min_lat, min_lng = self._cell(lat - lat_delta, lng - lng_delta)
+        max_lat, max_lng = self._cell(lat + lat_delta, lng + lng_delta)
+
+        candidates = []
+        for cell_lat in xrange(min_lat, max_lat + 1):
+            for cell_lng in xrange(min_lng, max_lng + 1):
+                for entry in self._cells.get((cell_lat, cell_lng), ()):
+                    if distance_km(lat, lng, entry[1], entry[2]) <= radius:
+                        candidates.append(entry)
+
+        return [entry[3] for entry in heapq.nlargest(limit, candidates, key=lambda entry: entry[0])]
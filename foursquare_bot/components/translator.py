@@ -0,0 +1,109 @@
+"""
+Translation of the venue details returned by foursquare into storage payloads.
+"""
+from rhobot.namespace import WGS_84, SCHEMA
+from rdflib.namespace import RDFS
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORY_MAPPING = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'category_mapping.json')
+
+# Venue fields that are copied into properties of the node: path of the field in the venue details, property uri.
+FIELDS = (
+    (('name', ), SCHEMA.name),
+    (('location', 'lat'), WGS_84.lat),
+    (('location', 'lng'), WGS_84.long),
+    (('location', 'address'), SCHEMA.streetAddress),
+    (('location', 'city'), SCHEMA.addressLocality),
+    (('location', 'state'), SCHEMA.addressRegion),
+    (('location', 'postalCode'), SCHEMA.postalCode),
+    (('location', 'country'), SCHEMA.addressCountry),
+    (('contact', 'formattedPhone'), SCHEMA.telephone),
+    (('url', ), SCHEMA.url),
+)
+
+
+def load_category_mapping(path=None):
+    """
+    Load the mapping from foursquare categories to ontology types.  The mapping file is a json dictionary keyed by the
+    foursquare category identifier, or the lower case category name, of lists of type uris.
+    :param path: path to the mapping file, defaults to the mapping that is distributed with the bot.
+    :return: dictionary of category key to the list of type uris.
+    """
+    path = path or DEFAULT_CATEGORY_MAPPING
+
+    try:
+        with open(path) as mapping_file:
+            mapping = json.load(mapping_file)
+    except (IOError, ValueError) as e:
+        logger.error('Unable to load category mapping %s: %s' % (path, e))
+        return dict()
+
+    return dict((key.lower(), tuple(types)) for key, types in mapping.items())
+
+
+class VenueTranslator(object):
+    """
+    Table driven translation of foursquare venues.  The field table and the category mapping are compiled into lookup
+    tables when the translator is created, so translating a venue is a walk over the table.
+    """
+
+    def __init__(self, category_mapping=None, fields=FIELDS):
+        """
+        :param category_mapping: dictionary of foursquare category identifier or lower case name to type uris.
+        :param fields: table of (path, property uri) of the fields to translate.
+        """
+        self._categories = dict(category_mapping or {})
+        self._fields = tuple((tuple(path), str(uri)) for path, uri in fields)
+
+    def category_types(self, category):
+        """
+        Find the ontology types of a foursquare category.
+        :param category: category dictionary of the venue details.
+        :return: tuple of type uris.
+        """
+        types = self._categories.get(category.get('id', '').lower(), None)
+        if types is None:
+            types = self._categories.get(category.get('name', '').lower(), ())
+
+        return types
+
+    def translate(self, venue, storage):
+        """
+        Translate the foursquare details of a venue into a storage object.
+        :param venue: foursquare venue details.
+        :param storage: storage object.
+        :return: storage object.
+        """
+        storage.add_type(WGS_84.SpatialThing)
+        storage.add_property(RDFS.seeAlso, 'foursquare://venues/%s' % venue['id'])
+
+        for path, uri in self._fields:
+            value = venue
+            for key in path:
+                value = value.get(key, None) if isinstance(value, dict) else None
+
+            if value is not None and value != '':
+                storage.add_property(uri, value)
+
+        types = set()
+        for category in venue.get('categories', ()):
+            types.update(self.category_types(category))
+
+        for rdf_type in sorted(types):
+            storage.add_type(rdf_type)
+
+        return storage
+
+    def translate_all(self, venues, payload_factory):
+        """
+        Translate a list of venues.
+        :param venues: iterable of foursquare venue details.
+        :param payload_factory: callable creating an empty storage object.
+        :return: generator of the storage objects, in the same order as the venues.
+        """
+        for venue in venues:
+            yield self.translate(venue, payload_factory())
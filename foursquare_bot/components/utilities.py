@@ -1,12 +1,28 @@
 """
 Collection of utilities for the foursquare provider.
 """
-# TODO: build translation key between foursquare categories and dbpedia.org/ontology
-# See: http://www.geonames.org/ontology/mappings_v3.01.rdf
-from rhobot.namespace import WGS_84, SCHEMA
+from rhobot.namespace import WGS_84
 from rdflib.namespace import RDFS
+from foursquare_bot.components.translator import VenueTranslator, load_category_mapping
+import hashlib
+import json
+import re
 import urlparse
 
+SPATIAL_THING = str(WGS_84.SpatialThing)
+SEE_ALSO = str(RDFS.seeAlso)
+
+VENUE_URL_PATTERN = re.compile(r'^foursquare://venues/([^/?#;]+)')
+WEB_VENUE_PATTERN = re.compile(r'foursquare\.com/(?:v/[^/]+|venue)/([0-9a-fA-F]{24})')
+VENUE_IDENTIFIER_PATTERN = re.compile(r'^[0-9a-fA-F]{24}$')
+
+# Venue identifiers of the urls that have been parsed, cleared when it reaches the maximum size.
+_venue_urls = dict()
+_venue_urls_size = 10000
+
+# Translator using the default category mapping, created when it is first used.
+_translator = None
+
 
 def get_foursquare_venue(payload):
     """
@@ -14,17 +30,33 @@ def get_foursquare_venue(payload):
     :param payload: payload to test.
     :return:
     """
-    venue = None
-    if str(WGS_84.SpatialThing) in payload.types:
-        properties = payload.properties
-        see_alsos = properties.get(str(RDFS.seeAlso), None)
-        if see_alsos:
-            for see_also in see_alsos:
-                venue = get_foursquare_venue_from_url(see_also)
-                if venue:
-                    break
+    if SPATIAL_THING in payload.types:
+        return get_foursquare_venue_from_urls(payload.properties.get(SEE_ALSO, None))
 
-    return venue
+    return None
+
+
+def get_foursquare_venues(payloads):
+    """
+    Bulk version of get_foursquare_venue.
+    :param payloads: list of payloads to test.
+    :return: list of venue identifiers, None for the payloads that do not reference a venue.
+    """
+    return [get_foursquare_venue(payload) for payload in payloads]
+
+
+def get_foursquare_venue_from_urls(urls):
+    """
+    Find the first venue identifier in a list of urls.
+    :param urls: list of urls.
+    :return: venue identifier or None.
+    """
+    for url in urls or ():
+        venue = get_foursquare_venue_from_url(url)
+        if venue:
+            return venue
+
+    return None
 
 
 def get_foursquare_venue_from_url(url):
@@ -33,29 +65,198 @@ def get_foursquare_venue_from_url(url):
     :param url:
     :return:
     """
+    try:
+        return _venue_urls[url]
+    except KeyError:
+        pass
+
+    match = VENUE_URL_PATTERN.match(url)
+    if match:
+        venue = match.group(1)
+    elif url[:11].lower() == 'foursquare:':
+        venue = _parse_foursquare_venue_url(url)
+    else:
+        venue = None
+
+    if len(_venue_urls) >= _venue_urls_size:
+        _venue_urls.clear()
+    _venue_urls[url] = venue
+
+    return venue
+
+
+def _parse_foursquare_venue_url(url):
+    """
+    Full parse of the foursquare urls that are not in the canonical form expected by the pattern.
+    :param url:
+    :return: venue identifier or None.
+    """
     venue = None
     url_components = urlparse.urlparse(url)
 
     if url_components.scheme == 'foursquare' and url_components.netloc == 'venues':
-        venue = url_components.path.split('/')[1]
+        path = url_components.path.split('/')
+        venue = path[1] if len(path) > 1 else None
 
-    return venue
+    return venue or None
+
+
+def parse_venue_reference(line):
+    """
+    Parse a line of a venue export into a venue identifier.  The line can contain a venue identifier, a foursquare
+    venue url or a foursquare web url as its first field, blank lines and lines starting with # are ignored.
+    :param line: line of the export.
+    :return: venue identifier or None.
+    """
+    fields = line.strip().replace(',', ' ').split()
+    if not fields or fields[0].startswith('#'):
+        return None
+
+    reference = fields[0].strip('"\'')
+
+    if reference[:11].lower() == 'foursquare:':
+        return get_foursquare_venue_from_url(reference)
+
+    match = WEB_VENUE_PATTERN.search(reference)
+    if match:
+        return match.group(1)
+
+    if VENUE_IDENTIFIER_PATTERN.match(reference):
+        return reference
+
+    return None
+
+
+def search_key(near, query=None, limit=10):
+    """
+    Normalize the parameters of a venue search into a key, so that searches that only differ by case or white space
+    share cache entries.
+    :param near: near a location.
+    :param query: query to search for.
+    :param limit: maximum number of results.
+    :return: tuple key.
+    """
+    def normalize(value):
+        return ' '.join((value or '').lower().split())
+
+    return normalize(near), normalize(query), limit
+
+
+def first_value(value, value_type=None):
+    """
+    Properties of nodes can be stored as lists, so fetch the first value of the property.
+    :param value: property value or list of property values.
+    :param value_type: optional callable used to convert the value.
+    :return: the value, or None if there is no usable value.
+    """
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+
+    if value is None or value_type is None:
+        return value
+
+    try:
+        return value_type(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_configuration_value(configuration, key, default, value_type=int):
+    """
+    Fetch a tuning value out of the bot configuration, falling back to the default when it is unset or malformed.
+    :param configuration: rho_bot_configuration plugin.
+    :param key: configuration key.
+    :param default: value to use when the key is not usable.
+    :param value_type: callable used to convert the stored string.
+    :return: converted value.
+    """
+    value = configuration.get_value(key, None)
+    if value is None:
+        return default
+
+    try:
+        return value_type(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def normalize_values(values):
+    """
+    Convert a property value or list of values into a sorted list of unicode strings, so that values read from storage
+    can be compared with the values of a payload.
+    :param values: value or list of values.
+    :return: sorted list of unique unicode values.
+    """
+    if not isinstance(values, (list, tuple, set)):
+        values = [] if values is None else [values]
+
+    return sorted(set(unicode(value) for value in values))
+
+
+def normalize_properties(payload):
+    """
+    Normalize all of the properties of a storage payload.
+    :param payload: storage payload.
+    :return: dictionary of property uri to the normalized list of values.
+    """
+    return dict((str(key), normalize_values(values)) for key, values in payload.properties.items())
+
+
+def storage_digest(payload):
+    """
+    Hash of the properties of a storage payload, which is the same for payloads with the same property values.
+    :param payload: storage payload.
+    :return: hex digest.
+    """
+    return hashlib.sha1(json.dumps(normalize_properties(payload), sort_keys=True)).hexdigest()
+
+
+def storage_differences(payload, properties):
+    """
+    Find the properties of a storage payload whose values differ from the properties of a node.  The seeAlso links of a
+    node are shared with other sources, so they only differ when a link of the payload is missing from the node.
+    :param payload: storage payload.
+    :param properties: dictionary of property uri to the value or values of the node.
+    :return: sorted list of property uris that have different values.
+    """
+    properties = dict((str(key), normalize_values(values)) for key, values in properties.items())
+    changed = []
+
+    for key, values in normalize_properties(payload).items():
+        if key == SEE_ALSO:
+            if not set(values).issubset(properties.get(key, [])):
+                changed.append(key)
+        elif values != properties.get(key, []):
+            changed.append(key)
+
+    return sorted(changed)
+
+
+def parse_boolean(value):
+    """
+    Convert a configuration string into a boolean.
+    :param value: configuration value.
+    :return: bool
+    """
+    if isinstance(value, bool):
+        return value
+
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
 
 
-def foursquare_to_storage(foursquare, storage):
+def foursquare_to_storage(foursquare, storage, translator=None):
     """
     Translate the foursquare details of a venue into a storage object.
     :param foursquare: foursquare details.
     :param storage: storage object.
+    :param translator: venue translator, defaults to a translator using the default category mapping.
     :return: storage object.
     """
-    storage.add_type(WGS_84.SpatialThing)
-    storage.add_property(RDFS.seeAlso, 'foursquare://venues/%s' % foursquare['id'])
-    storage.add_property(SCHEMA.name, foursquare['name'])
+    global _translator
 
-    location = foursquare['location']
-    if 'lat' in location and 'lng' in location:
-        storage.add_property(WGS_84.lat, location['lat'])
-        storage.add_property(WGS_84.long, location['lng'])
+    if translator is None:
+        if _translator is None:
+            _translator = VenueTranslator(load_category_mapping())
+        translator = _translator
 
-    return storage
+    return translator.translate(foursquare, storage)
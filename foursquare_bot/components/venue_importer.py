@@ -0,0 +1,289 @@
+"""
+Bulk import of venues into the graph, from a list of venue identifiers or from a sweep of searches over an area.
+"""
+from collections import deque
+from rhobot.components.storage import StoragePayload
+from rhobot.components.storage.enums import FindFlags, FindResults
+from rhobot.namespace import WGS_84
+from rdflib.namespace import RDFS
+from foursquare_bot.components.circuit_breaker import CircuitOpen
+from foursquare_bot.components.metrics import MetricsRegistry
+from foursquare_bot.components.request_scheduler import MAINTENANCE
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class VenueImporter(object):
+    """
+    Streams venue identifiers through the lookup pipeline.  Only a fixed number of venues are in flight at a time and
+    the identifiers are pulled from their source as the imports finish, so the memory used does not depend on the size
+    of the import.  The nodes of the new venues are created in storage and their details are looked up at maintenance
+    priority, so that the writes are grouped by the write buffer of the lookup and the import does not take quota from
+    the provider.  The venues found by a sweep are translated in one pass when their search seeds the venue cache, and
+    the lookups of their new nodes store those translations.
+    """
+
+    # Number of venues between the progress messages in the log.
+    progress_interval = 100
+
+    def __init__(self, scheduler, storage_client, foursquare_lookup, concurrency=10, metrics=None, clock=time.time):
+        """
+        :param scheduler: rho_bot_scheduler.
+        :param storage_client: rho_bot_storage_client.
+        :param foursquare_lookup: foursquare_lookup plugin.
+        :param concurrency: maximum number of venues being imported at the same time.
+        :param metrics: metrics registry.
+        :param clock: callable returning the current time in seconds.
+        """
+        self._scheduler = scheduler
+        self._storage_client = storage_client
+        self._foursquare_lookup = foursquare_lookup
+        self.concurrency = concurrency
+        self._metrics = metrics or MetricsRegistry()
+        self._clock = clock
+
+        self._references = None
+        self._points = None
+        self._radius = None
+        self._query = None
+
+        # Venues found by the sweep that are waiting to be imported, and all of the venues the sweep has found.
+        self._pending = deque()
+        self._seen = set()
+        self._in_flight = 0
+        self._searching = False
+        self._promise = None
+
+        self.running = False
+        self.cancelled = False
+        self.started = None
+        self.finished = None
+        self.processed = 0
+        self.created = 0
+        self.existing = 0
+        self.failed = 0
+        self.searches = 0
+        self.search_failures = 0
+
+    def import_venues(self, references=None, points=None, radius=1000, query=None):
+        """
+        Start importing the venues.
+        :param references: iterable of venue identifiers, None values are skipped.
+        :param points: iterable of (latitude, longitude) tuples to search around.
+        :param radius: radius of the searches in meters.
+        :param query: optional query of the searches.
+        :return: promise resolved with the progress of the import when it has finished.
+        """
+        if self.running:
+            raise RuntimeError('Import is already running')
+
+        self._references = iter(references) if references is not None else None
+        self._points = iter(points) if points is not None else None
+        self._radius = radius
+        self._query = query
+
+        self.running = True
+        self.started = self._clock()
+        self._promise = self._scheduler.promise()
+
+        # Reading the identifiers and starting the first imports is left to the scheduler, so that the caller is not
+        # held up by the source of the import.
+        self._scheduler.defer(self._fill)
+
+        return self._promise
+
+    def cancel(self):
+        """
+        Stop starting new imports, the import finishes when the venues in flight have been imported.
+        :return:
+        """
+        self.cancelled = True
+        self._fill()
+
+    @property
+    def rate(self):
+        """
+        Number of venues processed per second.
+        :return:
+        """
+        if self.started is None:
+            return 0.0
+
+        elapsed = (self.finished or self._clock()) - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def progress(self):
+        """
+        Counters describing the progress of the import.
+        :return: dictionary
+        """
+        return dict(running=self.running, processed=self.processed, created=self.created, existing=self.existing,
+                    failed=self.failed, searches=self.searches, search_failures=self.search_failures,
+                    in_flight=self._in_flight, rate=self.rate)
+
+    def _fill(self):
+        """
+        Start importing venues until the concurrency limit is reached, and search the next point of the sweep when
+        there are not enough venues waiting.
+        :return:
+        """
+        if not self.running:
+            return
+
+        while not self.cancelled and self._in_flight < self.concurrency:
+            venue = self._next_venue()
+            if venue is None:
+                break
+
+            self._start(venue)
+
+        if not self.cancelled and not self._searching and len(self._pending) < self.concurrency:
+            self._search_next()
+
+        if not self._in_flight and not self._searching and (self.cancelled or self._exhausted()):
+            self._finish()
+
+    def _exhausted(self):
+        return self._references is None and self._points is None and not self._pending
+
+    def _next_venue(self):
+        """
+        Fetch the next venue identifier to import, the venues found by the sweep are imported first.
+        :return: venue identifier or None if none are available right now.
+        """
+        if self._pending:
+            return self._pending.popleft()
+
+        while self._references is not None:
+            try:
+                venue = next(self._references)
+            except StopIteration:
+                self._references = None
+                return None
+            except IOError as e:
+                logger.error('Unable to read the venues to import: %s' % e)
+                self._references = None
+                return None
+
+            if venue:
+                return venue
+
+        return None
+
+    def _search_next(self):
+        """
+        Search around the next point of the sweep, the venues found are queued for importing.
+        :return:
+        """
+        if self._points is None:
+            return
+
+        try:
+            latitude, longitude = next(self._points)
+        except StopIteration:
+            self._points = None
+            return
+
+        def found(venues):
+            self._searching = False
+
+            # The search areas overlap, so only the venues that have not been found by an earlier search are queued.
+            for venue in venues:
+                if venue['id'] not in self._seen:
+                    self._seen.add(venue['id'])
+                    self._pending.append(venue['id'])
+
+            self._fill()
+
+        def search_failed(error):
+            if isinstance(error, CircuitOpen):
+                # Search the point again once foursquare is available, the search stays in progress until then.
+                self._points = itertools.chain([(latitude, longitude)], self._points or [])
+                self._scheduler.schedule_task(self._resume_search,
+                                              delay=max(self._foursquare_lookup.circuit_wait(), 1.0))
+                return
+
+            logger.warning('Import search at %s, %s failed: %s' % (latitude, longitude, error))
+            self._searching = False
+            self.search_failures += 1
+            self._fill()
+
+        self._searching = True
+        self.searches += 1
+        self._foursquare_lookup.search_area(latitude, longitude, self._radius, self._query).then(found, search_failed)
+
+    def _resume_search(self):
+        self._searching = False
+        self._fill()
+
+    def _start(self, venue):
+        """
+        Find or create the node of the venue, and look up the details of the venue when the node was created.
+        :param venue: venue identifier.
+        :return:
+        """
+        self._in_flight += 1
+
+        reference = 'foursquare://venues/%s' % venue
+
+        payload = StoragePayload()
+        payload.add_type(WGS_84.SpatialThing)
+        payload.add_property(RDFS.seeAlso, reference)
+        payload.add_flag(FindFlags.CREATE_IF_MISSING, True)
+
+        def handle_results(result):
+            lookups = []
+
+            for res in result.results:
+                if FindResults.CREATED.fetch_from(res.flags):
+                    lookups.append(self._foursquare_lookup.schedule_lookup(res.about, reference, create=True,
+                                                                           priority=MAINTENANCE))
+
+            if not lookups:
+                return False
+
+            # Only a single node is created for a venue, wait for its details so that the import stays bounded.
+            return lookups[0].then(lambda lookup_result: True)
+
+        self._metrics.time_promise('storage_find_nodes', self._storage_client.find_nodes(payload)).then(
+            handle_results).then(self._imported, self._import_failed)
+
+    def _imported(self, created):
+        if created:
+            self.created += 1
+            self._metrics.increment('import_created')
+        else:
+            self.existing += 1
+            self._metrics.increment('import_existing')
+
+        self._processed()
+
+    def _import_failed(self, error):
+        logger.warning('Venue import failed: %s' % error)
+        self.failed += 1
+        self._metrics.increment('import_failed')
+
+        self._processed()
+
+    def _processed(self):
+        self._in_flight -= 1
+        self.processed += 1
+
+        if not self.processed % self.progress_interval:
+            logger.info('Imported %(processed)d venues (%(created)d created, %(existing)d existing, '
+                        '%(failed)d failed) at %(rate).1f venues/s' % self.progress())
+
+        self._fill()
+
+    def _finish(self):
+        self.running = False
+        self.finished = self._clock()
+        self._seen.clear()
+
+        logger.info('Import finished: %(processed)d venues (%(created)d created, %(existing)d existing, '
+                    '%(failed)d failed) at %(rate).1f venues/s' % self.progress())
+
+        self._promise.resolved(self.progress())
@@ -0,0 +1,159 @@
+"""
+In process search index over the foursquare venues that are stored in the graph.
+"""
+import bisect
+import re
+
+from foursquare_bot.components.spatial_index import GridIndex, distance_km
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Split text into lower case word tokens.
+    :param text: text to split.
+    :return: list of tokens.
+    """
+    return TOKEN_PATTERN.findall((text or u'').lower())
+
+
+def coordinates(venue):
+    """
+    Location of a venue.
+    :param venue: venue dictionary.
+    :return: tuple of the latitude and longitude, None if the venue does not have a location.
+    """
+    location = venue.get('location', None) or {}
+    if location.get('lat', None) is None or location.get('lng', None) is None:
+        return None
+
+    return location['lat'], location['lng']
+
+
+class VenueSearchIndex(object):
+    """
+    Indexes venues by the tokens of their names, with prefix matching on the query tokens, and by their location so
+    that searches can be limited to the venues near a point.  Venues are stored in the same dictionary format that is
+    returned by the foursquare search.
+    """
+
+    def __init__(self, cell_size=0.1):
+        self._venues = dict()
+        self._postings = dict()
+        self._tokens = []
+        self._locations = GridIndex(cell_size=cell_size)
+
+    def __len__(self):
+        return len(self._venues)
+
+    def __contains__(self, venue_id):
+        return venue_id in self._venues
+
+    def add(self, venue):
+        """
+        Add a venue to the index.  Venues that are already indexed are updated in place, unless their name or location
+        has changed, in which case they are indexed again.
+        :param venue: dictionary containing the id, name and location of the venue.
+        :return:
+        """
+        venue_id = venue['id']
+        previous = self._venues.get(venue_id, None)
+
+        if previous is not None:
+            if previous.get('name', None) == venue.get('name', None) and coordinates(previous) == coordinates(venue):
+                self._venues[venue_id] = venue
+                return
+
+            self.remove(venue_id)
+
+        self._venues[venue_id] = venue
+
+        for token in set(tokenize(venue.get('name', None))):
+            postings = self._postings.get(token, None)
+            if postings is None:
+                postings = self._postings[token] = set()
+                bisect.insort(self._tokens, token)
+            postings.add(venue_id)
+
+        location = coordinates(venue)
+        if location is not None:
+            self._locations.add(location[0], location[1], 0, venue_id)
+
+    def remove(self, venue_id):
+        """
+        Remove a venue from the index.
+        :param venue_id: identifier of the venue.
+        :return:
+        """
+        venue = self._venues.pop(venue_id, None)
+        if venue is None:
+            return
+
+        for token in set(tokenize(venue.get('name', None))):
+            postings = self._postings.get(token, None)
+            if postings is None:
+                continue
+
+            postings.discard(venue_id)
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+        location = coordinates(venue)
+        if location is not None:
+            self._locations.remove(location[0], location[1], venue_id)
+
+    def _prefix_matches(self, prefix):
+        """
+        Find all of the venues that have a token starting with the prefix.
+        :param prefix: token prefix.
+        :return: set of venue identifiers.
+        """
+        matches = set()
+        index = bisect.bisect_left(self._tokens, prefix)
+        while index < len(self._tokens) and self._tokens[index].startswith(prefix):
+            matches.update(self._postings[self._tokens[index]])
+            index += 1
+
+        return matches
+
+    def search(self, query=None, lat=None, lng=None, radius=25.0, limit=10):
+        """
+        Search the index.
+        :param query: text to match against the venue names, every token has to match the start of a name token.
+        :param lat: latitude of the center of the search.
+        :param lng: longitude of the center of the search.
+        :param radius: radius of the search in kilometers.
+        :param limit: maximum number of venues to return.
+        :return: list of venue dictionaries, exact token matches first and then by distance.
+        """
+        tokens = tokenize(query)
+        located = lat is not None and lng is not None
+
+        candidates = None
+        for token in tokens:
+            matches = self._prefix_matches(token)
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return []
+
+        if located:
+            nearby = set(self._locations.within(lat, lng, radius, limit=len(self._venues)))
+            candidates = nearby if candidates is None else candidates & nearby
+        elif candidates is None:
+            return []
+
+        def rank(venue_id):
+            venue = self._venues[venue_id]
+            name_tokens = set(tokenize(venue.get('name', None)))
+            exact = len([token for token in tokens if token in name_tokens])
+
+            distance = 0.0
+            if located:
+                location = venue['location']
+                distance = distance_km(lat, lng, location['lat'], location['lng'])
+
+            return -exact, distance
+
+        return [self._venues[venue_id] for venue_id in sorted(candidates, key=rank)[:limit]]
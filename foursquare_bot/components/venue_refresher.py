@@ -0,0 +1,204 @@
+"""
+Refreshes the details of the venues that have been populated, so that changes made to the venues on foursquare (new
+names, moved coordinates) are picked up.
+"""
+from sleekxmpp.plugins.base import base_plugin
+from rhobot.components.configuration import BotConfiguration
+from rhobot.components.storage import StoragePayload
+from rhobot.components.storage.enums import CypherFlags
+from rhobot.components.storage.namespace import NEO4J
+from rhobot.namespace import WGS_84, SCHEMA, GRAPH
+from rdflib.namespace import RDFS
+from foursquare_bot.components.configuration_enums import REFRESH_DAILY_BUDGET_KEY, REFRESH_AGE_KEY
+from foursquare_bot.components.utilities import get_configuration_value, first_value
+import json
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class VenueRefresher(base_plugin):
+    """
+    Periodically re-fetches the venues that have not been fetched for the refresh age, the venues that are referenced
+    by the most events first and then the venues that were fetched the longest time ago.  The number of venues that
+    are refreshed a day is limited by a budget, which is spread over the day.
+    """
+    name = 'venue_refresher'
+    description = 'Venue Refresher'
+    dependencies = {'rho_bot_storage_client', 'rho_bot_scheduler', 'rho_bot_configuration', 'foursquare_lookup',
+                    'foursquare_metrics', }
+
+    refresh_interval = 3600.0
+
+    # Number of venues that may be refreshed a day, and the number of seconds after which a venue is refreshed.
+    daily_budget = 500
+    refresh_age = 2592000.0
+
+    # Candidates are read in pages of the ranking, until enough stale venues have been found.
+    candidate_page_size = 500
+    max_candidate_pages = 10
+
+    query = """MATCH (n:`%s`)
+                   WHERE any(seeAlso in n.`%s` where seeAlso =~ '^foursquare:.*') and has(n.`%s`)
+                   OPTIONAL MATCH (n)<-[r:`http://purl.org/NET/c4dm/event.owl#place`]-(m)
+                   RETURN n AS node, count(r) AS rels
+                   ORDER BY rels DESC SKIP %%d LIMIT %%d""" % (str(WGS_84.SpatialThing),
+                                                             str(RDFS.seeAlso),
+                                                             str(SCHEMA.name))
+
+    def plugin_init(self):
+        self.query = ' '.join(self.query.replace('\n', ' ').replace('\r', '').split())
+
+        translation_key = dict(json.loads(CypherFlags.TRANSLATION_KEY.default))
+        translation_key[str(GRAPH.degree)] = 'rels'
+        self._translation_key = json.dumps(translation_key)
+
+        self._running = False
+
+        self.xmpp.add_event_handler(BotConfiguration.CONFIGURATION_RECEIVED_EVENT, self._configuration_updated)
+
+    def post_init(self):
+        super(VenueRefresher, self).post_init()
+
+        self._storage_client = self.xmpp['rho_bot_storage_client']
+        self._scheduler = self.xmpp['rho_bot_scheduler']
+        self._configuration = self.xmpp['rho_bot_configuration']
+        self._foursquare_lookup = self.xmpp['foursquare_lookup']
+        self._metrics = self.xmpp['foursquare_metrics'].registry
+
+    def _configuration_updated(self, event):
+        """
+        Start refreshing the venues periodically.
+        :param event:
+        :return:
+        """
+        self._scheduler.schedule_task(self.refresh, delay=self.refresh_interval, repeat=True)
+
+        # Only a single periodic refresh should be running.
+        self.xmpp.del_event_handler(BotConfiguration.CONFIGURATION_RECEIVED_EVENT, self._configuration_updated)
+
+    @property
+    def budget_remaining(self):
+        """
+        Number of venues that can still be refreshed today, the venues refreshed are recorded in the freshness store.
+        :return:
+        """
+        freshness = self._foursquare_lookup.freshness
+        if freshness is None:
+            return 0
+
+        budget = get_configuration_value(self._configuration, REFRESH_DAILY_BUDGET_KEY, self.daily_budget)
+        return max(budget - freshness.spent(), 0)
+
+    def _allowance(self):
+        """
+        Number of venues that can be refreshed by this run, so that the daily budget is spread over the day.
+        :return:
+        """
+        budget = get_configuration_value(self._configuration, REFRESH_DAILY_BUDGET_KEY, self.daily_budget)
+        return min(self.budget_remaining, int(math.ceil(budget * self.refresh_interval / 86400.0)))
+
+    def refresh(self):
+        """
+        Refresh the most important of the stale venues.
+        :return: promise resolved with the number of venues that were refreshed, or None if the refresh was skipped.
+        """
+        allowance = self._allowance()
+
+        if self._running or not allowance or self._foursquare_lookup.freshness is None:
+            return None
+
+        if self._foursquare_lookup.quota_wait():
+            logger.debug('Skipping venue refresh, there is no quota available')
+            return None
+
+        self._running = True
+        promise = self._find_stale_nodes(allowance).then(self._refresh_nodes)
+        promise.then(self._refresh_finished, self._refresh_failed)
+
+        return promise
+
+    def _find_stale_nodes(self, allowance):
+        """
+        Read the ranking of the venues until enough stale venues are found.
+        :param allowance: number of venues to find.
+        :return: promise resolved with the list of node uris to refresh.
+        """
+        age = get_configuration_value(self._configuration, REFRESH_AGE_KEY, self.refresh_age, float)
+        promise = self._scheduler.promise()
+        candidates = []
+
+        def fetch_page(page):
+            payload = StoragePayload()
+            payload.add_property(key=NEO4J.cypher,
+                                 value=self.query % (page * self.candidate_page_size, self.candidate_page_size))
+            payload.add_flag(CypherFlags.TRANSLATION_KEY, self._translation_key)
+
+            self._metrics.time_promise('storage_execute_cypher', self._storage_client.execute_cypher(payload)).then(
+                self._scheduler.generate_promise_handler(handle_page, page), promise.rejected)
+
+        def handle_page(result, page):
+            now = time.time()
+            references = dict((res.about, first_value(res.get_column(str(GRAPH.degree)), int) or 0)
+                              for res in result.results)
+            fetched = self._foursquare_lookup.freshness.fetched(references.keys())
+
+            for node_uri, count in references.items():
+                last_fetched = fetched.get(node_uri, 0.0)
+                if now - last_fetched >= age:
+                    candidates.append((-count, last_fetched, node_uri))
+
+            if len(candidates) >= allowance or len(result.results) < self.candidate_page_size or \
+                    page + 1 >= self.max_candidate_pages:
+                promise.resolved([node_uri for _, _, node_uri in sorted(candidates)[:allowance]])
+            else:
+                fetch_page(page + 1)
+
+        fetch_page(0)
+
+        return promise
+
+    def _refresh_nodes(self, node_uris):
+        """
+        Look up the nodes again, the lookup only writes the nodes whose details have changed.
+        :param node_uris: list of node uris.
+        :return: promise resolved with the number of nodes that were refreshed.
+        """
+        promise = self._scheduler.promise()
+        state = dict(pending=len(node_uris))
+
+        if not node_uris:
+            promise.resolved(0)
+            return promise
+
+        logger.info('Refreshing %s venues' % len(node_uris))
+
+        self._foursquare_lookup.freshness.spend(len(node_uris))
+        self._metrics.increment('venue_refreshes', len(node_uris))
+
+        def finished(result):
+            state['pending'] -= 1
+            if not state['pending']:
+                promise.resolved(len(node_uris))
+
+        def failed(error):
+            logger.error('Failed to refresh node: %s' % error)
+            finished(None)
+
+        for node_uri in node_uris:
+            self._foursquare_lookup.schedule_lookup(node_uri, refresh=True).then(finished, failed)
+
+        return promise
+
+    def _refresh_finished(self, count):
+        self._running = False
+        logger.debug('Refreshed %s venues, %s remaining in the budget' % (count, self.budget_remaining))
+
+    def _refresh_failed(self, error):
+        self._running = False
+        logger.error('Venue refresh failed: %s' % error)
+
+
+venue_refresher = VenueRefresher
@@ -0,0 +1,172 @@
+"""
+Persistent queue of the nodes that need their foursquare details populated.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WorkQueue(object):
+    """
+    Queue of node uris stored in a sqlite database, so that work survives restarts.  Entries are leased while they are
+    being worked, and are only removed once the work is complete, so every entry is delivered at least once: entries
+    whose lease expires are delivered again, and all leases are dropped when the queue is opened, as the work of a
+    previous process can not still be in flight.  Failed entries are retried with an exponential delay, and are parked
+    once they have failed too many times, or failed in a way that retrying can not fix.
+    """
+
+    def __init__(self, path, lease=600.0, retry_delay=60.0, max_retry_delay=86400.0, max_attempts=10,
+                 clock=time.time):
+        """
+        :param path: path to the sqlite database.
+        :param lease: number of seconds an entry is held by a consumer before it is delivered again.
+        :param retry_delay: number of seconds before an entry is delivered again after its first failure, doubling
+        with each further failure.
+        :param max_retry_delay: maximum number of seconds before a failed entry is delivered again.
+        :param max_attempts: number of failures after which an entry is parked.
+        :param clock: time source.
+        """
+        self.path = path
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS work '
+                                 '(node_uri TEXT PRIMARY KEY, created INTEGER NOT NULL, enqueued REAL NOT NULL, '
+                                 'available REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, '
+                                 'leased INTEGER NOT NULL DEFAULT 0, parked INTEGER NOT NULL DEFAULT 0)')
+
+        # Databases created before leases and parked entries were recorded are missing their columns.
+        columns = [row[1] for row in self._connection.execute('PRAGMA table_info(work)')]
+        for column in ('leased', 'parked'):
+            if column not in columns:
+                self._connection.execute('ALTER TABLE work ADD COLUMN %s INTEGER NOT NULL DEFAULT 0' % column)
+
+        self._connection.execute('CREATE INDEX IF NOT EXISTS work_parked_available ON work (parked, available)')
+
+        # Recover the entries that were leased by a previous process, entries waiting to be retried keep their delay.
+        recovered = self._connection.execute('UPDATE work SET available = ?, leased = 0 WHERE leased = 1',
+                                             (0.0, )).rowcount
+        self._connection.commit()
+
+        if recovered:
+            logger.info('Recovered %s work queue entries' % recovered)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT count(*) FROM work WHERE parked = 0').fetchone()[0]
+
+    def parked(self):
+        """
+        Number of entries that have been parked.
+        :return:
+        """
+        with self._lock:
+            return self._connection.execute('SELECT count(*) FROM work WHERE parked = 1').fetchone()[0]
+
+    def put(self, node_uri, created=False, leased=False):
+        """
+        Add a node to the queue, if it is not already queued or parked.
+        :param node_uri: uri of the node.
+        :param created: whether the node was created by this bot.
+        :param leased: whether the caller is working the node itself, in which case the entry is only delivered to
+        consumers if the lease expires or the entry is released.
+        :return:
+        """
+        now = self._clock()
+
+        with self._lock:
+            self._connection.execute('INSERT OR IGNORE INTO work (node_uri, created, enqueued, available, leased) '
+                                     'VALUES (?, ?, ?, ?, ?)',
+                                     (node_uri, int(created), now, now + self.lease if leased else now, int(leased)))
+            self._connection.commit()
+
+    def take(self, count):
+        """
+        Lease the next entries that are available.
+        :param count: maximum number of entries.
+        :return: list of (node_uri, created) tuples, the longest available first.
+        """
+        now = self._clock()
+
+        with self._lock:
+            rows = self._connection.execute('SELECT node_uri, created FROM work WHERE parked = 0 AND available <= ? '
+                                            'ORDER BY available, enqueued LIMIT ?', (now, count)).fetchall()
+
+            self._connection.executemany('UPDATE work SET available = ?, leased = 1 WHERE node_uri = ?',
+                                         [(now + self.lease, row[0]) for row in rows])
+            self._connection.commit()
+
+        return [(node_uri, bool(created)) for node_uri, created in rows]
+
+    def complete(self, node_uri):
+        """
+        Remove a node from the queue, as its work is done.
+        :param node_uri: uri of the node.
+        :return:
+        """
+        with self._lock:
+            self._connection.execute('DELETE FROM work WHERE node_uri = ?', (node_uri, ))
+            self._connection.commit()
+
+    def release(self, node_uri, failed=True):
+        """
+        Give up the lease of a node whose work did not complete, so that it is delivered again.
+        :param node_uri: uri of the node.
+        :param failed: whether the work of the node failed, which counts towards parking the entry and doubles the
+        delay before it is delivered again.  Work that could not be started is delivered again after the retry delay.
+        :return:
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT attempts FROM work WHERE node_uri = ?', (node_uri, )).fetchone()
+            if row is None:
+                return
+
+            attempts = row[0] + 1 if failed else row[0]
+            if attempts >= self.max_attempts:
+                logger.warning('Parking work queue entry %s after %s failures' % (node_uri, attempts))
+                self._connection.execute('UPDATE work SET attempts = ?, leased = 0, parked = 1 WHERE node_uri = ?',
+                                         (attempts, node_uri))
+            else:
+                self._connection.execute('UPDATE work SET available = ?, attempts = ?, leased = 0 WHERE node_uri = ?',
+                                         (self._clock() + self.retry_delay_for(attempts), attempts, node_uri))
+            self._connection.commit()
+
+    def park(self, node_uri):
+        """
+        Stop delivering a node whose work can never succeed.  The entry is kept, so that the node is not queued again.
+        :param node_uri: uri of the node.
+        :return:
+        """
+        logger.warning('Parking work queue entry %s' % node_uri)
+
+        with self._lock:
+            self._connection.execute('UPDATE work SET leased = 0, parked = 1 WHERE node_uri = ?', (node_uri, ))
+            self._connection.commit()
+
+    def retry_delay_for(self, attempts):
+        """
+        Delay before an entry is delivered again.
+        :param attempts: number of times the work of the entry has failed.
+        :return: seconds
+        """
+        return min(self.retry_delay * (2 ** min(max(attempts - 1, 0), 32)), self.max_retry_delay)
+
+    def next_available(self):
+        """
+        Time that the next entry will be available.
+        :return: epoch time, or None if the queue is empty.
+        """
+        with self._lock:
+            return self._connection.execute('SELECT min(available) FROM work WHERE parked = 0').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
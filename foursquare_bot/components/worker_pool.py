@@ -0,0 +1,141 @@
+"""
+Pool of worker threads that execute blocking foursquare requests off of the scheduler and event threads.
+"""
+from foursquare_bot.components.metrics import MetricsRegistry
+import itertools
+import logging
+import threading
+import time
+import Queue
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimeout(RuntimeError):
+    """
+    Raised when a synchronous call does not complete within the timeout of the pool.
+    """
+    pass
+
+
+class _Job(object):
+
+    def __init__(self, method, args, promise=None):
+        self.method = method
+        self.args = args
+        self.promise = promise
+        self.enqueued = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WorkerPool(object):
+    """
+    Executes methods on a set of daemon threads.  Results of submitted jobs are handed back to the scheduler so that
+    promise handlers are always executed on the scheduler thread.  Jobs are taken in priority order, so that an
+    interactive request does not wait behind a burst of background requests.
+    """
+
+    def __init__(self, scheduler, size=4, timeout=30.0, metrics=None):
+        """
+        :param scheduler: rho_bot_scheduler used to create and resolve promises.
+        :param size: number of worker threads.
+        :param timeout: number of seconds a synchronous call will wait for its result.
+        :param metrics: metrics registry.
+        """
+        self._scheduler = scheduler
+        self._queue = Queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._workers = []
+        self.timeout = timeout
+        self._metrics = metrics or MetricsRegistry()
+
+        self.resize(size)
+
+    @property
+    def size(self):
+        return len(self._workers)
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def resize(self, size):
+        """
+        Change the number of worker threads.
+        :param size: new number of worker threads.
+        :return:
+        """
+        size = max(size, 1)
+
+        while len(self._workers) < size:
+            worker = threading.Thread(target=self._run, name='foursquare-worker-%s' % len(self._workers))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+        while len(self._workers) > size:
+            self._workers.pop()
+            self._queue.put((-1, next(self._sequence), None))
+
+    def submit(self, priority, method, *args):
+        """
+        Execute the method on a worker thread.
+        :param priority: priority of the job, lower values are executed first.
+        :param method: method to execute.
+        :param args: arguments to the method.
+        :return: promise resolved with the result of the method.
+        """
+        promise = self._scheduler.promise()
+        self._queue.put((priority, next(self._sequence), _Job(method, args, promise)))
+
+        return promise
+
+    def call(self, priority, method, *args):
+        """
+        Execute the method on a worker thread, and wait for the result.
+        :param priority: priority of the job, lower values are executed first.
+        :param method: method to execute.
+        :param args: arguments to the method.
+        :return: result of the method.
+        """
+        job = _Job(method, args)
+        self._queue.put((priority, next(self._sequence), job))
+
+        if not job.done.wait(self.timeout):
+            raise RequestTimeout('Request did not complete within %s seconds' % self.timeout)
+
+        if job.error is not None:
+            raise job.error
+
+        return job.result
+
+    def _run(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+
+            self._metrics.observe('worker_queue_wait', time.time() - job.enqueued)
+
+            try:
+                job.result = job.method(*job.args)
+            except Exception as e:
+                logger.debug('Worker job failed: %s' % e)
+                job.error = e
+
+            job.done.set()
+
+            if job.promise is not None:
+                self._scheduler.schedule_task(self._generate_completion(job), delay=0.0)
+
+    @staticmethod
+    def _generate_completion(job):
+        def complete():
+            if job.error is not None:
+                job.promise.rejected(job.error)
+            else:
+                job.promise.resolved(job.result)
+
+        return complete
@@ -0,0 +1,186 @@
+"""
+Write behind buffer for the venue updates, so that updates are sent to storage and published in groups.
+"""
+from collections import OrderedDict
+from foursquare_bot.components.metrics import MetricsRegistry
+import copy
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBufferFull(RuntimeError):
+    """
+    Raised when an update is not buffered because storage has fallen too far behind.
+    """
+    pass
+
+
+class StorageWriteBuffer(object):
+    """
+    Buffers node updates and flushes them to storage when the buffer is full or the flush interval expires.  Only a
+    single flush is in flight at a time, so when storage is slow the updates wait in the buffer and the promises of the
+    callers are resolved later, slowing down the producers.  Updates of nodes that are not buffered yet are rejected
+    once max_pending updates are waiting, and producers that take on new work check saturated first.  The results of
+    each flush are published to the channel as a single created and a single updated notification.
+    """
+
+    def __init__(self, scheduler, storage_client, rdf_publish, flush_size=20, flush_interval=1.0, max_pending=200,
+                 metrics=None):
+        """
+        :param scheduler: rho_bot_scheduler.
+        :param storage_client: rho_bot_storage_client.
+        :param rdf_publish: rho_bot_rdf_publish.
+        :param flush_size: number of buffered updates that trigger a flush.
+        :param flush_interval: maximum number of seconds an update waits before it is flushed.
+        :param max_pending: maximum number of updates waiting in the buffer.
+        :param metrics: metrics registry.
+        """
+        self._scheduler = scheduler
+        self._storage_client = storage_client
+        self._rdf_publish = rdf_publish
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._metrics = metrics or MetricsRegistry()
+
+        self._buffer = OrderedDict()
+        self._flushing = False
+        self._flush_scheduled = False
+
+        self.flushes = 0
+        self.writes = 0
+        self.rejected = 0
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    @property
+    def saturated(self):
+        """
+        True when a flush is in flight and the buffer has filled up behind it.
+        :return:
+        """
+        return self._flushing and len(self._buffer) >= self.flush_size
+
+    def update_node(self, payload, created=False):
+        """
+        Buffer an update of a node.  If the node already has an update buffered, it is replaced by this one.
+        :param payload: storage payload of the update.
+        :param created: whether the node should be published as created rather than updated.
+        :return: promise resolved with the storage result of the update, rejected with WriteBufferFull if the buffer is
+        full.
+        """
+        promise = self._scheduler.promise()
+
+        if len(self._buffer) >= self.max_pending and payload.about not in self._buffer:
+            self.rejected += 1
+            self._metrics.increment('write_rejected')
+            promise.rejected(WriteBufferFull('Storage write buffer is full'))
+            return promise
+
+        previous = self._buffer.pop(payload.about, None)
+        promises = previous[2] if previous else []
+        promises.append(promise)
+        created = created or (previous[1] if previous else False)
+
+        self._buffer[payload.about] = (payload, created, promises)
+
+        if len(self._buffer) >= self.flush_size:
+            self.flush()
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._scheduler.schedule_task(self._scheduled_flush, delay=self.flush_interval)
+
+        return promise
+
+    def flush(self):
+        """
+        Send the buffered updates to storage, unless a flush is already in flight in which case the updates will be
+        sent when it completes.
+        :return:
+        """
+        if self._flushing or not self._buffer:
+            return
+
+        batch = list(self._buffer.values())
+        self._buffer.clear()
+        self._flushing = True
+        self.flushes += 1
+        self.writes += len(batch)
+
+        state = dict(pending=len(batch), results=[None] * len(batch))
+
+        def generate_handlers(index):
+            def resolved(result):
+                state['results'][index] = result
+                finished()
+
+            def rejected(error):
+                state['results'][index] = error if isinstance(error, Exception) else RuntimeError(error)
+                finished()
+
+            return resolved, rejected
+
+        def finished():
+            state['pending'] -= 1
+            if not state['pending']:
+                self._flushed(batch, state['results'])
+
+        for index, (payload, created, promises) in enumerate(batch):
+            resolved, rejected = generate_handlers(index)
+            self._metrics.time_promise('storage_update_node', self._storage_client.update_node(payload)).then(
+                resolved, rejected)
+
+    def _scheduled_flush(self):
+        self._flush_scheduled = False
+        self.flush()
+
+    def _flushed(self, batch, results):
+        """
+        Publish the results of the flush, notify the callers, and start the next flush if there is work waiting.
+        :param batch: list of the buffered updates.
+        :param results: storage results, or exceptions, in the same order as the batch.
+        :return:
+        """
+        self._flushing = False
+
+        created = [result for (_, is_created, _), result in zip(batch, results)
+                   if is_created and not isinstance(result, Exception)]
+        updated = [result for (_, is_created, _), result in zip(batch, results)
+                   if not is_created and not isinstance(result, Exception)]
+
+        self._publish(created, True)
+        self._publish(updated, False)
+
+        for (_, _, promises), result in zip(batch, results):
+            for promise in promises:
+                if isinstance(result, Exception):
+                    promise.rejected(result)
+                else:
+                    promise.resolved(result)
+
+        if len(self._buffer) >= self.flush_size:
+            self.flush()
+        elif self._buffer and not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._scheduler.schedule_task(self._scheduled_flush, delay=self.flush_interval)
+
+    def _publish(self, results, created):
+        """
+        Publish all of the result collections as a single notification.
+        :param results: list of result collections.
+        :param created: whether the nodes were created.
+        :return:
+        """
+        results = [result for result in results if result is not None]
+        if not results:
+            return
+
+        # The results have already been handed to the callers, so they are combined into a copy.
+        aggregate = copy.copy(results[0])
+        aggregate.results = [res for result in results for res in result.results]
+
+        with self._metrics.timer('rdf_publish'):
+            self._rdf_publish.publish_all_results(aggregate, created=created)
@@ -15,11 +15,15 @@ application.pre_init(load_components)
 @application.post_init
 def register_plugins(bot):
     # Bot Specific Components
+    bot.register_plugin('foursquare_metrics')
     bot.register_plugin('foursquare_lookup')
     bot.register_plugin('knowledge_provider')
     bot.register_plugin('knowledge_maintainer')
     bot.register_plugin('search_handler')
+    bot.register_plugin('venue_refresher')
 
     # Commands
     bot.register_plugin('configure_client_details')
     bot.register_plugin('search_venues')
+    bot.register_plugin('show_metrics')
+    bot.register_plugin('import_venues')
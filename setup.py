@@ -8,6 +8,7 @@ setup(
               'foursquare_bot.components.commands',
               'foursquare_bot.components.events',
               ],
+    package_data={'foursquare_bot': ['data/*.json']},
     url='',
     license='BSD',
     author='Robert Robinson',
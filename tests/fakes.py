@@ -0,0 +1,102 @@
+"""
+Fakes of the scheduler and its promises that are shared by the tests.
+"""
+
+
+class Promise(object):
+    """
+    Promise that runs its handlers as soon as it is settled, and chains the values returned by them like the promises
+    of the scheduler.
+    """
+
+    def __init__(self):
+        self.handlers = []
+        self.state = None
+        self.value = None
+
+    def then(self, resolved=None, rejected=None):
+        promise = Promise()
+        self.handlers.append((resolved, rejected, promise))
+        if self.state:
+            self._notify()
+        return promise
+
+    def resolved(self, value):
+        if isinstance(value, Promise):
+            value.then(self.resolved, self.rejected)
+            return
+
+        self._settle('resolved', value)
+
+    def rejected(self, error):
+        self._settle('rejected', error)
+
+    def _settle(self, state, value):
+        self.state = state
+        self.value = value
+        self._notify()
+
+    def _notify(self):
+        handlers, self.handlers = self.handlers, []
+        for resolved, rejected, promise in handlers:
+            handler = resolved if self.state == 'resolved' else rejected
+            if handler is None:
+                getattr(promise, self.state)(self.value)
+                continue
+
+            try:
+                promise.resolved(handler(self.value))
+            except Exception as e:
+                promise.rejected(e)
+
+
+def resolved_promise(value):
+    promise = Promise()
+    promise.resolved(value)
+    return promise
+
+
+def rejected_promise(error):
+    promise = Promise()
+    promise.rejected(error)
+    return promise
+
+
+class Scheduler(object):
+    """
+    Records the scheduled tasks and the deferred calls, so that the test decides when they run.
+    """
+
+    def __init__(self):
+        self.tasks = []
+        self.deferred = []
+
+    def promise(self):
+        return Promise()
+
+    def schedule_task(self, callback, delay=0.0, repeat=False):
+        self.tasks.append((callback, delay))
+
+    def run_tasks(self):
+        tasks, self.tasks = self.tasks, []
+        for callback, _ in tasks:
+            callback()
+
+    def defer(self, method, *args):
+        promise = Promise()
+        self.deferred.append((method, args, promise))
+        return promise
+
+    def run_deferred(self):
+        deferred, self.deferred = self.deferred, []
+        for method, args, promise in deferred:
+            try:
+                promise.resolved(method(*args))
+            except Exception as e:
+                promise.rejected(e)
+
+    def generate_promise_handler(self, method, *args):
+        def handler(result):
+            return method(result, *args)
+
+        return handler
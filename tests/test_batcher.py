@@ -0,0 +1,62 @@
+"""
+Test the micro batching of venue requests.
+"""
+
+import unittest
+from foursquare_bot.components.batcher import MicroBatcher
+from tests.fakes import Promise, Scheduler
+
+
+class MicroBatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.batches = []
+        self.batcher = MicroBatcher(self.scheduler, self.execute, batch_size=5, window=0.25)
+
+    def execute(self, keys, priority):
+        promise = Promise()
+        self.batches.append((keys, priority, promise))
+        return promise
+
+    def test_flushes_full_batch(self):
+        promises = [self.batcher.submit('venue_%s' % index, priority=2) for index in range(5)]
+
+        self.assertEqual(len(self.batches), 1)
+        keys, priority, promise = self.batches[0]
+        self.assertEqual(keys, ['venue_%s' % index for index in range(5)])
+        self.assertEqual(priority, 2)
+
+        error = RuntimeError('Venue not found')
+        promise.resolved(['a', 'b', 'c', 'd', error])
+        self.assertEqual([result.value for result in promises], ['a', 'b', 'c', 'd', error])
+        self.assertEqual(promises[4].state, 'rejected')
+
+    def test_flushes_after_window(self):
+        first = self.batcher.submit('venue_a', priority=2)
+        duplicate = self.batcher.submit('venue_a', priority=1)
+        self.batcher.submit('venue_b', priority=2)
+
+        self.assertEqual(self.batches, [])
+        self.assertEqual(self.batcher.pending, 2)
+        self.assertEqual([delay for _, delay in self.scheduler.tasks], [0.25])
+
+        self.scheduler.run_tasks()
+        keys, priority, promise = self.batches[0]
+        self.assertEqual((keys, priority), (['venue_a', 'venue_b'], 1))
+
+        promise.rejected(RuntimeError('Request failed'))
+        self.assertEqual((first.state, duplicate.state), ('rejected', 'rejected'))
+
+    def test_splits_large_batches(self):
+        self.batcher.batch_size = 10
+        for index in range(7):
+            self.batcher.submit('venue_%s' % index)
+
+        # A batch larger than the multi endpoint allows is executed as several requests.
+        self.batcher.batch_size = 5
+        self.batcher.flush()
+
+        self.assertEqual([len(keys) for keys, _, _ in self.batches], [5, 2])
+        self.assertEqual(self.batcher.pending, 0)
+        self.assertEqual((self.batcher.batches, self.batcher.batched_keys), (2, 7))
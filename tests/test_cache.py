@@ -0,0 +1,74 @@
+"""
+Test the caches used by the foursquare lookup.
+"""
+
+import unittest
+from foursquare_bot.components.cache import LRUCache, VenueCache
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.put('c', 3)
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_expires_entries(self):
+        clock = Clock()
+        cache = LRUCache(max_size=2, ttl=10.0, clock=clock)
+
+        cache.put('a', 1)
+        clock.now += 11.0
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('a', stale=True), 1)
+
+
+class VenueCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = VenueCache(':memory:', ttl=10.0, memory_size=1, clock=self.clock)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_falls_back_to_database(self):
+        self.cache.put('venue_a', dict(id='venue_a', name='A'))
+        self.cache.put('venue_b', dict(id='venue_b', name='B'))
+
+        # venue_a has been evicted from memory, but is still in the database.
+        self.assertEqual(self.cache.get('venue_a')['name'], 'A')
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.metrics()['memory_evictions'], 2)
+
+    def test_expired_and_invalidated_venues_are_misses(self):
+        self.cache.put('venue_a', dict(id='venue_a', name='A'))
+        self.cache.put('venue_b', dict(id='venue_b', name='B'))
+
+        self.cache.invalidate('venue_b')
+        self.assertIsNone(self.cache.get('venue_b'))
+
+        self.clock.now += 11.0
+        self.assertIsNone(self.cache.get('venue_a'))
+        self.assertEqual(self.cache.misses, 2)
@@ -0,0 +1,71 @@
+"""
+Test the circuit breaker around the foursquare requests.
+"""
+
+import unittest
+from foursquare_bot.components.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = CircuitBreaker(window_size=10, minimum_requests=4, failure_rate=0.5, latency_threshold=5.0,
+                                      open_duration=30.0, max_open_duration=100.0, clock=self.clock)
+
+    def test_opens_on_failure_rate(self):
+        self.breaker.success(0.1)
+        self.breaker.failure()
+        self.breaker.success(0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.wait_time(), 30.0)
+        self.assertEqual(self.breaker.rejected, 1)
+
+    def test_slow_requests_count_as_failures(self):
+        for _ in range(4):
+            self.breaker.success(6.0)
+
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_probe_closes_circuit(self):
+        for _ in range(4):
+            self.breaker.failure()
+
+        self.clock.now += 30.0
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+        # Only a single probe is let through at a time.
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.success(0.1)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.wait_time(), 0.0)
+
+    def test_failed_probe_reopens_for_longer(self):
+        for _ in range(4):
+            self.breaker.failure()
+
+        for duration in (60.0, 100.0):
+            self.clock.now += 100.0
+            self.assertTrue(self.breaker.allow())
+            self.breaker.failure()
+
+            self.assertEqual(self.breaker.state, OPEN)
+            self.assertEqual(self.breaker.wait_time(), duration)
+
+        self.assertEqual(self.breaker.trips, 3)
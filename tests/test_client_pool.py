@@ -0,0 +1,116 @@
+"""
+Test the routing and quarantine of the foursquare client pool.
+"""
+
+import foursquare
+import unittest
+from foursquare_bot.components.client_pool import ClientPool, load_credentials, parse_credentials, dump_credentials
+from foursquare_bot.components.foursquare_client import ClientNotConfigured
+from foursquare_bot.components.request_scheduler import QuotaExhausted
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Requester(object):
+
+    def __init__(self):
+        self.rate_limit_listener = None
+
+
+class Client(object):
+
+    def __init__(self, identifier, secret):
+        self.identifier = identifier
+        self.secret = secret
+        self.base_requester = Requester()
+        self.error = None
+
+    def report(self, limit=None, remaining=None, reset=None):
+        self.base_requester.rate_limit_listener(limit=limit, remaining=remaining, reset=reset)
+
+    def request(self):
+        if self.error:
+            raise self.error
+        return self.identifier
+
+
+def request(client):
+    return client.request()
+
+
+class ClientPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.limits = []
+        self.pool = ClientPool(Client, rate_limit_listener=lambda **limits: self.limits.append(limits),
+                               clock=self.clock)
+        self.pool.configure([('a', '1'), ('b', '2')])
+        self.first, self.second = self.pool.clients()
+
+    def test_routes_to_most_remaining_quota(self):
+        self.first.report(limit=5000, remaining=100)
+        self.second.report(limit=5000, remaining=4000)
+
+        self.assertEqual(self.pool.call(request), 'b')
+        self.assertEqual(self.limits[-1], dict(limit=10000, remaining=4100, reset=None))
+
+        # A client that has run out is skipped until its window resets.
+        self.second.report(remaining=0, reset=2000.0)
+        self.first.report(remaining=0, reset=1500.0)
+        self.assertEqual(self.limits[-1], dict(limit=10000, remaining=0, reset=1500.0))
+        self.assertRaises(QuotaExhausted, self.pool.call, request)
+
+        self.clock.now = 1500.0
+        self.assertEqual(self.pool.call(request), 'a')
+
+    def test_retries_with_another_client(self):
+        self.first.report(remaining=100)
+        self.second.report(remaining=4000)
+        self.second.error = foursquare.RateLimitExceeded('Quota exceeded')
+
+        self.assertEqual(self.pool.call(request), 'a')
+
+        self.first.error = foursquare.ParamError('Bad request')
+        self.assertRaises(foursquare.ParamError, self.pool.call, request)
+
+    def test_quarantines_rejected_credentials(self):
+        self.first.error = foursquare.InvalidAuth('Invalid client')
+
+        self.assertEqual(self.pool.call(request), 'b')
+        self.assertEqual(self.pool.available(), 1)
+        self.assertEqual(self.limits[-1]['limit'], 5000)
+
+        self.assertEqual(self.pool.call(request), 'b')
+
+        # The quarantine doubles when the credentials are still rejected.
+        self.clock.now += ClientPool.quarantine_duration
+        self.second.error = foursquare.NotAuthorized('Not authorized')
+        self.assertRaises(foursquare.NotAuthorized, self.pool.call, request)
+        self.assertEqual([status['quarantined'] for status in self.pool.status()],
+                         [ClientPool.quarantine_duration * 2, ClientPool.quarantine_duration])
+        self.assertRaises(ClientNotConfigured, self.pool.call, request)
+
+    def test_configure_keeps_unchanged_clients(self):
+        self.pool.configure([('b', '2'), ('c', '3')])
+
+        self.assertIs(self.pool.clients()[0], self.second)
+        self.assertEqual([client.identifier for client in self.pool.clients()], ['b', 'c'])
+
+        self.pool.configure([])
+        self.assertEqual(len(self.pool), 0)
+        self.assertRaises(ClientNotConfigured, self.pool.call, request)
+
+    def test_credentials(self):
+        additional = dump_credentials(parse_credentials('# other apps\nb:2\n\nc, 3\na 1\nb:2'))
+
+        self.assertEqual(load_credentials('a', '1', additional), [('a', '1'), ('b', '2'), ('c', '3')])
+        self.assertEqual(load_credentials(None, None, 'not json'), [])
+        self.assertRaises(ValueError, parse_credentials, ['missing-secret'])
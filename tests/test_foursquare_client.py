@@ -0,0 +1,66 @@
+"""
+Test the venue batches requested by the foursquare client.
+"""
+
+import foursquare
+import threading
+import time
+import unittest
+import urlparse
+from foursquare_bot.components.foursquare_client import FoursquareClient
+
+
+def multi_response(url):
+    """
+    Answer a multi request with the venue of each sub request, or an error for venues named missing.
+    """
+    requests = dict(urlparse.parse_qsl(urlparse.urlparse(url).query))['requests'].split(',')
+
+    responses = []
+    for request in requests:
+        venue_id = request.split('/')[-1]
+        if venue_id == 'missing':
+            responses.append(dict(meta=dict(code=400, errorType='param_error', errorDetail='Invalid venue')))
+        else:
+            responses.append(dict(meta=dict(code=200), response=dict(venue=dict(id=venue_id))))
+
+    # Give the other threads a chance to run while the request is in flight.
+    time.sleep(0.01)
+
+    return dict(responses=responses)
+
+
+class FoursquareClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FoursquareClient(client_id='a', client_secret='b')
+        self.client.base_requester._request = multi_response
+
+    @staticmethod
+    def venues(results):
+        return [result['venue']['id'] for result in results]
+
+    def test_multi_venues(self):
+        results = self.client.multi_venues(['1', 'missing', '3', '4', '5', '6', '7'])
+
+        self.assertEqual(self.venues(results[:1] + results[2:]), ['1', '3', '4', '5', '6', '7'])
+        self.assertIsInstance(results[1], foursquare.ParamError)
+
+    def test_concurrent_batches(self):
+        batches = [['a%s' % index for index in range(5)], ['b%s' % index for index in range(5)],
+                   ['c%s' % index for index in range(3)]]
+        results = dict()
+
+        def request(batch):
+            for _ in range(5):
+                results.setdefault(batch[0], []).append(self.venues(self.client.multi_venues(batch)))
+
+        threads = [threading.Thread(target=request, args=(batch, )) for batch in batches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Each batch gets back exactly its own venues, however the requests were interleaved.
+        for batch in batches:
+            self.assertEqual(results[batch[0]], [batch] * 5)
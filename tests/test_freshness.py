@@ -0,0 +1,89 @@
+"""
+Test the record of when the venue details of nodes were fetched.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from foursquare_bot.components.freshness import FreshnessStore
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FreshnessStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.store = FreshnessStore(':memory:', clock=self.clock)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_touch(self):
+        self.store.touch('node/1', 'venue1')
+        self.store.touch('node/2', 'venue2', fetched=500.0)
+
+        self.clock.now += 10.0
+        self.store.touch('node/1', 'venue1')
+
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(self.store.fetched(['node/1', 'node/2', 'node/3']), {'node/1': 1010.0, 'node/2': 500.0})
+
+    def test_record_content(self):
+        self.assertEqual(self.store.content('node/1'), (None, None))
+
+        self.store.record('node/1', 'venue1', 'digest', {'name': ['Venue']})
+
+        # Content written without fetching the details does not make the node fresh.
+        self.assertEqual(self.store.fetched(['node/1']), {'node/1': 0.0})
+
+        self.store.touch('node/1', 'venue1', fetched=2000.0)
+
+        self.assertEqual(self.store.content('node/1'), ('digest', {'name': ['Venue']}))
+        self.assertEqual(self.store.fetched(['node/1']), {'node/1': 2000.0})
+
+    def test_budget(self):
+        self.assertEqual(self.store.spent(), 0)
+
+        self.store.spend(3)
+        self.store.spend(2)
+        self.assertEqual(self.store.spent(), 5)
+
+        # The budget starts again the next day.
+        self.clock.now += 86400.0
+        self.assertEqual(self.store.spent(), 0)
+        self.store.spend(1)
+        self.assertEqual(self.store.spent(), 1)
+
+    def test_budget_survives_reopening(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'freshness.db')
+            store = FreshnessStore(path, clock=self.clock)
+            store.spend(4)
+            store.close()
+
+            store = FreshnessStore(path, clock=self.clock)
+            self.assertEqual(store.spent(), 4)
+            store.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_fetched_many(self):
+        node_uris = ['node/%s' % index for index in range(1200)]
+        for node_uri in node_uris:
+            self.store.touch(node_uri, None)
+
+        self.assertEqual(len(self.store.fetched(node_uris)), 1200)
+
+
+if __name__ == '__main__':
+    unittest.main()
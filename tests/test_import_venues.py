@@ -0,0 +1,42 @@
+"""
+Test the export files that the import venues command will read.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from foursquare_bot.components.commands.import_venues import read_venue_references, resolve_import_path
+
+
+class ImportVenuesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resolve_import_path(self):
+        path = os.path.join(self.directory, 'venues.txt')
+        with open(path, 'w') as export:
+            export.write('# Venues\n4be0b4f0652b0f475f607311\n\nfoursquare://venues/4be0b4f0652b0f475f607312\n')
+
+        self.assertEqual(resolve_import_path(self.directory, 'venues.txt'), os.path.realpath(path))
+        self.assertEqual(list(read_venue_references(resolve_import_path(self.directory, 'venues.txt'))),
+                         ['4be0b4f0652b0f475f607311', '4be0b4f0652b0f475f607312'])
+
+        # Files outside of the import directory are refused.
+        self.assertIsNone(resolve_import_path(self.directory, '/etc/passwd'))
+        self.assertIsNone(resolve_import_path(self.directory, '../venues.txt'))
+        self.assertIsNone(resolve_import_path(self.directory, '../%s_other/venues.txt' %
+                                              os.path.basename(self.directory)))
+        self.assertIsNone(resolve_import_path(None, 'venues.txt'))
+
+        # Links out of the import directory are refused as well.
+        os.symlink('/etc/passwd', os.path.join(self.directory, 'link.txt'))
+        self.assertIsNone(resolve_import_path(self.directory, 'link.txt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
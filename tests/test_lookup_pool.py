@@ -0,0 +1,71 @@
+"""
+Test the bounds and priorities of the lookup pool.
+"""
+
+import unittest
+from foursquare_bot.components.lookup_pool import LookupPool, LookupQueueFull, REJECT_NEW, SHED_LOWEST
+from foursquare_bot.components.request_scheduler import INTERACTIVE, PROVIDER, MAINTENANCE
+from tests.fakes import Scheduler
+
+
+def lookup(name):
+    return name
+
+
+class LookupPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.pool = LookupPool(self.scheduler, max_in_flight=1, max_queued=2)
+
+    def started(self):
+        return [args[0] for _, args, _ in self.scheduler.deferred]
+
+    def finish(self, index, value=None):
+        self.scheduler.deferred[index][2].resolved(value)
+
+    def test_runs_in_priority_order(self):
+        first = self.pool.submit(MAINTENANCE, lookup, 'maintenance')
+        self.pool.submit(MAINTENANCE, lookup, 'refresh')
+        self.pool.submit(PROVIDER, lookup, 'provider')
+
+        self.assertEqual(self.started(), ['maintenance'])
+        self.assertEqual(self.pool.queue_length, 2)
+        self.assertEqual(self.pool.queued_by_priority(), {MAINTENANCE: 1, PROVIDER: 1})
+
+        self.finish(0, 'done')
+        self.assertEqual(first.value, 'done')
+        self.assertEqual(self.started(), ['maintenance', 'provider'])
+
+        self.finish(1)
+        self.assertEqual(self.started(), ['maintenance', 'provider', 'refresh'])
+        self.assertEqual(self.pool.queue_length, 0)
+        self.assertEqual(self.pool.in_flight, 1)
+
+    def test_sheds_lowest_priority(self):
+        self.pool.submit(MAINTENANCE, lookup, 'running')
+        shed = self.pool.submit(MAINTENANCE, lookup, 'refresh')
+        self.pool.submit(PROVIDER, lookup, 'provider')
+
+        interactive = self.pool.submit(INTERACTIVE, lookup, 'interactive')
+        self.assertIsNone(interactive.state)
+        self.assertEqual(shed.state, 'rejected')
+        self.assertIsInstance(shed.value, LookupQueueFull)
+
+        # Nothing of a lower priority is left to shed for another provider lookup.
+        rejected = self.pool.submit(PROVIDER, lookup, 'another provider')
+        self.assertEqual(rejected.state, 'rejected')
+        self.assertEqual((self.pool.shed, self.pool.rejected), (1, 1))
+
+        self.finish(0)
+        self.assertEqual(self.started(), ['running', 'interactive'])
+
+    def test_reject_new(self):
+        self.pool.overflow = REJECT_NEW
+        self.pool.submit(MAINTENANCE, lookup, 'running')
+        self.pool.submit(MAINTENANCE, lookup, 'first')
+        self.pool.submit(MAINTENANCE, lookup, 'second')
+
+        self.assertEqual(self.pool.submit(INTERACTIVE, lookup, 'interactive').state, 'rejected')
+        self.assertEqual(self.pool.queue_length, 2)
+        self.assertEqual(SHED_LOWEST, LookupPool(self.scheduler).overflow)
@@ -0,0 +1,104 @@
+"""
+Test the scheduling decisions made by the knowledge maintainer.
+"""
+
+import time
+import unittest
+import foursquare
+from foursquare_bot.components.circuit_breaker import CircuitOpen
+from foursquare_bot.components.foursquare_client import ClientNotConfigured
+from foursquare_bot.components.maintainer import KnowledgeMaintainer, NoWork, failure_cause, NO_WORK, \
+    CLIENT_MISSING, QUOTA, OUTAGE, STORAGE_BUSY, FAILURE
+from foursquare_bot.components.metrics import MetricsRegistry
+from foursquare_bot.components.request_scheduler import QuotaExhausted
+from foursquare_bot.components.write_buffer import WriteBufferFull
+from tests.fakes import Scheduler
+
+
+class WorkQueue(object):
+
+    def __init__(self):
+        self.available = None
+
+    def next_available(self):
+        return self.available
+
+
+class Lookup(object):
+
+    def __init__(self):
+        self.work_queue = WorkQueue()
+
+
+class KnowledgeMaintainerTestCase(unittest.TestCase):
+
+    def _maintainer(self):
+        maintainer = KnowledgeMaintainer(None)
+        maintainer._scheduler = Scheduler()
+        maintainer._metrics = MetricsRegistry()
+        maintainer._foursquare_lookup = Lookup()
+        maintainer._started = True
+        maintainer._running = False
+        maintainer._generation = 0
+        maintainer._next_run = None
+        maintainer._sleep_cause = None
+        maintainer._wake_requested = False
+        maintainer._failures = 0
+        maintainer._reconciled = time.time()
+        return maintainer
+
+    def test_failure_cause(self):
+
+        self.assertEqual(failure_cause(NoWork()), NO_WORK)
+        self.assertEqual(failure_cause(ClientNotConfigured()), CLIENT_MISSING)
+        self.assertEqual(failure_cause(QuotaExhausted()), QUOTA)
+        self.assertEqual(failure_cause(foursquare.RateLimitExceeded()), QUOTA)
+        self.assertEqual(failure_cause(CircuitOpen()), OUTAGE)
+        self.assertEqual(failure_cause(WriteBufferFull()), STORAGE_BUSY)
+        self.assertEqual(failure_cause(foursquare.ServerError()), FAILURE)
+        self.assertEqual(failure_cause('Storage request failed'), FAILURE)
+
+    def test_backoff_delay(self):
+        maintainer = KnowledgeMaintainer(None)
+
+        for failures, maximum in ((1, 5.0), (2, 10.0), (3, 20.0), (20, 600.0), (100, 600.0)):
+            delay = maintainer.backoff_delay(failures)
+            self.assertLessEqual(delay, maximum)
+            self.assertGreaterEqual(delay, maximum / 2.0)
+
+    def test_node_created_idle(self):
+        maintainer = self._maintainer()
+
+        maintainer._work_failed(NoWork())
+        self.assertEqual(maintainer._sleep_cause, NO_WORK)
+        self.assertEqual(maintainer._scheduler.tasks[-1][1], maintainer.no_work_delay)
+
+        # The created node is available once its lease in the work queue expires.
+        maintainer._foursquare_lookup.work_queue.available = time.time() + 120.0
+        maintainer._node_created({})
+        self.assertEqual(len(maintainer._scheduler.tasks), 2)
+        self.assertLessEqual(maintainer._scheduler.tasks[-1][1], 120.0)
+        self.assertGreater(maintainer._scheduler.tasks[-1][1], maintainer.work_to_do_delay)
+
+    def test_node_created_backoff(self):
+        maintainer = self._maintainer()
+
+        maintainer._work_failed(foursquare.ServerError())
+        maintainer._foursquare_lookup.work_queue.available = time.time()
+        maintainer._node_created({})
+
+        self.assertEqual(maintainer._sleep_cause, FAILURE)
+        self.assertEqual(len(maintainer._scheduler.tasks), 1)
+
+    def test_client_updated(self):
+        maintainer = self._maintainer()
+
+        maintainer._work_failed(ClientNotConfigured())
+        maintainer._client_updated({})
+
+        self.assertEqual(len(maintainer._scheduler.tasks), 2)
+        self.assertEqual(maintainer._scheduler.tasks[-1][1], maintainer.work_to_do_delay)
+
+
+if __name__ == '__main__':
+    unittest.main()
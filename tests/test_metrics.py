@@ -0,0 +1,103 @@
+"""
+Test the metrics registry.
+"""
+
+import unittest
+from foursquare_bot.components.metrics import MetricsRegistry
+from tests.fakes import Promise
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+
+    def test_disabled_records_nothing(self):
+        metrics = MetricsRegistry()
+
+        metrics.increment('requests')
+        metrics.observe('request', 1.0)
+        with metrics.timer('block'):
+            pass
+
+        promise = Promise()
+        self.assertIs(metrics.time_promise('promise', promise), promise)
+        self.assertEqual(promise.handlers, [])
+
+        metrics.gauge('queue_length', lambda: 3)
+
+        self.assertEqual(metrics.snapshot(), dict(counters={}, timers={}, gauges={}))
+        self.assertEqual(metrics.render(), '')
+
+    def test_counters_and_timers(self):
+        clock = Clock()
+        metrics = MetricsRegistry(enabled=True, clock=clock)
+
+        metrics.increment('requests')
+        metrics.increment('requests', 2)
+
+        for value in range(1, 101):
+            metrics.observe('request', value / 1000.0)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters']['requests'], 3)
+        self.assertEqual(snapshot['timers']['request']['count'], 100)
+        self.assertAlmostEqual(snapshot['timers']['request']['max'], 0.1)
+        self.assertAlmostEqual(snapshot['timers']['request']['p50'], 0.051)
+        self.assertAlmostEqual(snapshot['timers']['request']['p99'], 0.1)
+
+    def test_timer_counts_errors(self):
+        clock = Clock()
+        metrics = MetricsRegistry(enabled=True, clock=clock)
+
+        with self.assertRaises(ValueError):
+            with metrics.timer('block'):
+                clock.now += 2.0
+                raise ValueError()
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['timers']['block']['total'], 2.0)
+        self.assertEqual(snapshot['counters']['block_errors'], 1)
+
+    def test_time_promise(self):
+        clock = Clock()
+        metrics = MetricsRegistry(enabled=True, clock=clock)
+
+        resolved = Promise()
+        self.assertIs(metrics.time_promise('storage', resolved), resolved)
+        clock.now += 0.5
+        resolved.resolved('result')
+
+        rejected = metrics.time_promise('storage', Promise())
+        rejected.rejected(RuntimeError())
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['timers']['storage']['count'], 2)
+        self.assertEqual(snapshot['timers']['storage']['max'], 0.5)
+        self.assertEqual(snapshot['counters']['storage_errors'], 1)
+
+    def test_render(self):
+        metrics = MetricsRegistry(enabled=True)
+
+        metrics.increment('venue cache.hits')
+        metrics.gauge('lookup_queue_length', lambda: 7)
+        metrics.observe('foursquare_http', 0.25)
+
+        text = metrics.render()
+
+        self.assertIn('# TYPE foursquare_bot_venue_cache_hits_total counter\n', text)
+        self.assertIn('foursquare_bot_venue_cache_hits_total 1\n', text)
+        self.assertIn('# TYPE foursquare_bot_lookup_queue_length gauge\nfoursquare_bot_lookup_queue_length 7\n', text)
+        self.assertIn('# TYPE foursquare_bot_foursquare_http_seconds summary\n', text)
+        self.assertIn('foursquare_bot_foursquare_http_seconds{quantile="0.99"} 0.250000\n', text)
+        self.assertIn('foursquare_bot_foursquare_http_seconds_count 1\n', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
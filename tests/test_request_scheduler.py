@@ -0,0 +1,61 @@
+"""
+Test the pacing done by the request scheduler.
+"""
+
+import unittest
+from foursquare_bot.components.request_scheduler import RequestScheduler, QuotaExhausted, INTERACTIVE, MAINTENANCE
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RequestSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.scheduler = RequestScheduler(None, hourly_limit=3600, burst=2, interactive_reserve=1, clock=self.clock)
+
+    def test_execute_spends_tokens(self):
+
+        self.assertEqual(self.scheduler.execute(lambda value: value * 2, 2), 4)
+        self.assertEqual(self.scheduler.execute(lambda: 'second'), 'second')
+
+        with self.assertRaises(QuotaExhausted):
+            self.scheduler.execute(lambda: 'third')
+
+        # One token a second is refilled.
+        self.clock.now += 1.0
+        self.assertEqual(self.scheduler.execute(lambda: 'fourth'), 'fourth')
+
+    def test_reserve_is_kept_for_interactive(self):
+
+        self.assertTrue(self.scheduler._take_token(MAINTENANCE))
+        self.assertFalse(self.scheduler._take_token(MAINTENANCE))
+        self.assertTrue(self.scheduler._take_token(INTERACTIVE))
+
+    def test_quota_exhausted_blocks_until_reset(self):
+
+        self.scheduler.update_limits(limit=3600, remaining=0, reset=self.clock.now + 10.0)
+
+        self.clock.now += 5.0
+        self.assertEqual(self.scheduler.tokens, 0.0)
+
+        self.clock.now += 6.0
+        self.assertEqual(self.scheduler.tokens, 1.0)
+
+    def test_wait_time(self):
+
+        self.assertEqual(self.scheduler.wait_time(MAINTENANCE), 0.0)
+
+        self.scheduler._take_token(MAINTENANCE)
+        self.assertEqual(self.scheduler.wait_time(INTERACTIVE), 0.0)
+        self.assertEqual(self.scheduler.wait_time(MAINTENANCE), 1.0)
+
+        self.scheduler.update_limits(remaining=0, reset=self.clock.now + 10.0)
+        self.assertEqual(self.scheduler.wait_time(INTERACTIVE), 10.0)
@@ -0,0 +1,78 @@
+"""
+Test the archive of recorded foursquare responses.
+"""
+
+import json
+import unittest
+import urllib
+from foursquare_bot.components.response_archive import ResponseArchive, request_key
+
+
+def venue_body(venue_id):
+    return json.dumps(dict(meta=dict(code=200), response=dict(venue=dict(id=venue_id))))
+
+
+def multi_url(*sub_requests):
+    return 'https://api.foursquare.com/v2/multi?client_id=a&client_secret=b&v=20150101&%s' % urllib.urlencode(
+        dict(requests=','.join(sub_requests)))
+
+
+class ResponseArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.archive = ResponseArchive(':memory:')
+
+    def tearDown(self):
+        self.archive.close()
+
+    def test_request_key(self):
+        self.assertEqual(request_key('https://api.foursquare.com/v2/venues/search?v=20150101&query=cafe&client_id=a'
+                                     '&client_secret=b&ll=40.7%2C-74.0'),
+                         '/venues/search?ll=40.7%2C-74.0&query=cafe')
+        self.assertEqual(request_key('https://api.foursquare.com/v2/venues/1234?client_id=a&v=20150101'),
+                         '/venues/1234')
+
+        # Sub requests of a multi request have their query quoted as a whole.
+        self.assertEqual(request_key('/venues/search?' + urllib.quote_plus('query=cafe&ll=40.7,-74.0')),
+                         '/venues/search?ll=40.7%2C-74.0&query=cafe')
+
+    def test_record_and_replay(self):
+        url = 'https://api.foursquare.com/v2/venues/1234?client_id=a&client_secret=b&v=20150101'
+        self.archive.record(url, 200, {'x-ratelimit-remaining': '4999', 'content-type': 'application/json'},
+                            venue_body('1234'), 0.25)
+
+        # Responses are replayed for other clients, without the headers that are not needed.
+        status, headers, body, latency = self.archive.replay(
+            'https://api.foursquare.com/v2/venues/1234?client_id=c&client_secret=d&v=20150101')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers, {'x-ratelimit-remaining': '4999'})
+        self.assertEqual(json.loads(body)['response']['venue']['id'], '1234')
+        self.assertEqual(latency, 0.25)
+
+        self.assertIsNone(self.archive.replay('https://api.foursquare.com/v2/venues/5678?client_id=a'))
+
+    def test_rate_limit_errors_are_not_recorded(self):
+        body = json.dumps(dict(meta=dict(code=403, errorType='rate_limit_exceeded')))
+        self.archive.record('https://api.foursquare.com/v2/venues/1234', 403, {}, body, 0.1)
+
+        self.assertEqual(len(self.archive), 0)
+
+    def test_multi_replayed_from_sub_requests(self):
+        responses = [json.loads(venue_body(venue_id)) for venue_id in ('1', '2', '3')]
+        self.archive.record(multi_url('/venues/1', '/venues/2', '/venues/3'), 200, {},
+                            json.dumps(dict(meta=dict(code=200), response=dict(responses=responses))), 0.5)
+
+        # The multi request and each of its sub requests are recorded.
+        self.assertEqual(len(self.archive), 4)
+
+        status, headers, body, latency = self.archive.replay('https://api.foursquare.com/v2/venues/2?client_id=a')
+        self.assertEqual(json.loads(body)['response']['venue']['id'], '2')
+
+        # Venues that are batched differently are assembled from the sub requests.
+        status, headers, body, latency = self.archive.replay(multi_url('/venues/3', '/venues/1'))
+        self.assertEqual(status, 200)
+        venues = [response['response']['venue']['id'] for response in json.loads(body)['response']['responses']]
+        self.assertEqual(venues, ['3', '1'])
+        self.assertEqual(latency, 0.5)
+
+        self.assertIsNone(self.archive.replay(multi_url('/venues/3', '/venues/4')))
@@ -0,0 +1,55 @@
+"""
+Test the coalescing of duplicate lookups.
+"""
+
+import unittest
+from foursquare_bot.components.single_flight import PromiseFlight
+from tests.fakes import Promise, Scheduler
+
+
+class PromiseFlightTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = PromiseFlight(Scheduler())
+        self.calls = []
+
+    def lookup(self, node, create):
+        self.flight.context(node)['create'] = create
+        promise = Promise()
+        self.calls.append(promise)
+        return promise
+
+    def join(self, node, create):
+        flags = self.flight.context(node)
+        if flags is not None and create:
+            flags['create'] = True
+
+        return self.flight.do(node, self.lookup, node, create)
+
+    def test_duplicate_callers_are_attached(self):
+        first = self.join('node', False)
+        second = self.join('node', True)
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.flight.coalesced, 1)
+        self.assertIn('node', self.flight)
+
+        # The call in flight sees the flags of the callers that joined it.
+        self.assertEqual(self.flight.context('node'), dict(create=True))
+
+        self.calls[0].resolved('details')
+        self.assertEqual((first.value, second.value), ('details', 'details'))
+        self.assertIsNone(self.flight.context('node'))
+        self.assertEqual(self.flight.in_flight, 0)
+
+    def test_rejects_all_callers(self):
+        first = self.join('node', False)
+        second = self.join('node', False)
+
+        self.calls[0].rejected(RuntimeError('Lookup failed'))
+        self.assertEqual((first.state, second.state), ('rejected', 'rejected'))
+
+        # The next call for the key starts a new lookup.
+        self.join('node', False)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.flight.context('node'), dict(create=False))
@@ -0,0 +1,46 @@
+"""
+Test the spatial index used to rank the venues near a location.
+"""
+
+import unittest
+from foursquare_bot.components.spatial_index import GridIndex, distance_km, grid_points
+
+
+class GridIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = GridIndex(cell_size=0.1)
+
+        # Two venues in Manhattan, one in Brooklyn and one in Boston.
+        self.index.add(40.7580, -73.9855, 5, 'times_square')
+        self.index.add(40.7484, -73.9857, 10, 'empire_state')
+        self.index.add(40.6782, -73.9442, 20, 'brooklyn')
+        self.index.add(42.3601, -71.0589, 100, 'boston')
+
+    def test_distance(self):
+        self.assertAlmostEqual(distance_km(40.7580, -73.9855, 42.3601, -71.0589), 302, delta=2)
+
+    def test_within_radius_ordered_by_score(self):
+        self.assertEqual(self.index.within(40.7527, -73.9772, 2.0), ['empire_state', 'times_square'])
+        self.assertEqual(self.index.within(40.7527, -73.9772, 15.0), ['brooklyn', 'empire_state', 'times_square'])
+
+    def test_limit(self):
+        self.assertEqual(self.index.within(40.7527, -73.9772, 15.0, limit=1), ['brooklyn'])
+        self.assertEqual(len(self.index), 4)
+
+    def test_remove(self):
+        self.index.remove(40.6782, -73.9442, 'brooklyn')
+        self.index.remove(40.6782, -73.9442, 'missing')
+
+        self.assertEqual(self.index.within(40.7527, -73.9772, 15.0), ['empire_state', 'times_square'])
+        self.assertEqual(len(self.index), 3)
+
+    def test_grid_points(self):
+        points = list(grid_points(40.70, -74.02, 40.80, -73.93, 2.0))
+
+        # The box is about 11km by 7.6km, so there are 6 rows of 4 points.
+        self.assertEqual(len(points), 24)
+        for latitude, longitude in points:
+            self.assertTrue(40.70 < latitude < 40.80 and -74.02 < longitude < -73.93)
+
+        self.assertAlmostEqual(distance_km(points[0][0], points[0][1], points[1][0], points[1][1]), 2.0, places=2)
@@ -0,0 +1,78 @@
+"""
+Test the translation of foursquare venues into storage payloads.
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from rhobot.namespace import WGS_84, SCHEMA
+from rdflib.namespace import RDFS
+from foursquare_bot.components.translator import VenueTranslator, load_category_mapping
+
+
+class Storage(object):
+
+    def __init__(self):
+        self.types = []
+        self.properties = {}
+
+    def add_type(self, rdf_type):
+        self.types.append(str(rdf_type))
+
+    def add_property(self, key, value):
+        self.properties.setdefault(str(key), []).append(value)
+
+
+VENUE = {'id': '4be0b4f0652b0f475f607311',
+         'name': 'Cafe',
+         'location': {'lat': 42.5, 'lng': -71.1, 'address': '1 Main St', 'city': 'Boston', 'postalCode': ''},
+         'contact': {'formattedPhone': '(617) 555-0100'},
+         'categories': [{'id': 'coffee', 'name': 'Coffee Shop'}, {'id': 'other', 'name': 'Restaurant'}]}
+
+
+class VenueTranslatorTestCase(unittest.TestCase):
+
+    def test_translate(self):
+        translator = VenueTranslator({'coffee': ('http://schema.org/CafeOrCoffeeShop', ),
+                                      'restaurant': ('http://schema.org/Restaurant', )})
+
+        storage = translator.translate(VENUE, Storage())
+
+        self.assertEqual(storage.types, [str(WGS_84.SpatialThing), 'http://schema.org/CafeOrCoffeeShop',
+                                         'http://schema.org/Restaurant'])
+        self.assertEqual(storage.properties[str(RDFS.seeAlso)], ['foursquare://venues/4be0b4f0652b0f475f607311'])
+        self.assertEqual(storage.properties[str(SCHEMA.name)], ['Cafe'])
+        self.assertEqual(storage.properties[str(WGS_84.lat)], [42.5])
+        self.assertEqual(storage.properties[str(SCHEMA.streetAddress)], ['1 Main St'])
+        self.assertEqual(storage.properties[str(SCHEMA.telephone)], ['(617) 555-0100'])
+        self.assertNotIn(str(SCHEMA.postalCode), storage.properties)
+        self.assertNotIn(str(SCHEMA.url), storage.properties)
+
+    def test_translate_all(self):
+        translator = VenueTranslator()
+
+        payloads = list(translator.translate_all([VENUE, dict(VENUE, id='second', location={})], Storage))
+
+        self.assertEqual(len(payloads), 2)
+        self.assertEqual(payloads[1].properties[str(RDFS.seeAlso)], ['foursquare://venues/second'])
+        self.assertNotIn(str(WGS_84.lat), payloads[1].properties)
+
+    def test_load_category_mapping(self):
+        mapping = load_category_mapping()
+        self.assertIn('http://schema.org/CafeOrCoffeeShop', mapping['4bf58dd8d48988d1e0931735'])
+
+        descriptor, path = tempfile.mkstemp()
+        with os.fdopen(descriptor, 'w') as mapping_file:
+            json.dump({'Coffee': ['http://schema.org/CafeOrCoffeeShop']}, mapping_file)
+
+        try:
+            self.assertEqual(load_category_mapping(path), {'coffee': ('http://schema.org/CafeOrCoffeeShop', )})
+        finally:
+            os.remove(path)
+
+        self.assertEqual(load_category_mapping(path), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
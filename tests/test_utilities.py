@@ -4,8 +4,10 @@ Test the work of the knowledge provider tool.
 
 import unittest
 from rhobot.components.storage import StoragePayload
-from rhobot.namespace import WGS_84
-from foursquare_bot.components.utilities import get_foursquare_venue
+from rhobot.namespace import WGS_84, SCHEMA
+from foursquare_bot.components.utilities import get_foursquare_venue, get_foursquare_venues, \
+    get_foursquare_venue_from_url, parse_venue_reference, search_key, first_value, storage_digest, \
+    storage_differences
 from rdflib.namespace import RDFS
 
 
@@ -23,3 +25,86 @@ class UtilitiesTestCase(unittest.TestCase):
         result = get_foursquare_venue(storage_payload)
 
         self.assertEqual(result, foursquare_uri.split('/')[-1])
+
+    def test_venue_from_url(self):
+
+        self.assertEqual(get_foursquare_venue_from_url('foursquare://venues/4be0b4f0652b0f475f607311'),
+                         '4be0b4f0652b0f475f607311')
+        self.assertEqual(get_foursquare_venue_from_url('foursquare://venues/4be0b4f0652b0f475f607311/?a=b'),
+                         '4be0b4f0652b0f475f607311')
+        self.assertEqual(get_foursquare_venue_from_url('FOURSQUARE://venues/4be0b4f0652b0f475f607311'),
+                         '4be0b4f0652b0f475f607311')
+        self.assertIsNone(get_foursquare_venue_from_url('foursquare://venues'))
+        self.assertIsNone(get_foursquare_venue_from_url('foursquare://users/1234'))
+        self.assertIsNone(get_foursquare_venue_from_url('http://dbpedia.org/resource/Boston'))
+
+    def test_parse_venue_reference(self):
+
+        self.assertEqual(parse_venue_reference('4be0b4f0652b0f475f607311\n'), '4be0b4f0652b0f475f607311')
+        self.assertEqual(parse_venue_reference('foursquare://venues/4be0b4f0652b0f475f607311'),
+                         '4be0b4f0652b0f475f607311')
+        self.assertEqual(parse_venue_reference('https://foursquare.com/v/some-cafe/4be0b4f0652b0f475f607311'),
+                         '4be0b4f0652b0f475f607311')
+        self.assertEqual(parse_venue_reference('"4be0b4f0652b0f475f607311",Some Cafe,40.7,-73.9'),
+                         '4be0b4f0652b0f475f607311')
+        self.assertIsNone(parse_venue_reference(''))
+        self.assertIsNone(parse_venue_reference('# venues exported from foursquare'))
+        self.assertIsNone(parse_venue_reference('id,name,lat,lng'))
+
+    def test_bulk_venues(self):
+
+        venue_payload = StoragePayload()
+        venue_payload.add_type(WGS_84.SpatialThing)
+        venue_payload.add_property(RDFS.seeAlso, 'http://dbpedia.org/resource/Boston')
+        venue_payload.add_property(RDFS.seeAlso, 'foursquare://venues/4be0b4f0652b0f475f607311')
+
+        other_payload = StoragePayload()
+        other_payload.add_type(WGS_84.SpatialThing)
+
+        self.assertEqual(get_foursquare_venues([venue_payload, other_payload]), ['4be0b4f0652b0f475f607311', None])
+
+    def test_search_key_normalization(self):
+
+        self.assertEqual(search_key('  New  York ', 'Coffee'), search_key('new york', 'coffee '))
+        self.assertNotEqual(search_key('new york', 'coffee'), search_key('new york', 'coffee', limit=20))
+        self.assertEqual(search_key('new york'), search_key('new york', ''))
+
+    def test_first_value(self):
+
+        self.assertEqual(first_value(['40.5', '41.0'], float), 40.5)
+        self.assertEqual(first_value('12', int), 12)
+        self.assertIsNone(first_value([], float))
+        self.assertIsNone(first_value('north', float))
+
+    def test_storage_digest_and_differences(self):
+
+        first = StoragePayload()
+        first.add_property(WGS_84.lat, 42.5)
+        first.add_property(WGS_84.long, -71.1)
+
+        second = StoragePayload()
+        second.add_property(WGS_84.long, '-71.1')
+        second.add_property(WGS_84.lat, '42.5')
+
+        self.assertEqual(storage_digest(first), storage_digest(second))
+        self.assertEqual(storage_differences(first, {str(WGS_84.lat): '42.5', str(WGS_84.long): ['-71.2']}),
+                         [str(WGS_84.long)])
+
+        second.add_property(WGS_84.lat, '42.6')
+        self.assertNotEqual(storage_digest(first), storage_digest(second))
+
+    def test_storage_differences_see_also(self):
+
+        storage_payload = StoragePayload()
+        storage_payload.add_property(SCHEMA.name, 'Venue')
+        storage_payload.add_property(RDFS.seeAlso, 'foursquare://venues/4be0b4f0652b0f475f607311')
+
+        # Links added by other sources and properties that are not in the payload are not differences.
+        properties = {str(SCHEMA.name): ['Venue'],
+                      str(SCHEMA.telephone): ['(617) 555-0100'],
+                      str(RDFS.seeAlso): ['foursquare://venues/4be0b4f0652b0f475f607311',
+                                          'http://dbpedia.org/resource/Venue']}
+        self.assertEqual(storage_differences(storage_payload, properties), [])
+
+        properties[str(RDFS.seeAlso)] = ['http://dbpedia.org/resource/Venue']
+        self.assertEqual(storage_differences(storage_payload, properties), [str(RDFS.seeAlso)])
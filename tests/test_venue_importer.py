@@ -0,0 +1,115 @@
+"""
+Test the streaming of venues through the venue importer.
+"""
+
+import unittest
+from foursquare_bot.components import venue_importer
+from foursquare_bot.components.request_scheduler import MAINTENANCE
+from foursquare_bot.components.utilities import get_foursquare_venue_from_url
+from foursquare_bot.components.venue_importer import VenueImporter
+from tests.fakes import Promise, Scheduler, resolved_promise, rejected_promise
+
+
+class Result(object):
+
+    def __init__(self, about, created):
+        self.about = about
+        self.flags = dict(created=created)
+
+
+class Results(object):
+
+    def __init__(self, *results):
+        self.results = list(results)
+
+
+class Created(object):
+
+    @staticmethod
+    def fetch_from(flags):
+        return flags['created']
+
+
+class FindResults(object):
+    CREATED = Created
+
+
+class StorageClient(object):
+    """
+    Records the find requests, so that the test decides when storage answers them.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def find_nodes(self, payload):
+        promise = Promise()
+        self.requests.append(promise)
+        return promise
+
+
+class Lookup(object):
+
+    def __init__(self):
+        self.lookups = []
+
+    def schedule_lookup(self, node_uri, foursquare_identifier=None, create=False, priority=None):
+        self.lookups.append((node_uri, foursquare_identifier, create, priority))
+        if get_foursquare_venue_from_url(foursquare_identifier) == 'missing':
+            return rejected_promise(RuntimeError('Venue not found'))
+
+        return resolved_promise('details')
+
+
+class VenueImporterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # The created flag of the find results is read through the storage enumerations.
+        self._find_results = venue_importer.FindResults
+        venue_importer.FindResults = FindResults
+
+        self.scheduler = Scheduler()
+        self.storage_client = StorageClient()
+        self.lookup = Lookup()
+        self.importer = VenueImporter(self.scheduler, self.storage_client, self.lookup, concurrency=2)
+
+    def tearDown(self):
+        venue_importer.FindResults = self._find_results
+
+    def test_import_created_venues(self):
+        promise = self.importer.import_venues(['4be0b4f0652b0f475f607311', None, 'existing', 'missing'])
+
+        # The references are only read once the scheduler starts the import.
+        self.assertEqual(self.storage_client.requests, [])
+        self.scheduler.run_deferred()
+        self.assertEqual(len(self.storage_client.requests), 2)
+
+        self.storage_client.requests[0].resolved(Results(Result('node/1', True)))
+        self.storage_client.requests[1].resolved(Results(Result('node/2', False)))
+        self.storage_client.requests[2].resolved(Results(Result('node/3', True)))
+
+        # The lookup is given a reference that it can parse back into the venue.
+        node_uri, reference, create, priority = self.lookup.lookups[0]
+        self.assertEqual((node_uri, create, priority), ('node/1', True, MAINTENANCE))
+        self.assertEqual(get_foursquare_venue_from_url(reference), '4be0b4f0652b0f475f607311')
+        self.assertEqual([lookup[0] for lookup in self.lookup.lookups], ['node/1', 'node/3'])
+
+        self.assertEqual(promise.state, 'resolved')
+        self.assertEqual((promise.value['processed'], promise.value['created'], promise.value['existing'],
+                          promise.value['failed']), (3, 1, 1, 1))
+        self.assertFalse(self.importer.running)
+
+    def test_import_bounded(self):
+        self.importer.import_venues(['venue_%s' % index for index in range(5)])
+        self.scheduler.run_deferred()
+
+        for index in range(5):
+            self.assertEqual(self.importer.progress()['in_flight'], min(2, 5 - index))
+            self.storage_client.requests[index].rejected(RuntimeError('Storage request failed'))
+
+        self.assertEqual(len(self.storage_client.requests), 5)
+        self.assertEqual(self.importer.failed, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
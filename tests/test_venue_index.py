@@ -0,0 +1,63 @@
+"""
+Test the local venue search index.
+"""
+
+import unittest
+from foursquare_bot.components.venue_index import VenueSearchIndex, tokenize
+
+
+def venue(venue_id, name, lat, lng):
+    return dict(id=venue_id, name=name, location=dict(lat=lat, lng=lng))
+
+
+class VenueSearchIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.index = VenueSearchIndex()
+
+        self.index.add(venue('a', 'Joe Coffee', 40.7580, -73.9855))
+        self.index.add(venue('b', 'Coffee Project', 40.7484, -73.9857))
+        self.index.add(venue('c', 'Coffeehouse', 40.7500, -73.9800))
+        self.index.add(venue('d', 'Boston Coffee', 42.3601, -71.0589))
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize(u'Joe\'s Caf\xe9-Bar'), [u'joe', u's', u'caf\xe9', u'bar'])
+
+    def test_prefix_and_location(self):
+        results = [result['id'] for result in self.index.search('coffee', 40.7527, -73.9772, radius=5.0)]
+
+        # Exact matches are ranked before prefix matches, and Boston is outside of the radius.
+        self.assertEqual(set(results[:2]), {'a', 'b'})
+        self.assertEqual(results[2], 'c')
+        self.assertNotIn('d', results)
+
+    def test_all_tokens_must_match(self):
+        results = [result['id'] for result in self.index.search('coffee proj')]
+
+        self.assertEqual(results, ['b'])
+
+    def test_no_query_or_location(self):
+        self.assertEqual(self.index.search(), [])
+        self.assertEqual(len(self.index), 4)
+
+    def test_renamed_venue(self):
+        self.index.add(venue('b', 'Blue Bottle', 40.7484, -73.9857))
+
+        self.assertEqual([result['id'] for result in self.index.search('project')], [])
+        self.assertEqual([result['id'] for result in self.index.search('blue')], ['b'])
+        self.assertEqual(len(self.index), 4)
+
+    def test_moved_venue(self):
+        self.index.add(venue('d', 'Boston Coffee', 40.7590, -73.9845))
+
+        results = [result['id'] for result in self.index.search('boston', 40.7527, -73.9772, radius=5.0)]
+        self.assertEqual(results, ['d'])
+        self.assertEqual(self.index.search('boston', 42.3601, -71.0589, radius=5.0), [])
+
+    def test_remove(self):
+        self.index.remove('b')
+        self.index.remove('missing')
+
+        self.assertEqual(self.index.search('proj'), [])
+        self.assertNotIn('b', self.index)
+        self.assertEqual(len(self.index), 3)
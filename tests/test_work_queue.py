@@ -0,0 +1,146 @@
+"""
+Test the persistent work queue used by the knowledge maintainer.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from foursquare_bot.components.work_queue import WorkQueue
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class WorkQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'work.db')
+        self.queue = WorkQueue(self.path, lease=60.0, retry_delay=10.0, max_retry_delay=25.0, max_attempts=3,
+                               clock=self.clock)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.directory)
+
+    def test_take_and_complete(self):
+        self.queue.put('node/1', created=True)
+        self.clock.now += 1.0
+        self.queue.put('node/2')
+        self.queue.put('node/1')
+
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(self.queue.take(5), [('node/1', True), ('node/2', False)])
+
+        # Leased entries are not delivered again.
+        self.assertEqual(self.queue.take(5), [])
+
+        self.queue.complete('node/1')
+        self.assertEqual(len(self.queue), 1)
+
+    def test_expired_lease_is_delivered_again(self):
+        self.queue.put('node/1')
+        self.assertEqual(self.queue.take(1), [('node/1', False)])
+
+        self.clock.now += 61.0
+        self.assertEqual(self.queue.take(1), [('node/1', False)])
+
+    def test_release(self):
+        self.queue.put('node/1', leased=True)
+        self.assertEqual(self.queue.take(1), [])
+        self.assertEqual(self.queue.next_available(), 1060.0)
+
+        self.queue.release('node/1')
+        self.assertEqual(self.queue.next_available(), 1010.0)
+
+        self.clock.now += 10.0
+        self.assertEqual(self.queue.take(1), [('node/1', False)])
+
+    def test_release_delay_doubles(self):
+        self.queue.put('node/1', leased=True)
+
+        for delay in (10.0, 20.0):
+            self.queue.release('node/1')
+            self.assertEqual(self.queue.next_available(), self.clock.now + delay)
+            self.clock.now += delay
+            self.assertEqual(self.queue.take(1), [('node/1', False)])
+
+        # Lookups that could not be run do not count as failures.
+        self.queue.release('node/1', failed=False)
+        self.assertEqual(self.queue.next_available(), self.clock.now + 20.0)
+
+        self.assertEqual(self.queue.retry_delay_for(3), 25.0)
+
+    def test_parked_after_max_attempts(self):
+        self.queue.put('node/1', leased=True)
+
+        for _ in xrange(3):
+            self.clock.now += 60.0
+            self.queue.take(1)
+            self.queue.release('node/1')
+
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(self.queue.parked(), 1)
+        self.assertIsNone(self.queue.next_available())
+
+        # Parked nodes are not queued again.
+        self.queue.put('node/1')
+        self.clock.now += 60.0
+        self.assertEqual(self.queue.take(1), [])
+
+    def test_park(self):
+        self.queue.put('node/1', leased=True)
+        self.queue.put('node/2')
+
+        self.queue.park('node/1')
+        self.clock.now += 60.0
+        self.assertEqual(self.queue.take(5), [('node/2', False)])
+        self.assertEqual(self.queue.parked(), 1)
+
+    def test_take_longest_available_first(self):
+        self.queue.put('node/1', leased=True)
+        self.clock.now += 1.0
+        self.queue.put('node/2')
+        self.queue.release('node/1', failed=False)
+
+        self.clock.now += 10.0
+        self.assertEqual(self.queue.take(5), [('node/2', False), ('node/1', False)])
+
+    def test_leases_are_recovered_when_opened(self):
+        self.queue.put('node/1')
+        self.queue.put('node/2', leased=True)
+        self.queue.release('node/2')
+        self.queue.take(1)
+        self.queue.close()
+
+        # Only the leased node is recovered, the released node keeps its retry delay.
+        self.queue = WorkQueue(self.path, lease=60.0, retry_delay=10.0, clock=self.clock)
+        self.assertEqual(self.queue.take(5), [('node/1', False)])
+        self.assertEqual(self.queue.next_available(), 1010.0)
+
+    def test_columns_are_added_to_old_databases(self):
+        self.queue.close()
+        os.remove(self.path)
+
+        connection = sqlite3.connect(self.path)
+        connection.execute('CREATE TABLE work (node_uri TEXT PRIMARY KEY, created INTEGER NOT NULL, '
+                           'enqueued REAL NOT NULL, available REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)')
+        connection.execute('INSERT INTO work VALUES (?, ?, ?, ?, ?)', ('node/1', 0, 900.0, 900.0, 0))
+        connection.commit()
+        connection.close()
+
+        self.queue = WorkQueue(self.path, lease=60.0, clock=self.clock)
+        self.assertEqual(self.queue.take(1), [('node/1', False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Test the order that the worker pool executes its jobs in.
+"""
+
+import threading
+import unittest
+from foursquare_bot.components.request_scheduler import INTERACTIVE, MAINTENANCE
+from foursquare_bot.components.worker_pool import WorkerPool, RequestTimeout
+from tests.fakes import Scheduler
+
+
+class WorkerPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.pool = WorkerPool(self.scheduler, size=1, timeout=5.0)
+        self.executed = []
+
+    def job(self, name):
+        self.executed.append(name)
+        return name
+
+    def block(self):
+        """
+        Occupy the worker until the returned event is set.
+        """
+        started = threading.Event()
+        blocked = threading.Event()
+
+        def wait():
+            started.set()
+            blocked.wait(5.0)
+
+        self.pool.submit(MAINTENANCE, wait)
+        started.wait(5.0)
+
+        return blocked
+
+    def test_interactive_jobs_first(self):
+        blocked = self.block()
+
+        for index in range(3):
+            self.pool.submit(MAINTENANCE, self.job, 'maintenance_%s' % index)
+
+        # The interactive job waits behind the running job only, not behind the queued maintenance jobs.
+        promise = self.pool.submit(INTERACTIVE, self.job, 'interactive')
+        blocked.set()
+
+        self.assertEqual(self.pool.call(MAINTENANCE, self.job, 'last'), 'last')
+        self.assertEqual(self.executed, ['interactive', 'maintenance_0', 'maintenance_1', 'maintenance_2', 'last'])
+
+        # Submitted jobs are completed on the scheduler.
+        self.scheduler.run_tasks()
+        self.assertEqual(promise.value, 'interactive')
+
+    def test_call_timeout(self):
+        blocked = self.block()
+
+        self.pool.timeout = 0.01
+        self.assertRaises(RequestTimeout, self.pool.call, INTERACTIVE, self.job, 'interactive')
+        blocked.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
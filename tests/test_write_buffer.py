@@ -0,0 +1,111 @@
+"""
+Test the flushing and publishing of the storage write buffer.
+"""
+
+import unittest
+from foursquare_bot.components.write_buffer import StorageWriteBuffer, WriteBufferFull
+from tests.fakes import Promise, Scheduler
+
+
+class Payload(object):
+
+    def __init__(self, about):
+        self.about = about
+
+
+class Result(object):
+
+    def __init__(self, *results):
+        self.results = list(results)
+
+
+class Storage(object):
+    """
+    Records the updates, so that the test decides when storage answers them.
+    """
+
+    def __init__(self):
+        self.updates = []
+
+    def update_node(self, payload):
+        promise = Promise()
+        self.updates.append((payload.about, promise))
+        return promise
+
+    def answer(self):
+        updates, self.updates = self.updates, []
+        for about, promise in updates:
+            promise.resolved(Result(about))
+
+
+class Publisher(object):
+
+    def __init__(self):
+        self.published = []
+
+    def publish_all_results(self, result, created=False):
+        self.published.append((list(result.results), created))
+
+
+class StorageWriteBufferTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.storage = Storage()
+        self.publisher = Publisher()
+        self.buffer = StorageWriteBuffer(self.scheduler, self.storage, self.publisher, flush_size=2,
+                                         flush_interval=1.0, max_pending=3)
+
+    def test_flushes_when_full(self):
+        first = self.buffer.update_node(Payload('node_a'), created=True)
+        self.assertEqual(self.storage.updates, [])
+
+        self.buffer.update_node(Payload('node_b'))
+        self.assertEqual([about for about, _ in self.storage.updates], ['node_a', 'node_b'])
+
+        self.storage.answer()
+        self.assertEqual(first.value.results, ['node_a'])
+        self.assertEqual(self.publisher.published, [(['node_a'], True), (['node_b'], False)])
+
+    def test_flushes_after_interval(self):
+        self.buffer.update_node(Payload('node_a'))
+        replaced = self.buffer.update_node(Payload('node_a'), created=True)
+
+        self.assertEqual([delay for _, delay in self.scheduler.tasks], [1.0])
+        self.scheduler.run_tasks()
+
+        # The updates of the node were merged into a single write that is published as created.
+        self.assertEqual(len(self.storage.updates), 1)
+        self.storage.answer()
+        self.assertEqual(replaced.state, 'resolved')
+        self.assertEqual(self.publisher.published, [(['node_a'], True)])
+
+    def test_publishes_aggregate_without_changing_results(self):
+        promises = [self.buffer.update_node(Payload(about)) for about in ('node_a', 'node_b')]
+        self.storage.answer()
+
+        self.assertEqual(self.publisher.published, [(['node_a', 'node_b'], False)])
+        self.assertEqual([promise.value.results for promise in promises], [['node_a'], ['node_b']])
+
+    def test_saturation(self):
+        self.buffer.update_node(Payload('node_a'))
+        self.buffer.update_node(Payload('node_b'))
+
+        # A flush is in flight, the next updates wait behind it.
+        self.buffer.update_node(Payload('node_c'))
+        self.assertFalse(self.buffer.saturated)
+        self.buffer.update_node(Payload('node_d'))
+        self.assertTrue(self.buffer.saturated)
+        self.buffer.update_node(Payload('node_e'))
+
+        rejected = self.buffer.update_node(Payload('node_f'))
+        self.assertEqual(rejected.state, 'rejected')
+        self.assertIsInstance(rejected.value, WriteBufferFull)
+        self.assertEqual(self.buffer.rejected, 1)
+
+        # Updates of nodes that are already buffered are still accepted.
+        self.assertIsNone(self.buffer.update_node(Payload('node_c')).state)
+
+        self.storage.answer()
+        self.assertEqual([about for about, _ in self.storage.updates], ['node_d', 'node_e', 'node_c'])
+        self.assertFalse(self.buffer.saturated)